@@ -0,0 +1,33 @@
+"""Add the vcs_snapshot table
+
+Revision ID: 3b6a1c8e5f2d
+Revises: 2eef3c8402d0
+Create Date: 2016-10-03 14:12:45.318672
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3b6a1c8e5f2d'
+down_revision = '2eef3c8402d0'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the vcs_snapshot table storing the pre-computed exports of
+    the VCS ACLs. """
+    op.create_table(
+        'vcs_snapshot',
+        sa.Column('generation', sa.Integer, nullable=False, primary_key=True),
+        sa.Column('log_id', sa.Integer, nullable=False, default=0),
+        sa.Column('text', sa.Text, nullable=False),
+        sa.Column('json', sa.Text, nullable=False),
+        sa.Column('date_created', sa.DateTime, nullable=False),
+        sa.Column('date_updated', sa.DateTime, nullable=False),
+    )
+
+
+def downgrade():
+    """ Drop the vcs_snapshot table. """
+    op.drop_table('vcs_snapshot')
@@ -0,0 +1,46 @@
+"""Add the repo_sync and repo_package_hash tables
+
+Revision ID: 3c5e7a9b1d2f
+Revises: 8a4b2c6d1e3f
+Create Date: 2016-10-24 10:12:48.527301
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c5e7a9b1d2f'
+down_revision = '8a4b2c6d1e3f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the repo_sync and repo_package_hash tables recording the
+    metadata of the repos the information of the packages were last synced
+    with. """
+    op.create_table(
+        'repo_sync',
+        sa.Column('id', sa.Integer, nullable=False, primary_key=True),
+        sa.Column('name', sa.String(50), nullable=False, unique=True),
+        sa.Column('revision', sa.Text, nullable=True),
+        sa.Column('checksum', sa.Text, nullable=False),
+        sa.Column('date_updated', sa.DateTime, nullable=False),
+    )
+    op.create_table(
+        'repo_package_hash',
+        sa.Column(
+            'repo_id',
+            sa.Integer,
+            sa.ForeignKey(
+                'repo_sync.id', ondelete='CASCADE', onupdate='CASCADE'),
+            nullable=False,
+            primary_key=True),
+        sa.Column('name', sa.Text, nullable=False, primary_key=True),
+        sa.Column('hash', sa.String(40), nullable=False),
+    )
+
+
+def downgrade():
+    """ Drop the repo_sync and repo_package_hash tables. """
+    op.drop_table('repo_package_hash')
+    op.drop_table('repo_sync')
@@ -0,0 +1,34 @@
+"""Add the vcs_change table
+
+Revision ID: 4c1f5a9d3e7b
+Revises: 3b6a1c8e5f2d
+Create Date: 2016-10-05 10:41:27.602913
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c1f5a9d3e7b'
+down_revision = '3b6a1c8e5f2d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the vcs_change table, journal of the changes between the
+    generations of the VCS ACLs snapshot. """
+    op.create_table(
+        'vcs_change',
+        sa.Column('id', sa.Integer, nullable=False, primary_key=True),
+        sa.Column('generation', sa.Integer, nullable=False, index=True),
+        sa.Column('namespace', sa.String(50), nullable=False),
+        sa.Column('package', sa.Text, nullable=False),
+        sa.Column('branch', sa.String(32), nullable=False),
+        sa.Column('acls', sa.Text, nullable=True),
+        sa.Column('date_created', sa.DateTime, nullable=False, index=True),
+    )
+
+
+def downgrade():
+    """ Drop the vcs_change table. """
+    op.drop_table('vcs_change')
@@ -0,0 +1,51 @@
+"""Add the change_counter table, stamp the VCS snapshots with it
+
+Revision ID: 4f8b1e6c3a9d
+Revises: 3c5e7a9b1d2f
+Create Date: 2016-10-26 15:41:09.204518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f8b1e6c3a9d'
+down_revision = '3c5e7a9b1d2f'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the change_counter table counting the transactions which
+    committed changes and stamp the snapshots of the VCS ACLs with it
+    instead of the identifier of the last log entry. """
+    change_counter = op.create_table(
+        'change_counter',
+        sa.Column('id', sa.Integer, nullable=False, primary_key=True),
+        sa.Column('value', sa.Integer, nullable=False, default=0),
+        sa.Column('date_updated', sa.DateTime, nullable=False),
+    )
+    # Start at 1 so that the latest snapshot is regenerated after the next
+    # change
+    op.bulk_insert(change_counter, [{
+        'id': 1, 'value': 1, 'date_updated': datetime.datetime.utcnow()}])
+
+    op.alter_column(
+        'vcs_snapshot', 'log_id', new_column_name='change_count')
+    op.execute(
+        'UPDATE vcs_snapshot SET change_count = generation - '
+        '(SELECT MAX(generation) FROM vcs_snapshot)')
+    op.create_unique_constraint(
+        'vcs_snapshot_change_count_key', 'vcs_snapshot', ['change_count'])
+
+
+def downgrade():
+    """ Drop the change_counter table, stamp the snapshots of the VCS ACLs
+    with the identifier of the last log entry again. """
+    op.drop_constraint(
+        'vcs_snapshot_change_count_key', 'vcs_snapshot', type_='unique')
+    op.alter_column(
+        'vcs_snapshot', 'change_count', new_column_name='log_id')
+    op.execute('UPDATE vcs_snapshot SET log_id = 0')
+    op.drop_table('change_counter')
@@ -0,0 +1,31 @@
+"""Index package_listing_acl.packagelisting_id
+
+Revision ID: 5d2e8b4a7c1f
+Revises: 4c1f5a9d3e7b
+Create Date: 2016-10-10 16:05:51.227409
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8b4a7c1f'
+down_revision = '4c1f5a9d3e7b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Add an index on the packagelisting_id of the package_listing_acl
+    table, used to join the ACLs to their package listing. """
+    op.create_index(
+        'ix_package_listing_acl_packagelisting_id',
+        'package_listing_acl',
+        ['packagelisting_id'])
+
+
+def downgrade():
+    """ Drop the index on the packagelisting_id of the package_listing_acl
+    table. """
+    op.drop_index(
+        'ix_package_listing_acl_packagelisting_id',
+        table_name='package_listing_acl')
@@ -0,0 +1,38 @@
+"""Index the package names for the searches
+
+Revision ID: 6e3f9c1b2a4d
+Revises: 5d2e8b4a7c1f
+Create Date: 2016-10-18 10:42:07.516230
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6e3f9c1b2a4d'
+down_revision = '5d2e8b4a7c1f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Add the indexes used to search the packages by name: a trigram
+    index for the LIKE and ILIKE patterns on PostgreSQL and an index on
+    the lower case names for the case insensitive searches. """
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX ix_package_name_trgm ON package '
+            'USING gin (name gin_trgm_ops)')
+        op.execute(
+            'CREATE INDEX ix_package_name_lower ON package '
+            '(lower(name) text_pattern_ops)')
+    else:
+        op.execute(
+            'CREATE INDEX ix_package_name_lower ON package (lower(name))')
+
+
+def downgrade():
+    """ Drop the indexes used to search the packages by name. """
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_package_name_trgm', table_name='package')
+    op.drop_index('ix_package_name_lower', table_name='package')
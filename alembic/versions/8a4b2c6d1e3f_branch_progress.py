@@ -0,0 +1,47 @@
+"""Add the branch_progress table
+
+Revision ID: 8a4b2c6d1e3f
+Revises: 6e3f9c1b2a4d
+Create Date: 2016-10-19 09:21:36.805412
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a4b2c6d1e3f'
+down_revision = '6e3f9c1b2a4d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the branch_progress table recording how far the branching
+    of a collection went. """
+    op.create_table(
+        'branch_progress',
+        sa.Column('id', sa.Integer, nullable=False, primary_key=True),
+        sa.Column(
+            'collection_from_id',
+            sa.Integer,
+            sa.ForeignKey(
+                'collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+            nullable=False),
+        sa.Column(
+            'collection_to_id',
+            sa.Integer,
+            sa.ForeignKey(
+                'collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+            nullable=False),
+        sa.Column('last_package_id', sa.Integer, nullable=False, default=0),
+        sa.Column('listings', sa.Integer, nullable=False, default=0),
+        sa.Column('acls', sa.Integer, nullable=False, default=0),
+        sa.Column('date_created', sa.DateTime, nullable=False),
+        sa.Column('date_updated', sa.DateTime, nullable=False),
+        sa.Column('date_completed', sa.DateTime, nullable=True),
+        sa.UniqueConstraint('collection_from_id', 'collection_to_id'),
+    )
+
+
+def downgrade():
+    """ Drop the branch_progress table. """
+    op.drop_table('branch_progress')
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Benchmark the building of dicts and sets of packages (as done by
+``pkgdblib.notify``), comparing the identity hash of ``model.Package`` and
+dicts keyed by the (namespace, name) of the packages to the former hash,
+building an integer from the code of each character of the name.
+
+Usage::
+
+    python devel/benchmarks/package_hash.py [--packages 50000]
+
+No database is needed, the packages are only instantiated.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+
+from pkgdb2.lib import model
+
+
+NAMESPACES = ['rpms'] * 18 + ['docker', 'modules']
+
+
+def former_hash(self):
+    ''' The former implementation of model.Package.__hash__. '''
+    ord3 = lambda arg: '%.3d' % ord(arg)
+    return int(''.join([ord3(char) for char in self.name]))
+
+
+def build(packages, key=None):
+    ''' Build a dict and a set of the packages, the way pkgdblib.notify
+    does it, adding each package twice.
+    '''
+    if key is not None:
+        packages = [key(package) for package in packages]
+    output = {}
+    for package in packages + packages:
+        if package not in output:
+            output[package] = set()
+        output[package].add('packager')
+    return len(output), len(set(packages + packages))
+
+
+def bench(packages, runs, key=None):
+    ''' Return the best time of the specified number of runs of build and
+    its last output.
+    '''
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        output = build(packages, key=key)
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best, output
+
+
+def main():
+    ''' Instantiate the packages and time the two hash functions. '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--packages', type=int, default=50000,
+        help='Number of packages to generate (default: 50000)')
+    parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of runs of each implementation (default: 3)')
+    args = parser.parse_args()
+
+    packages = []
+    for cnt in range(args.packages):
+        packages.append(model.Package(
+            name='python-package-number-%d' % cnt,
+            namespace=NAMESPACES[cnt % len(NAMESPACES)],
+            summary='Package number %d' % cnt,
+            status='Approved',
+        ))
+
+    new_time, new = bench(packages, args.runs)
+    key_time, key = bench(
+        packages, args.runs, key=lambda pkg: (pkg.namespace, pkg.name))
+
+    # The former hash relied on the default identity based equality
+    model.Package.__hash__ = former_hash
+    try:
+        former_time, former = bench(packages, args.runs)
+    finally:
+        del model.Package.__hash__
+
+    if not former == new == key:
+        print 'The outputs differ!'
+        return 1
+
+    print '%s packages' % args.packages
+    print 'former: %.3fs  identity: %.3fs  speedup: x%.2f' % (
+        former_time, new_time, former_time / new_time)
+    print 'former: %.3fs  (namespace, name): %.3fs  speedup: x%.2f' % (
+        former_time, key_time, former_time / key_time)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
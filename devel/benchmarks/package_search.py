@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Benchmark the search of packages by name with the patterns typically
+sent by the search box of the UI, comparing the conditions built by
+``model._package_name_condition`` to the former ones, LIKE and ILIKE
+conditions the database cannot use an index for.
+
+Usage::
+
+    python devel/benchmarks/package_search.py [--packages 20000] [--db-url URL]
+
+The database is created and filled, use a dedicated one when specifying
+``--db-url``, it defaults to a temporary sqlite database.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+
+import pkgdb2.lib as pkgdblib
+from pkgdb2.lib import model
+
+
+PREFIXES = ['python-', 'perl-', 'rubygem-', 'golang-', 'nodejs-', 'php-',
+            'ghc-', 'R-', 'mingw-', '']
+WORDS = ['django', 'requests', 'guake', 'flask', 'yaml', 'json', 'xml',
+         'http', 'test', 'crypto', 'gtk', 'qt', 'sql', 'image', 'net']
+
+# pattern, case_sensitive
+SEARCHES = [
+    ('gua*', False),
+    ('python-dj*', False),
+    ('Python-Django', False),
+    ('perl-*', True),
+    ('*django*', False),
+]
+
+
+def fill_database(session, packages):
+    ''' Fill the database with the specified number of packages, each of
+    them being branched on the active collection.
+    '''
+    rand = random.Random(42)
+    session.execute(model.Collection.__table__.insert(), [{
+        'id': 1,
+        'name': 'Fedora',
+        'version': 'devel',
+        'status': 'Under Development',
+        'owner': 'admin',
+        'branchname': 'master',
+        'dist_tag': '.master',
+    }])
+
+    names = set()
+    while len(names) < packages:
+        names.add('%s%s-%s%d' % (
+            rand.choice(PREFIXES), rand.choice(WORDS), rand.choice(WORDS),
+            rand.randint(0, packages)))
+
+    pkgs = []
+    listings = []
+    for pkg_id, name in enumerate(sorted(names), 1):
+        pkgs.append({
+            'id': pkg_id,
+            'name': name,
+            'summary': 'Package %s' % name,
+            'status': 'Approved',
+            'namespace': 'rpms',
+            'monitor': 'False',
+        })
+        listings.append({
+            'id': pkg_id,
+            'package_id': pkg_id,
+            'collection_id': 1,
+            'point_of_contact': 'packager',
+            'status': 'Approved',
+            'critpath': False,
+        })
+
+    session.execute(model.Package.__table__.insert(), pkgs)
+    session.execute(model.PackageListing.__table__.insert(), listings)
+    session.commit()
+    # Gather the statistics the query planner relies on to pick the indexes
+    session.execute('ANALYZE')
+    session.commit()
+
+
+def former_package_name_condition(session, pattern, case_sensitive=True):
+    ''' The former conditions of Package.search on the package names. '''
+    Package = model.Package
+    if '%' not in pattern and case_sensitive:
+        return Package.name == pattern
+    elif '%' in pattern and case_sensitive:
+        return Package.name.like(pattern)
+    elif '%' not in pattern and not case_sensitive:
+        return model.sa.func.lower(Package.name) == \
+            model.sa.func.lower(pattern)
+    else:
+        return Package.name.ilike(pattern)
+
+
+def bench(session, pattern, case_sensitive, runs):
+    ''' Return the best time of the specified number of runs of the search
+    of the first page of the packages matching the pattern, as done by the
+    UI, and the names of the packages found.
+    '''
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        packages, count = pkgdblib.search_package(
+            session, namespace='rpms', pkg_name=pattern, page=1, limit=50,
+            case_sensitive=case_sensitive, with_count=True)
+        names = [pkg.name for pkg in packages]
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best, (names, count)
+
+
+def main():
+    ''' Fill the database and time the searches with both conditions. '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--packages', type=int, default=20000,
+        help='Number of packages to generate (default: 20000)')
+    parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of runs of each search (default: 5)')
+    parser.add_argument(
+        '--db-url', default=None,
+        help='URL of the database to fill (default: temporary sqlite)')
+    args = parser.parse_args()
+
+    db_file = None
+    db_url = args.db_url
+    if db_url is None:
+        db_file = tempfile.mktemp(suffix='.sqlite')
+        db_url = 'sqlite:///%s' % db_file
+
+    current = model._package_name_condition
+    try:
+        session = model.create_tables(db_url)
+        fill_database(session, args.packages)
+        print '%s packages' % args.packages
+
+        for pattern, case_sensitive in SEARCHES:
+            model._package_name_condition = former_package_name_condition
+            former_time, former = bench(
+                session, pattern, case_sensitive, args.runs)
+            model._package_name_condition = current
+            new_time, new = bench(
+                session, pattern, case_sensitive, args.runs)
+
+            if (case_sensitive or db_url.startswith('sqlite')) \
+                    and former != new:
+                # SQLite's LIKE is case insensitive, the results of the
+                # case sensitive searches only match on other databases
+                if not case_sensitive:
+                    print 'The outputs differ for %s!' % pattern
+                    return 1
+            elif former != new:
+                print 'The outputs differ for %s!' % pattern
+                return 1
+
+            print '%-16s case sensitive: %-5s  %5s packages  former: ' \
+                '%.4fs  indexed: %.4fs  speedup: x%.1f' % (
+                    pattern, case_sensitive, new[1], former_time, new_time,
+                    former_time / new_time)
+    finally:
+        model._package_name_condition = current
+        if db_file and os.path.exists(db_file):
+            os.unlink(db_file)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
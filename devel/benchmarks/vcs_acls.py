@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Benchmark the generation of the VCS ACLs (as exported by /api/vcs) on a
+generated database, comparing the single aggregated query of
+``model.vcs_acls`` to the former implementation running one query for the
+committers and one for all the branches and computing their difference in
+Python.
+
+Usage::
+
+    python devel/benchmarks/vcs_acls.py [--packages 20000] [--db-url URL]
+
+The database is created and filled, use a dedicated one when specifying
+``--db-url``, it defaults to a temporary sqlite database.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+
+import pkgdb2
+import pkgdb2.lib as pkgdblib
+from pkgdb2.lib import model
+
+
+COLLECTIONS = [
+    # branchname, name, version, status
+    ('master', 'Fedora', 'devel', 'Under Development'),
+    ('f25', 'Fedora', '25', 'Active'),
+    ('f24', 'Fedora', '24', 'Active'),
+    ('f23', 'Fedora', '23', 'EOL'),
+    ('epel7', 'Fedora EPEL', '7', 'Active'),
+    ('el6', 'Fedora EPEL', '6', 'Active'),
+]
+NAMESPACES = ['rpms'] * 18 + ['docker', 'modules']
+USERS = ['packager%d' % cnt for cnt in range(2000)]
+GROUPS = ['group::sig%d' % cnt for cnt in range(40)]
+
+
+def fill_database(session, packages):
+    ''' Fill the database with the specified number of packages, each of
+    them being branched on some of the collections with a few people and
+    groups having commit access.
+    '''
+    rand = random.Random(42)
+    for namespace in set(NAMESPACES) - set(['rpms']):
+        session.add(model.Namespace(namespace))
+    session.flush()
+
+    for cnt, (branch, name, version, status) in enumerate(COLLECTIONS):
+        session.execute(model.Collection.__table__.insert(), [{
+            'id': cnt + 1,
+            'name': name,
+            'version': version,
+            'status': status,
+            'owner': 'admin',
+            'branchname': branch,
+            'dist_tag': '.%s' % branch,
+        }])
+
+    pkgs = []
+    listings = []
+    acls = []
+    for pkg_id in range(1, packages + 1):
+        pkgs.append({
+            'id': pkg_id,
+            'name': 'package%05d' % pkg_id,
+            'summary': 'Package number %d' % pkg_id,
+            'status': 'Approved',
+            'namespace': NAMESPACES[pkg_id % len(NAMESPACES)],
+            'monitor': 'False',
+        })
+        for clt_id in range(1, len(COLLECTIONS) + 1):
+            if clt_id > 1 and rand.random() < 0.3:
+                continue
+            poc = rand.choice(USERS)
+            if rand.random() < 0.05:
+                poc = 'orphan'
+            listing_id = len(listings) + 1
+            listings.append({
+                'id': listing_id,
+                'package_id': pkg_id,
+                'collection_id': clt_id,
+                'point_of_contact': poc,
+                'status': 'Orphaned' if poc == 'orphan' else 'Approved',
+                'critpath': False,
+            })
+            committers = set(rand.sample(USERS, rand.randint(0, 3)))
+            if poc != 'orphan':
+                committers.add(poc)
+            if rand.random() < 0.1:
+                committers.add(rand.choice(GROUPS))
+            for committer in committers:
+                acls.append({
+                    'fas_name': committer,
+                    'packagelisting_id': listing_id,
+                    'acl': 'commit',
+                    'status': 'Approved',
+                })
+                acls.append({
+                    'fas_name': committer,
+                    'packagelisting_id': listing_id,
+                    'acl': 'watchcommits',
+                    'status': 'Approved',
+                })
+
+    session.execute(model.Package.__table__.insert(), pkgs)
+    session.execute(model.PackageListing.__table__.insert(), listings)
+    session.execute(model.PackageListingAcl.__table__.insert(), acls)
+    session.commit()
+    return len(listings), len(acls)
+
+
+def former_vcs_acls(session):
+    ''' The former implementation of model.vcs_acls, with the rows returned
+    for each user.
+    '''
+    Package = model.Package
+    PackageListing = model.PackageListing
+    PackageListingAcl = model.PackageListingAcl
+    Collection = model.Collection
+
+    data = session.query(
+        Package.name,
+        PackageListingAcl.fas_name,
+        Collection.branchname,
+        Package.namespace,
+    ).filter(
+        Package.id == PackageListing.package_id
+    ).filter(
+        PackageListingAcl.packagelisting_id == PackageListing.id
+    ).filter(
+        PackageListing.collection_id == Collection.id
+    ).filter(
+        PackageListing.status.in_(['Approved', 'Orphaned'])
+    ).filter(
+        Collection.status != 'EOL'
+    ).filter(
+        PackageListingAcl.acl == 'commit'
+    ).filter(
+        PackageListingAcl.status == 'Approved'
+    ).group_by(
+        Package.namespace, Package.name, PackageListingAcl.fas_name,
+        Collection.branchname,
+    ).order_by(
+        Package.name
+    ).all()
+    sub = set([(it[0], it[2]) for it in data])
+
+    sub2 = set(session.query(
+        Package.name,
+        Collection.branchname,
+        Package.namespace,
+    ).filter(
+        Package.id == PackageListing.package_id
+    ).filter(
+        PackageListing.collection_id == Collection.id
+    ).filter(
+        PackageListing.status.in_(['Approved', 'Orphaned'])
+    ).filter(
+        Collection.status != 'EOL'
+    ).group_by(
+        Package.namespace,
+        Package.name,
+        Collection.branchname,
+    ).order_by(
+        Package.name,
+        Collection.branchname
+    ).all())
+
+    for entry in sub2 - sub:
+        data.append([entry[0], None, entry[1], entry[2]])
+
+    return data
+
+
+def former_vcs_acls_text(packages, skip_pp):
+    ''' The former processing of the rows into the text export. '''
+    output = {}
+    for pkgname, username, branchname, namespace in packages:
+        user = None
+        group = None
+        if username and username.startswith('group::'):
+            group = username.replace('group::', '@')
+        else:
+            user = username
+
+        groups = ''
+        if pkgname not in skip_pp:
+            groups = '@provenpackager'
+
+        if pkgname in output:
+            if branchname in output[pkgname]:
+                if user:
+                    if output[pkgname][branchname]['user']:
+                        output[pkgname][branchname]['user'] += ','
+                    output[pkgname][branchname]['user'] += user
+                elif group:
+                    if output[pkgname][branchname]['group'].strip():
+                        output[pkgname][branchname]['group'] += ','
+                    output[pkgname][branchname]['group'] += group
+            else:
+                if group and groups:
+                    group = ',' + group
+                output[pkgname][branchname] = {
+                    'name': pkgname,
+                    'user': user or '',
+                    'group': groups + (group or ''),
+                    'branch': branchname,
+                    'namespace': namespace,
+                }
+        else:
+            if group and groups:
+                group = ',' + group
+            output[pkgname] = {
+                branchname: {
+                    'name': pkgname,
+                    'user': user or '',
+                    'group': groups + (group or ''),
+                    'branch': branchname,
+                    'namespace': namespace,
+                }
+            }
+    return output
+
+
+def normalize(lines):
+    ''' Sort the lines of the text export and the users and groups of each
+    line, their order being unspecified in the former implementation.
+    '''
+    output = []
+    for line in lines:
+        avail, acls, path = line.split(' | ')
+        output.append('%s | %s | %s' % (
+            avail, ','.join(sorted(acls.split(','))), path))
+    return sorted(output)
+
+
+def bench(function, runs):
+    ''' Return the best time of the specified number of runs of the
+    function and its last output.
+    '''
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        output = function()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best, output
+
+
+def main():
+    ''' Fill the database and time the two implementations. '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--packages', type=int, default=20000,
+        help='Number of packages to generate (default: 20000)')
+    parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of runs of each implementation (default: 3)')
+    parser.add_argument(
+        '--db-url', default=None,
+        help='URL of the database to fill (default: temporary sqlite)')
+    args = parser.parse_args()
+
+    db_file = None
+    db_url = args.db_url
+    if db_url is None:
+        db_file = tempfile.mktemp(suffix='.sqlite')
+        db_url = 'sqlite:///%s' % db_file
+
+    try:
+        session = model.create_tables(db_url)
+        listings, acls = fill_database(session, args.packages)
+        print '%s packages, %s branches, %s ACLs' % (
+            args.packages, listings, acls)
+
+        skip_pp = pkgdb2.APP.config.get('PKGS_NOT_PROVENPACKAGER', [])
+
+        former_time, former = bench(
+            lambda: pkgdblib.format_vcs_acls(former_vcs_acls_text(
+                former_vcs_acls(session), skip_pp)),
+            args.runs)
+        new_time, new = bench(
+            lambda: pkgdblib.format_vcs_acls(pkgdblib.vcs_acls(
+                session, skip_pp=skip_pp)),
+            args.runs)
+
+        if normalize(former) != normalize(new):
+            print 'The outputs differ!'
+            return 1
+
+        print 'former: %.3fs  aggregated: %.3fs  speedup: x%.2f' % (
+            former_time, new_time, former_time / new_time)
+    finally:
+        if db_file and os.path.exists(db_file):
+            os.unlink(db_file)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -247,6 +247,9 @@ if APP.config.get('PKGDB_OLD_URL', True):
     from .ui import redirects
 APP.register_blueprint(UI)
 
+# Build the index of the names completed by /api/typeahead
+pkgdblib.typeahead.preload(SESSION)
+
 
 # pylint: disable=W0613
 @APP.teardown_request
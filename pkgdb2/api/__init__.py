@@ -23,8 +23,15 @@
 API namespace for the Flask application.
 '''
 
+import hashlib
+
 import flask
 
+from functools import wraps
+
+import pkgdb2
+import pkgdb2.lib as pkgdblib
+
 
 API = flask.Blueprint('api_ns', __name__, url_prefix='/api')
 
@@ -46,6 +53,69 @@ def get_limit():
     return limit
 
 
+def _change_validator():
+    """ Return the version of the data and its date of last modification
+    derived from the number of changes committed.
+    """
+    count, date_updated = pkgdblib.get_last_change(pkgdb2.SESSION)
+    return ('changes:%s' % count, date_updated)
+
+
+def conditional_get(function=None, validator=None):
+    """ Flask decorator adding an ETag and a Last-Modified header to the
+    responses of the endpoint, derived from the last change committed, and
+    answering the conditional requests with a 304 Not Modified without
+    calling the endpoint if nothing was committed since.
+
+    :kwarg validator: a function returning the version of the data the
+        endpoint is about to return and the datetime it was last modified
+        at, or None to use the last change committed.
+
+    """
+    if function is None:
+        return lambda function: conditional_get(function, validator)
+
+    @wraps(function)
+    def decorated_function(*args, **kwargs):
+        """ Do the actual work of the decorator. """
+        version = validator() if validator else None
+        if version is None:
+            version = _change_validator()
+        version, last_modified = version
+        if last_modified is not None:
+            last_modified = last_modified.replace(microsecond=0)
+
+        etag = hashlib.sha1('|'.join([
+            __version__,
+            flask.request.path,
+            flask.request.query_string,
+            flask.request.headers.get('Accept', ''),
+            version,
+            str(last_modified),
+        ])).hexdigest()
+
+        request = flask.request
+        if request.if_none_match:
+            not_modified = etag in request.if_none_match
+        else:
+            not_modified = last_modified is not None \
+                and request.if_modified_since is not None \
+                and last_modified <= request.if_modified_since
+
+        if not_modified:
+            response = flask.Response(status=304)
+        else:
+            response = flask.make_response(function(*args, **kwargs))
+
+        # The errors are not to be cached
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            response.last_modified = last_modified
+        response.vary.add('Accept')
+        return response
+    return decorated_function
+
+
 from pkgdb2.api import admin
 from pkgdb2.api import acls
 from pkgdb2.api import collections
@@ -93,6 +163,7 @@ def api():
     api_packager_package = load_doc(packagers.api_packager_package)
     api_packager_list = load_doc(packagers.api_packager_list)
     api_packager_stats = load_doc(packagers.api_packager_stats)
+    api_packager_permissions = load_doc(packagers.api_packager_permissions)
 
     api_package_info = load_doc(packages.api_package_info)
     api_package_new = load_doc(packages.api_package_new)
@@ -126,6 +197,8 @@ def api():
     api_extras_koschei = load_doc(extras.api_koschei)
     api_extras_retired = load_doc(extras.api_retired)
     api_extras_pkgrequest = load_doc(extras.api_pkgrequest)
+    api_extras_typeahead = load_doc(extras.api_typeahead)
+    api_extras_queues = load_doc(extras.api_queues)
 
     return flask.render_template(
         'api.html',
@@ -136,7 +209,7 @@ def api():
         ],
         packagers=[
             api_packager_list, api_packager_acl, api_packager_package,
-            api_packager_stats
+            api_packager_stats, api_packager_permissions
         ],
         packages=[
             api_package_info, api_package_list,
@@ -161,7 +234,8 @@ def api():
             api_extras_vcs, api_extras_pendingacls,
             api_extras_api_groups, api_extras_monitored,
             api_extras_koschei, api_extras_retired,
-            api_extras_pkgrequest,
+            api_extras_pkgrequest, api_extras_typeahead,
+            api_extras_queues,
         ]
     )
 
@@ -58,6 +58,11 @@ List admin actions
     :kwarg limit: An integer to limit the number of results, defaults to
         250, maximum is 500.
     :kwarg page: The page number to return (useful in combination to limit).
+    :kwarg cursor: The ``next_cursor`` returned with the previous page, to
+        retrieve the following one instead of using ``page``. Pass an empty
+        cursor to get the first page. The ``page_total`` key is then
+        omitted and the output contains a ``next_cursor`` key, which is
+        null on the last page.
 
     Sample response:
 
@@ -121,6 +126,7 @@ List admin actions
     action = flask.request.args.get('action', None)
     status = flask.request.args.get('status', None)
     page = flask.request.args.get('page', 1)
+    cursor = flask.request.args.get('cursor', None)
     limit = get_limit()
 
     httpcode = 200
@@ -141,38 +147,47 @@ List admin actions
             action=action,
             status=status,
             limit=limit,
-            page=page
+            page=page,
+            cursor=cursor,
         )
 
-        cnt_actions += pkgdblib.search_actions(
-            SESSION,
-            package=package or None,
-            packager=packager or None,
-            action=action,
-            status=status,
-            count=True,
-        )
-    except PkgdbException as err:  # pragma: no cover
+        if cursor is None:
+            cnt_actions += pkgdblib.search_actions(
+                SESSION,
+                package=package or None,
+                packager=packager or None,
+                action=action,
+                status=status,
+                count=True,
+            )
+
+        if not actions and cursor is None:
+            output['output'] = 'notok'
+            output['actions'] = []
+            output['error'] = 'No actions found for these parameters'
+            httpcode = 404
+        else:
+            output['actions'] = [
+                act.to_json()
+                for act in actions
+            ]
+            output['output'] = 'ok'
+            output['page'] = int(page)
+            if cursor is None:
+                output['page_total'] = int(
+                    ceil(cnt_actions / float(limit)))
+            else:
+                output['next_cursor'] = None
+                if len(actions) == limit:
+                    output['next_cursor'] = pkgdblib.encode_cursor(
+                        actions[-1].date_created, actions[-1].id)
+    except PkgdbException as err:
         SESSION.rollback()
         output['output'] = 'notok'
         output['error'] = str(err)
         httpcode = 500
 
-    if not actions:
-        output['output'] = 'notok'
-        output['actions'] = []
-        output['error'] = 'No actions found for these parameters'
-        httpcode = 404
-    else:
-        output['actions'] = [
-            act.to_json()
-            for act in actions
-        ]
-        output['output'] = 'ok'
-        output['page'] = int(page)
-        output['page_total'] = int(ceil(cnt_actions / float(limit)))
-
-    if 'page_total' not in output:
+    if 'page' not in output:
         output['page'] = 1
         output['page_total'] = 1
 
@@ -23,13 +23,18 @@
 Extras API endpoints for the Flask application.
 '''
 
+import datetime
+import json
+
 import flask
 import requests
 
 import pkgdb2.lib as pkgdblib
+import pkgdb2.lib.notifications
 import pkgdb2.lib.utils
 from pkgdb2 import SESSION, APP
-from pkgdb2.api import API
+from pkgdb2.api import API, conditional_get
+from pkgdb2.lib.exceptions import PkgdbException
 
 
 def request_wants_json():
@@ -41,7 +46,81 @@ def request_wants_json():
         flask.request.accept_mimetypes['text/html']
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
+def _stream_text(lines, intro=''):
+    '''Return a text response sending the provided lines by chunks as they
+    are generated rather than all at once.
+
+    :arg lines: an iterator of the lines of the response.
+    :kwarg intro: the text to send before the lines.
+
+    '''
+    def generate():
+        ''' Yield the text of the response by chunks of lines. '''
+        yield intro
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= 1000:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
+
+    return flask.Response(
+        flask.stream_with_context(generate()),
+        content_type="text/plain;charset=UTF-8"
+    )
+
+
+def _join_lines(lines):
+    '''Yield the provided lines separated by new line characters, as
+    ``"\\n".join(lines)`` would.
+
+    :arg lines: an iterator of the lines to join.
+
+    '''
+    first = True
+    for line in lines:
+        if not first:
+            yield '\n'
+        first = False
+        yield line
+
+
+def _stream_notify(name, version, eol, acls, namespace):
+    '''Return the response streaming the text list of the users that
+    should be notified of changes to each package.
+
+    :arg name: Set to a collection name to filter the results for that
+    :arg version: Set to a collection version to further filter results
+        for a single version
+    :arg eol: Set to True if you want to include end of life
+        distributions
+    :arg acls: The ACLs of the users to notify.
+    :arg namespace: A boolean specify wether to include the namespaces or
+        not.
+
+    '''
+    def lines():
+        ''' Yield the line of each package. '''
+        packages = pkgdblib.stream_notify(
+            session=SESSION,
+            eol=eol,
+            name=name,
+            version=version,
+            acls=acls)
+        for package, users in packages:
+            if namespace:
+                yield '%s|%s|%s\n' % (
+                    package.namespace, package.name, ','.join(users))
+            else:
+                yield '%s|%s\n' % (package.name, ','.join(users))
+
+    return _stream_text(lines())
+
+
+@pkgdb2.CACHE.cache_on_arguments(
+    expiration_time=3600,
+    function_key_generator=pkgdb2.lib.utils.exports_key_generator)
 def _bz_acls_cached(name=None, out_format='text'):
     '''Return the package attributes used by bugzilla.
 
@@ -75,16 +154,16 @@ def _bz_acls_cached(name=None, out_format='text'):
         output = {'bugzillaAcls': {},
                   'title': 'Fedora Package Database -- Bugzilla ACLs'}
 
-    for clt in sorted(packages):
-        for pkg in sorted(packages[clt]):
+    for clt in packages:
+        for pkg in packages[clt]:
             if out_format == 'json':
                 user = []
                 group = []
-                for ppl in packages[clt][pkg]['cc'].split(','):
+                for ppl in packages[clt][pkg]['cc']:
                     if ppl.startswith('group::'):
                         group.append(ppl.replace('group::', '@').encode(
                             'UTF-8'))
-                    elif ppl:
+                    else:
                         user.append(ppl.encode('UTF-8'))
                 poc = packages[clt][pkg]['poc']
                 if poc.startswith('group::'):
@@ -103,14 +182,25 @@ def _bz_acls_cached(name=None, out_format='text'):
                     'summary': packages[clt][pkg]['summary'].encode('UTF-8')
                 }
             else:
-                output.append(
-                    '%(collection)s|%(name)s|%(summary)s|%(poc)s|%(qa)s'
-                    '|%(cc)s' % (packages[clt][pkg])
-                )
+                output.append(_bz_line(packages[clt][pkg]))
     return output
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
+def _bz_line(package):
+    '''Return the line of the text output of bugzilla for the package.
+
+    :arg package: the dict describing the package of a collection, as
+        returned by `pkgdblib.bugzilla`.
+
+    '''
+    return '%s|%s|%s|%s|%s|%s' % (
+        package['collection'], package['name'], package['summary'],
+        package['poc'], package['qa'], ','.join(package['cc']))
+
+
+@pkgdb2.CACHE.cache_on_arguments(
+    expiration_time=3600,
+    function_key_generator=pkgdb2.lib.utils.exports_key_generator)
 def _bz_notify_cache(
         name=None, version=None, eol=False, out_format='text', acls=None,
         namespace=False):
@@ -141,25 +231,29 @@ def _bz_notify_cache(
                   'name': name,
                   'version': version,
                   'title': 'Fedora Package Database -- Notification List'}
-    for package in sorted(packages, key=lambda pkg: pkg.name):
+    for package in packages:
         if out_format == 'json':
             if namespace:
                 if package.namespace not in output['packages']:
                     output['packages'][package.namespace] = {}
                 output['packages'][package.namespace][
-                    package.name] = packages[package].split(',')
+                    package.name] = packages[package]
             else:
-                output['packages'][package.name] = packages[package].split(',')
+                output['packages'][package.name] = packages[package]
         else:
             if namespace:
                 output.append('%s|%s|%s\n' % (
-                    package.namespace, package.name, packages[package]))
+                    package.namespace, package.name,
+                    ','.join(packages[package])))
             else:
-                output.append('%s|%s\n' % (package.name, packages[package]))
+                output.append('%s|%s\n' % (
+                    package.name, ','.join(packages[package])))
     return output
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
+@pkgdb2.CACHE.cache_on_arguments(
+    expiration_time=3600,
+    function_key_generator=pkgdb2.lib.utils.exports_key_generator)
 def _vcs_acls_cache(out_format='text', eol=False, collection=None,
                     namespace=None):
     '''Return ACLs for the version control system.
@@ -178,20 +272,7 @@ def _vcs_acls_cache(out_format='text', eol=False, collection=None,
         oformat=out_format,
         skip_pp=APP.config.get('PKGS_NOT_PROVENPACKAGER', None),
         namespace=namespace)
-    output = []
-    if out_format == 'json':
-        output = packages
-        output['title'] = 'Fedora Package Database -- VCS ACLs'
-    else:
-        for package in sorted(packages):
-            for branch in sorted(packages[package]):
-                if packages[package][branch]['group']:
-                    packages[package][branch]['group'] += ','
-                output.append(
-                    'avail | %(group)s%(user)s | '
-                    '%(namespace)s/%(name)s/%(branch)s'
-                    % (packages[package][branch]))
-    return output
+    return pkgdblib.format_vcs_acls(packages, out_format)
 
 
 @API.route('/bugzilla/')
@@ -208,6 +289,8 @@ Bugzilla information
 
     :karg collection: Name of the bugzilla collection to gather data on.
     :kwarg format: Specify if the output if text or json.
+    :kwarg stream: Send the text output as it is generated instead of all
+        at once.
 
     Note: The data returned by this function is for the way the current
     Fedora bugzilla is setup as of (2007/6/25).  In the future, bugzilla
@@ -243,6 +326,19 @@ Bugzilla information
 
 """
 
+    if out_format == 'text' and flask.request.args.get('stream'):
+        def lines():
+            ''' Yield the line of each package of each collection. '''
+            packages = pkgdblib.stream_bugzilla(
+                session=SESSION,
+                name=name,
+                default_namespace=APP.config.get('DEFAULT_NAMESPACE', 'rpms'),
+            )
+            for package in packages:
+                yield _bz_line(package)
+
+        return _stream_text(_join_lines(lines()), intro=intro)
+
     acls = _bz_acls_cached(name, out_format)
 
     if out_format == 'json':
@@ -277,6 +373,8 @@ def api_notify():
     :kwarg format: Specify if the output if text or json.
     :kwarg namespace: Specify if the namespace should be included in the
         output (defaults to False).
+    :kwarg stream: Send the text output as it is generated instead of all
+        at once.
     '''
 
     name = flask.request.args.get('name', None)
@@ -290,6 +388,12 @@ def api_notify():
     if request_wants_json():
         out_format = 'json'
 
+    if out_format == 'text' and flask.request.args.get('stream'):
+        return _stream_notify(
+            name, version, eol,
+            acls=['commit', 'approveacls', 'watchcommits'],
+            namespace=namespace)
+
     output = _bz_notify_cache(
         name, version, eol, out_format,
         acls=['commit', 'approveacls', 'watchcommits'],
@@ -327,6 +431,8 @@ def api_notify_all():
     :kwarg eol: Set to True if you want to include end of life
         distributions
     :kwarg format: Specify if the output if text or json.
+    :kwarg stream: Send the text output as it is generated instead of all
+        at once.
     '''
 
     name = flask.request.args.get('name', None)
@@ -339,6 +445,9 @@ def api_notify_all():
     if request_wants_json():
         out_format = 'json'
 
+    if out_format == 'text' and flask.request.args.get('stream'):
+        return _stream_notify(name, version, eol, acls='all', namespace=False)
+
     output = _bz_notify_cache(name, version, eol, out_format, acls='all')
 
     if out_format == 'json':
@@ -350,8 +459,40 @@ def api_notify_all():
         )
 
 
+def _vcs_from_snapshot():
+    ''' Return whether the request to `api_vcs` is answered from the
+    snapshot of the VCS ACLs.
+    '''
+    args = flask.request.args
+    if args.get('since') or args.get('since_date'):
+        return True
+
+    if args.get('stream') and not request_wants_json() \
+            and args.get('format', 'text') != 'json':
+        return False
+
+    return APP.config.get('PKGDB2_VCS_SNAPSHOT', True) \
+        and not args.get('eol') \
+        and not args.get('collection') \
+        and not args.get('namespace')
+
+
+def _vcs_validator():
+    ''' Return the version of the VCS ACLs returned by `api_vcs`: the
+    generation of the snapshot when it is served from it, even if changes
+    were committed since, or None to use the last change committed.
+    '''
+    if not _vcs_from_snapshot():
+        return None
+    snapshot = pkgdblib.get_vcs_snapshot(SESSION)
+    if snapshot is None:
+        return None
+    return ('vcs:%s' % snapshot.generation, snapshot.date_created)
+
+
 @API.route('/vcs/')
 @API.route('/vcs')
+@conditional_get(validator=_vcs_validator)
 def api_vcs():
     '''
     Version Control System ACLs
@@ -367,6 +508,15 @@ def api_vcs():
         End Of Life collections or not. Defaults to ``False``.
     :kwarg collection: Restrict the VCS info to a specific collection.
     :kwarg namespace: Restrict the VCS info to a specific namespace.
+    :kwarg since: Only return the branches whose ACLs changed since this
+        generation of the VCS ACLs, as returned in the
+        ``X-Pkgdb-Generation`` header. Removed branches are returned as
+        ``unavail`` in text and ``null`` in json. If the changes are not
+        known since then, every branch is returned and ``full`` is set.
+    :kwarg since_date: Only return the branches whose ACLs changed since
+        this date, given as a timestamp.
+    :kwarg stream: Send the text output as it is generated instead of all
+        at once.
 
     '''
     intro = """# VCS ACLs
@@ -378,6 +528,8 @@ def api_vcs():
     eol = flask.request.args.get('eol', False)
     collection = flask.request.args.get('collection')
     namespace = flask.request.args.get('namespace')
+    since = flask.request.args.get('since')
+    since_date = flask.request.args.get('since_date')
 
     if out_format not in ('text', 'json'):
         out_format = 'text'
@@ -385,6 +537,40 @@ def api_vcs():
     if request_wants_json():
         out_format = 'json'
 
+    if since or since_date:
+        return _vcs_changes(
+            out_format, since, since_date, eol, collection, namespace)
+
+    if out_format == 'text' and flask.request.args.get('stream'):
+        lines = pkgdblib.stream_vcs_acls(
+            session=SESSION,
+            eol=eol,
+            collection=collection,
+            skip_pp=APP.config.get('PKGS_NOT_PROVENPACKAGER', None),
+            namespace=namespace)
+        return _stream_text(_join_lines(lines), intro=intro)
+
+    snapshot = None
+    if _vcs_from_snapshot():
+        # Until the first snapshot is generated, the ACLs are computed
+        snapshot = pkgdblib.get_vcs_snapshot(SESSION)
+
+    if snapshot is not None:
+        if out_format == 'json':
+            if flask.request.args.get('callback'):
+                # Let jsonify wrap the data for JSONP
+                output = flask.jsonify(json.loads(snapshot.json))
+            else:
+                output = flask.Response(
+                    snapshot.json, content_type='application/json')
+        else:
+            output = flask.Response(
+                intro + snapshot.text,
+                content_type="text/plain;charset=UTF-8"
+            )
+        output.headers['X-Pkgdb-Generation'] = str(snapshot.generation)
+        return output
+
     acls = _vcs_acls_cache(
         out_format, eol=eol, collection=collection, namespace=namespace)
 
@@ -397,8 +583,85 @@ def api_vcs():
         )
 
 
+def _vcs_changes(out_format, since, since_date, eol, collection, namespace):
+    '''Return the response listing the VCS ACLs changed since the
+    specified generation or date.
+
+    :arg out_format: Specify if the output if text or json.
+    :arg since: The generation of the VCS ACLs known by the client.
+    :arg since_date: The timestamp from which the changes are returned.
+    :arg eol: Whether End Of Life collections were asked for.
+    :arg collection: The collection the VCS info were restricted to.
+    :arg namespace: Restrict the changes to a specific namespace.
+
+    '''
+    error = None
+    try:
+        if since:
+            since = int(since)
+        if since_date:
+            since_date = datetime.datetime.utcfromtimestamp(
+                float(since_date))
+    except ValueError:
+        error = 'Invalid since or since_date argument'
+
+    if eol or collection:
+        error = 'The changes are only available for the active '\
+            'collections'
+
+    if error:
+        jsonout = flask.jsonify({'output': 'notok', 'error': error})
+        jsonout.status_code = 400
+        return jsonout
+
+    try:
+        changes = pkgdblib.get_vcs_changes(
+            SESSION,
+            since=since or None,
+            since_date=since_date or None,
+            namespace=namespace)
+    except PkgdbException as err:
+        jsonout = flask.jsonify({'output': 'notok', 'error': str(err)})
+        jsonout.status_code = 503
+        return jsonout
+
+    if out_format == 'json':
+        changes['title'] = 'Fedora Package Database -- VCS ACLs changes'
+        output = flask.jsonify(changes)
+    else:
+        lines = [
+            '# VCS ACLs changes',
+            '# avail|@groups,users|namespace/Package/branch',
+            '# unavail||namespace/Package/branch',
+            '# generation: %s' % changes['generation'],
+            '# since: %s' % changes['since'],
+            '# full: %s' % changes['full'],
+            '',
+        ]
+        for ns in sorted(changes['changes']):
+            for pkgname in sorted(changes['changes'][ns]):
+                branches = changes['changes'][ns][pkgname]
+                for branch in sorted(branches):
+                    path = '%s/%s/%s' % (ns, pkgname, branch)
+                    if branches[branch] is None:
+                        lines.append('unavail | | %s' % path)
+                        continue
+                    acls = branches[branch]['commit']
+                    groups = ''.join(
+                        '@%s,' % group for group in acls['groups'])
+                    lines.append('avail | %s%s | %s' % (
+                        groups, ','.join(acls['people']), path))
+        output = flask.Response(
+            '\n'.join(lines),
+            content_type="text/plain;charset=UTF-8"
+        )
+    output.headers['X-Pkgdb-Generation'] = str(changes['generation'])
+    return output
+
+
 @API.route('/critpath/')
 @API.route('/critpath')
+@conditional_get
 def api_critpath():
     '''
     Critical path packages
@@ -517,6 +780,7 @@ def api_pendingacls():
 
 @API.route('/groups/')
 @API.route('/groups')
+@conditional_get
 def api_groups():
     '''
     List group maintainer
@@ -560,6 +824,7 @@ def api_groups():
 
 @API.route('/monitored/')
 @API.route('/monitored')
+@conditional_get
 def api_monitored():
     '''
     List packages monitored
@@ -604,6 +869,7 @@ def api_monitored():
 
 @API.route('/koschei/')
 @API.route('/koschei')
+@conditional_get
 def api_koschei():
     '''
     List packages monitored by koschei
@@ -677,6 +943,7 @@ def api_dead_package(pkg_name, clt_name, namespace=None):
 
 @API.route('/retired/')
 @API.route('/retired')
+@conditional_get
 def api_retired():
     '''
     List packages retired
@@ -726,6 +993,164 @@ def api_retired():
         )
 
 
+@API.route('/queues/')
+@API.route('/queues')
+def api_queues():
+    '''
+    Notification queues
+    -------------------
+    Return the state of the queues of the notifications sent in the
+    background by this process: the number of messages waiting in the
+    queue and the number of messages sent, failed or dropped (because the
+    queue was full) so far.
+
+    For the emails, ``retried`` is the number of attempts made again after
+    a temporary failure of the SMTP server and ``connections`` the number
+    of connections opened to it, the connection being reused until it
+    stays idle.
+
+    ::
+
+        /api/queues
+
+    Sample response:
+
+    ::
+
+        /api/queues
+
+        {
+          "output": "ok",
+          "fedmsg": {
+            "batches": 12,
+            "dropped": 0,
+            "failed": 0,
+            "published": 57,
+            "queued": 3,
+            "running": true
+          },
+          "email": {
+            "batches": 4,
+            "connections": 1,
+            "dropped": 0,
+            "failed": 0,
+            "queued": 0,
+            "retried": 1,
+            "running": true,
+            "sent": 9
+          }
+        }
+
+    '''
+    output = {
+        'output': 'ok',
+        'fedmsg': pkgdb2.lib.notifications.fedmsg_queue_stats(),
+        'email': pkgdb2.lib.notifications.email_queue_stats(),
+    }
+    return flask.jsonify(output)
+
+
+@API.route('/typeahead/')
+@API.route('/typeahead')
+def api_typeahead():
+    '''
+    Complete package or packager names
+    ----------------------------------
+    Return the packages or packagers whose name starts with the given term,
+    to offer completions while it is being typed. The names are looked up
+    in an index kept in memory, it is refreshed as changes are made and
+    rebuilt from the database regularly.
+
+    ::
+
+        /api/typeahead/?term=<beginning of the name>
+
+    Accepts GET queries only.
+
+    :arg term: The beginning of the names to return, independently of its
+        case.
+    :kwarg type: The kind of names to complete, either ``packages``
+        (default) or ``packager``.
+    :kwarg namespace: The namespace to restrict the packages to.
+    :kwarg limit: The maximum number of names to return, defaults to 10,
+        maximum is 100.
+    :kwarg format: ``json`` (default) or ``opensearch`` to return the
+        completions in the format of the OpenSearch suggestions.
+
+    Sample response:
+
+    ::
+
+        /api/typeahead/?term=gua
+
+        {
+          "output": "ok",
+          "packages": [
+            {
+              "name": "guake",
+              "namespace": "rpms"
+            }
+          ]
+        }
+
+        /api/typeahead/?term=pin&type=packager&format=opensearch
+
+        [
+          "pin",
+          [
+            "pingou"
+          ]
+        ]
+
+    '''
+    httpcode = 200
+    output = {}
+
+    term = flask.request.args.get('term', '')
+    kind = flask.request.args.get('type', 'packages') or 'packages'
+    namespace = flask.request.args.get('namespace', None) or None
+    limit = flask.request.args.get('limit', 10)
+    out_format = flask.request.args.get('format', 'json')
+
+    if kind == 'packager':
+        kind = 'packagers'
+
+    try:
+        limit = min(abs(int(limit)), 100)
+    except ValueError:
+        limit = 10
+
+    try:
+        names = pkgdblib.complete_names(
+            SESSION, term, kind=kind, namespace=namespace, limit=limit)
+        SESSION.commit()
+        if kind == 'packages':
+            output[kind] = [
+                {'namespace': pkg_ns, 'name': pkg_name}
+                for pkg_ns, pkg_name in names
+            ]
+        else:
+            output[kind] = names
+        output['output'] = 'ok'
+    except PkgdbException as err:
+        SESSION.rollback()
+        output['output'] = 'notok'
+        output['error'] = str(err)
+        httpcode = 500
+
+    if out_format == 'opensearch' and httpcode == 200:
+        if kind == 'packages':
+            names = [pkg_name for _, pkg_name in names]
+        return flask.Response(
+            json.dumps([term, names]),
+            content_type='application/x-suggestions+json'
+        )
+
+    jsonout = flask.jsonify(output)
+    jsonout.status_code = httpcode
+    return jsonout
+
+
 @API.route('/pkgrequest/<bzid>/')
 @API.route('/pkgrequest/<bzid>')
 def api_pkgrequest(bzid):
@@ -33,6 +33,7 @@ from math import ceil
 import pkgdb2.lib as pkgdblib
 from pkgdb2 import SESSION
 from pkgdb2.api import API, get_limit
+from pkgdb2.lib.exceptions import PkgdbException
 
 
 ## Some of the object we use here have inherited methods which apparently
@@ -378,6 +379,131 @@ def api_packager_package(packagername=None):
     return jsonout
 
 
+@API.route('/packager/permissions/', methods=['GET', 'POST'])
+@API.route('/packager/permissions', methods=['GET', 'POST'])
+@API.route('/packager/permissions/<packagername>/', methods=['GET', 'POST'])
+@API.route('/packager/permissions/<packagername>', methods=['GET', 'POST'])
+def api_packager_permissions(packagername=None):
+    '''
+    User's permissions
+    ------------------
+    Check which ACLs the user has on a list of packages, and optionally
+    branches, at once.
+
+    ::
+
+        /api/packager/permissions/<fas_username>/?packages=<package>
+
+        /api/packager/permissions/?packagername=<username>&packages=<package>
+
+    Accepts GET and POST queries, POST allowing to check long lists of
+    packages.
+
+    :arg packagername: String of the packager name.
+    :arg packages: One or more packages to check, as ``<name>``,
+        ``<namespace>/<name>`` or ``<namespace>/<name>/<branch>``. The
+        namespace defaults to ``rpms``. Without branch, having the ACL on
+        one of the branches of the package is enough.
+    :kwarg acls: One or more ACL to check. Options are: ``approveacls``,
+        ``commit``, ``watchbugzilla``, ``watchcommits``. Defaults to all
+        of them.
+
+    Sample response:
+
+    ::
+
+        /api/packager/permissions/pingou/?packages=guake&acls=commit
+            &acls=approveacls&packages=rpms/geany/f18
+
+        {
+          "output": "ok",
+          "packager": "pingou",
+          "acls": ["commit", "approveacls"],
+          "packages": [
+            {
+              "namespace": "rpms",
+              "name": "guake",
+              "branch": null,
+              "acls": {
+                "approveacls": true,
+                "commit": true
+              }
+            },
+            {
+              "namespace": "rpms",
+              "name": "geany",
+              "branch": "f18",
+              "acls": {
+                "approveacls": false,
+                "commit": false
+              }
+            }
+          ]
+        }
+
+    '''
+    httpcode = 200
+    output = {}
+
+    packagername = flask.request.values.get('packagername', None) \
+        or packagername
+    packages = flask.request.values.getlist('packages')
+    acls = flask.request.values.getlist('acls') or pkgdblib.ACLS
+
+    for acl in acls:
+        if acl not in pkgdblib.ACLS:
+            output = {
+                'output': 'notok',
+                'error': 'Invalid request, "%s" is an invalid acl' % acl}
+            jsonout = flask.jsonify(output)
+            jsonout.status_code = 500
+            return jsonout
+
+    if not packagername or not packages:
+        output = {'output': 'notok', 'error': 'Invalid request'}
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 500
+        return jsonout
+
+    checks = []
+    for package in packages:
+        parts = package.strip('/').split('/')
+        if len(parts) == 1:
+            parts.insert(0, 'rpms')
+        if len(parts) == 2:
+            parts.append(None)
+        if len(parts) != 3 or not all(parts[:2]):
+            output = {
+                'output': 'notok',
+                'error': 'Invalid request, "%s" is an invalid package'
+                % package}
+            jsonout = flask.jsonify(output)
+            jsonout.status_code = 500
+            return jsonout
+        checks.append(tuple(parts))
+
+    permissions = pkgdblib.has_acls_packages(
+        SESSION, packagername, checks, acl=acls)
+    SESSION.commit()
+
+    output['output'] = 'ok'
+    output['packager'] = packagername
+    output['acls'] = acls
+    output['packages'] = [
+        {
+            'namespace': namespace,
+            'name': name,
+            'branch': branch,
+            'acls': permissions[(namespace, name, branch)],
+        }
+        for namespace, name, branch in checks
+    ]
+
+    jsonout = flask.jsonify(output)
+    jsonout.status_code = httpcode
+    return jsonout
+
+
 @API.route('/packager/stats/')
 @API.route('/packager/stats')
 @API.route('/packager/stats/<packagername>/')
@@ -521,6 +647,12 @@ def api_packager_list(pattern=None):
 
     :kwarg pattern: String of the pattern to use to list find packagers.
         If no pattern is provided, it returns the list of all packagers.
+    :kwarg cursor: Return the packagers by pages, starting after the
+        packager designated by this cursor. Pass an empty cursor to get the
+        first page, then the ``next_cursor`` returned with each page to get
+        the following one, it is null on the last page.
+    :kwarg limit: An integer to limit the number of packagers in each page
+        when using ``cursor``, defaults to 250, maximum is 500.
 
 
     Sample response:
@@ -550,13 +682,29 @@ def api_packager_list(pattern=None):
     output = {}
 
     pattern = flask.request.args.get('pattern', pattern) or '*'
+    cursor = flask.request.args.get('cursor', None)
+    limit = None
+    if cursor is not None:
+        limit = get_limit()
+
     if pattern:
-        packagers = pkgdblib.search_packagers(
-            SESSION, pattern=pattern, eol=False)
-        packagers = [pkg[0] for pkg in packagers]
-        SESSION.commit()
-        output['output'] = 'ok'
-        output['packagers'] = packagers
+        try:
+            packagers = pkgdblib.search_packagers(
+                SESSION, pattern=pattern, eol=False, limit=limit,
+                cursor=cursor)
+            packagers = [pkg[0] for pkg in packagers]
+            SESSION.commit()
+            output['output'] = 'ok'
+            output['packagers'] = packagers
+            if cursor is not None:
+                output['next_cursor'] = None
+                if len(packagers) == limit:
+                    output['next_cursor'] = pkgdblib.encode_cursor(
+                        packagers[-1])
+        except PkgdbException as err:
+            SESSION.rollback()
+            output = {'output': 'notok', 'error': str(err)}
+            httpcode = 500
     else:  # pragma: no cover # In theory we can never get here
         output = {'output': 'notok', 'error': 'Invalid request'}
         httpcode = 500
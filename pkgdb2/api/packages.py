@@ -880,7 +880,14 @@ def api_package_list(namespace=None, pattern=None):
         250, maximum is 500.
     :kwarg page: The page number to return (useful in combination to limit).
     :kwarg count: A boolean to return the number of packages instead of the
-        list. Defaults to False.
+        list. Defaults to False. If set to ``0`` or ``false``, the list is
+        returned without computing the total number of packages, the
+        ``page_total`` key is then omitted.
+    :kwarg cursor: The ``next_cursor`` returned with the previous page, to
+        retrieve the following one. Paging with cursors is faster than with
+        ``page`` for the last pages. Pass an empty cursor to get the first
+        page. The ``page_total`` key is then omitted and the output
+        contains a ``next_cursor`` key, which is null on the last page.
 
     *Results are paginated*
 
@@ -1028,87 +1035,74 @@ def api_package_list(namespace=None, pattern=None):
     eol = flask.request.args.get('eol', False)
     page = flask.request.args.get('page', 1)
     limit = get_limit()
-    count = flask.request.args.get('count', False)
+    count = flask.request.args.get('count', None)
+    cursor = flask.request.args.get('cursor', None)
+    with_count = cursor is None
+    if str(count).lower() in ['0', 'false']:
+        count = False
+        with_count = False
     try:
-        tmp_branches = branches
-        if not branches:
-            tmp_branches = [None]
-        tmp_statuses = statuses
-        if not statuses:
-            tmp_statuses = [None]
-
         if count:
-            packages = 0
-            for status, branch, pattern in itertools.product(
-                    tmp_statuses, tmp_branches, patterns):
-                packages += pkgdblib.search_package(
-                    SESSION,
-                    namespace=namespace,
-                    pkg_name=pattern,
-                    pkg_branch=branch,
-                    pkg_poc=poc,
-                    orphaned=orphaned,
-                    critpath=critpath,
-                    status=status,
-                    eol=eol,
-                    page=page,
-                    limit=limit,
-                    count=count,
-                )
+            packages = pkgdblib.search_package(
+                SESSION,
+                namespace=namespace,
+                pkg_name=patterns,
+                pkg_branch=branches or None,
+                pkg_poc=poc,
+                orphaned=orphaned,
+                critpath=critpath,
+                status=statuses or None,
+                eol=eol,
+                page=page,
+                limit=limit,
+                count=count,
+            )
 
             output['output'] = 'ok'
             output['packages'] = packages
             output['page'] = 1
             output['page_total'] = 1
         else:
-            packages = set()
-            packages_count = 0
-            for status, branch, pattern in itertools.product(
-                    tmp_statuses, tmp_branches, patterns):
-                packages.update(
-                    pkgdblib.search_package(
-                        SESSION,
-                        namespace=namespace,
-                        pkg_name=pattern,
-                        pkg_branch=branch,
-                        pkg_poc=poc,
-                        orphaned=orphaned,
-                        critpath=critpath,
-                        status=status,
-                        eol=eol,
-                        page=page,
-                        limit=limit,
-                        count=count,
-                    )
-                )
-                packages_count += pkgdblib.search_package(
-                    SESSION,
-                    namespace=namespace,
-                    pkg_name=pattern,
-                    pkg_branch=branch,
-                    pkg_poc=poc,
-                    orphaned=orphaned,
-                    critpath=critpath,
-                    status=status,
-                    eol=eol,
-                    page=page,
-                    limit=limit,
-                    count=True,
-                )
+            packages = pkgdblib.search_package(
+                SESSION,
+                namespace=namespace,
+                pkg_name=patterns,
+                pkg_branch=branches or None,
+                pkg_poc=poc,
+                orphaned=orphaned,
+                critpath=critpath,
+                status=statuses or None,
+                eol=eol,
+                page=page,
+                limit=limit,
+                with_count=with_count,
+                cursor=cursor,
+            )
+            if with_count:
+                packages, packages_count = packages
 
-            if not packages:
+            if not packages and cursor is None:
                 output['output'] = 'notok'
                 output['packages'] = []
                 output['error'] = 'No packages found for these parameters'
                 httpcode = 404
             else:
+                if acls:
+                    pkgdblib.load_package_listings(SESSION, packages)
                 output['packages'] = [
                     pkg.to_json(acls=acls, collection=branches, package=False)
                     for pkg in packages
                 ]
                 output['output'] = 'ok'
                 output['page'] = int(page)
-                output['page_total'] = int(ceil(packages_count / float(limit)))
+                if with_count:
+                    output['page_total'] = int(
+                        ceil(packages_count / float(limit)))
+                if cursor is not None:
+                    output['next_cursor'] = None
+                    if len(packages) == limit:
+                        output['next_cursor'] = pkgdblib.encode_cursor(
+                            packages[-1].name, packages[-1].id)
 
     except PkgdbException as err:
         SESSION.rollback()
@@ -1116,7 +1110,7 @@ def api_package_list(namespace=None, pattern=None):
         output['error'] = str(err)
         httpcode = 500
 
-    if 'page_total' not in output:
+    if 'page' not in output:
         output['page'] = 1
         output['page_total'] = 1
 
@@ -73,6 +73,23 @@ PKGDB2_CACHE_KWARGS = {
     }
 }
 
+# Serve the VCS ACLs from a snapshot stored in the database, regenerated
+# in a background thread once changes are committed (or by the request
+# committing them) and keeping a few generations as well as the changes
+# between them for a number of days
+PKGDB2_VCS_SNAPSHOT = True
+PKGDB2_VCS_SNAPSHOT_BACKGROUND = True
+PKGDB2_VCS_SNAPSHOT_KEEP = 3
+PKGDB2_VCS_CHANGES_DAYS = 30
+
+# Number of seconds after which the in-memory index of the package and
+# packager names used by /api/typeahead is rebuilt from the database
+PKGDB2_TYPEAHEAD_REFRESH = 3600
+
+# Build the index used by /api/typeahead when the application starts rather
+# than at the first completion asked for
+PKGDB2_TYPEAHEAD_PRELOAD = False
+
 # Information regarding where the application is deployed
 SITE_ROOT = 'https://admin.fedoraproject.org'
 SITE_URL = '%s/pkgdb' % SITE_ROOT
@@ -101,11 +118,20 @@ PKGDB2_FAS_INSECURE = False
 
 # pkgdb notifications
 PKGDB2_FEDMSG_NOTIFICATION = True
+PKGDB2_FEDMSG_ASYNC = False
+PKGDB2_FEDMSG_QUEUE_SIZE = 10000
+PKGDB2_FEDMSG_BATCH_SIZE = 100
 PKGDB2_EMAIL_NOTIFICATION = False
 PKGDB2_EMAIL_TO = '{pkg_name}-owner@fedoraproject.org'
 PKGDB2_EMAIL_FROM = 'nobody@fedoraproject.org'
 PKGDB2_EMAIL_SMTP_SERVER = 'localhost'
 PKGDB2_EMAIL_CC = None
+PKGDB2_EMAIL_ASYNC = False
+PKGDB2_EMAIL_QUEUE_SIZE = 1000
+PKGDB2_EMAIL_BATCH_SIZE = 20
+PKGDB2_EMAIL_SMTP_IDLE = 30
+PKGDB2_EMAIL_RETRIES = 3
+PKGDB2_EMAIL_RETRY_DELAY = 1
 
 MAIL_ADMIN = 'pingou@pingoured.fr'
 
@@ -135,6 +161,8 @@ REPO_MAP = [
 ]
 
 BASE_REPO_URL = 'https://dl.fedoraproject.org/pub/%s/SRPMS/'
+# Number of repos the update_package_info script retrieves at the same time
+REPO_FETCH_WORKERS = 4
 
 # Anitya settings
 PKGDB2_ANITYA_DISTRO='Fedora'
@@ -186,6 +214,9 @@ PKGDB2_NAMESPACE_POLICY = {
     ],
 }
 
+# Number of packages branched per transaction when branching a collection
+PKGDB2_BRANCH_CHUNK_SIZE = 500
+
 # URLs used in the package's info page
 # Watch for the `%s` in the URL it is mandatory and in each of these, it
 # will be replaced by the package's name
@@ -23,29 +23,45 @@
 PkgDB internal API to interact with the database.
 '''
 
+import base64
+import collections
 import operator
 import json
 import urlparse
 import os
+import threading
+import time
 
+import flask
 import sqlalchemy
 
 from datetime import datetime
 from datetime import timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import UpdateBase
 
 from fedora.client.fas2 import FASError
 
 import pkgdb2
 from pkgdb2.lib import model
+import pkgdb2.lib.typeahead
 import pkgdb2.lib.utils
 from pkgdb2.lib.exceptions import PkgdbException
 
 
 ACLS = ['commit', 'watchbugzilla', 'watchcommits', 'approveacls']
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# Attribute of flask.g storing the ACLs of the users loaded by the request
+USER_ACLS_CACHE = 'pkgdb2_user_acls'
+# Lock preventing the snapshot of the VCS ACLs to be regenerated by two
+# threads at the same time
+_VCS_SNAPSHOT_LOCK = threading.Lock()
 
 ## Apparently some of our methods have too many arguments
 # pylint: disable=R0913
@@ -736,20 +752,72 @@ def update_pkg_status(
     )
 
 
+def encode_cursor(*values):
+    """ Return the opaque cursor pointing after the row whose sorting key
+    is made of the given values, to use with the ``cursor`` argument of
+    the search functions.
+
+    :arg values: the values of the sorting key of the last row seen:
+        strings, integers or datetimes.
+    :returns: the cursor as an url-safe string.
+
+    """
+    key = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'date': value.strftime(CURSOR_DATE_FORMAT)}
+        key.append(value)
+    return base64.urlsafe_b64encode(json.dumps(key))
+
+
+def decode_cursor(cursor, types):
+    """ Return the values of the sorting key encoded in the given cursor,
+    as returned by `encode_cursor`.
+
+    :arg cursor: the cursor to decode.
+    :arg types: a tuple of the type of each value of the sorting key:
+        ``basestring``, ``int`` or ``datetime``.
+    :returns: a tuple of the values of the sorting key.
+    :raises pkgdb2.lib.PkgdbException: if the cursor is invalid.
+
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise ValueError('Wrong number of values')
+        values = []
+        for value, kind in zip(key, types):
+            if kind is datetime:
+                if not isinstance(value, dict) \
+                        or not isinstance(value.get('date'), basestring):
+                    raise ValueError('Wrong type of value')
+                value = datetime.strptime(value['date'], CURSOR_DATE_FORMAT)
+            # bool is a subclass of int
+            elif not isinstance(value, kind) or isinstance(value, bool):
+                raise ValueError('Wrong type of value')
+            values.append(value)
+    except (TypeError, ValueError, KeyError):
+        raise PkgdbException('Invalid cursor provided')
+    return tuple(values)
+
+
 def search_package(
         session, namespace, pkg_name, pkg_branch=None, pkg_poc=None,
         orphaned=None, critpath=None, status=None, eol=False,
-        page=None, limit=None, count=False, case_sensitive=True):
+        page=None, limit=None, count=False, case_sensitive=True,
+        with_count=False, cursor=None):
     """ Return the list of packages matching the given criteria.
 
     :arg session: session with which to connect to the database.
-    :arg pkg_name: the name of the package.
-    :kwarg pkg_branch: branchname of the collection to search.
+    :arg pkg_name: the name of the package, or a list of names in which
+        case the packages matching any of them are returned.
+    :kwarg pkg_branch: branchname of the collection to search, or a list
+        of branchnames.
     :kwarg pkg_poc: point of contact of the packages searched.
     :kwarg orphaned: boolean to restrict search to orphaned packages.
     :kwarg critpath: Boolean to retrict the search to critpath packages.
     :kwarg status: allows filtering the packages by their status:
-        Approved, Retired, Removed, Orphaned.
+        Approved, Retired, Removed, Orphaned. Can be a list of statuses.
     :kwarg eol: a boolean to specify whether to include results for
         EOL collections or not. Defaults to False.
         If True, it will return results for all collections (including EOL).
@@ -761,17 +829,26 @@ def search_package(
        if true, returns the data if false (default).
     :kwarg case_sensitive: a boolean to specify doing a case insensitive
         search. Defaults to True.
+    :kwarg with_count: a boolean to also return the total number of
+        packages matching, retrieved in the same query as the packages.
+    :kwarg cursor: a cursor, as returned by `encode_cursor` for the name
+        and identifier of the last package seen, to return the packages
+        coming after it instead of using ``page``.
     :returns: a list of ``Package`` entry corresponding to the given
-        criterias.
-    :rtype: list(Package)
+        criterias, or a tuple of this list and of the total number of
+        packages matching if ``with_count`` is True.
+    :rtype: list(Package) or tuple(list(Package), int)
     :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``cursor`` is invalid.
 
     """
-    if '*' in pkg_name:
+    if isinstance(pkg_name, basestring):
         pkg_name = pkg_name.replace('*', '%')
+    else:
+        pkg_name = [name.replace('*', '%') for name in pkg_name]
     if orphaned:
         pkg_poc = 'orphan'
         status = 'Orphaned'
@@ -791,6 +868,11 @@ def search_package(
     if page is not None and page > 0 and limit is not None and limit > 0:
         page = (page - 1) * limit
 
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, (basestring, int))
+        page = None
+
     return model.Package.search(
         session,
         namespace=namespace,
@@ -805,6 +887,8 @@ def search_package(
         limit=limit,
         count=count,
         case_sensitive=case_sensitive,
+        with_count=with_count,
+        after=after,
     )
 
 
@@ -854,8 +938,21 @@ def search_collection(session, pattern, status=None, page=None,
                                    count=count)
 
 
+def load_package_listings(session, packages):
+    """ Load the listings of the given packages with their collection and
+    ACLs at once, to serialize them without querying the database for
+    each of them.
+
+    :arg session: session with which to connect to the database.
+    :arg packages: the list of ``Package`` whose listings to load.
+    :returns: the list of ``Package`` provided.
+
+    """
+    return model.Package.load_listings(session, packages)
+
+
 def search_packagers(session, pattern, eol=False, page=None, limit=None,
-                     count=False):
+                     count=False, cursor=None):
     """ Return the list of Packagers maching the given pattern.
 
     :arg session: session with which to connect to the database.
@@ -868,6 +965,9 @@ def search_packagers(session, pattern, eol=False, page=None, limit=None,
     :kwarg limit: the number of results to return.
     :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+    :kwarg cursor: a cursor, as returned by `encode_cursor` for the name of
+        the last packager seen, to return the packagers coming after it
+        instead of using ``page``.
     :returns: a list of ``PackageListing`` entry corresponding to the given
         criterias.
     :rtype: list(PackageListing)
@@ -875,6 +975,7 @@ def search_packagers(session, pattern, eol=False, page=None, limit=None,
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``cursor`` is invalid.
 
     """
     if '*' in pattern:
@@ -895,21 +996,61 @@ def search_packagers(session, pattern, eol=False, page=None, limit=None,
     if page is not None and page > 0 and limit is not None and limit > 0:
         page = (page - 1) * limit
 
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, (basestring,))
+        page = None
+
     packagers = model.PackageListing.search_packagers(
         session,
         pattern=pattern,
         eol=eol,
         offset=page,
         limit=limit,
-        count=count)
+        count=count,
+        after=after)
 
     return packagers
 
 
+def complete_names(session, prefix, kind='packages', namespace=None,
+                   limit=10):
+    """ Return the packages or packagers whose name starts with the given
+    prefix, as found in the in-memory index of the names.
+
+    :arg session: session with which to connect to the database.
+    :arg prefix: the beginning of the names to return.
+    :kwarg kind: the kind of names to complete, either ``packages`` or
+        ``packagers``.
+    :kwarg namespace: the namespace to restrict the packages to.
+    :kwarg limit: the maximum number of names to return.
+    :returns: a list of (namespace, name) tuples of the packages or a list
+        of the names of the packagers.
+    :rtype: list
+    :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
+        this exception beeing raised:
+            - The provided ``kind`` is not supported.
+            - The provided ``limit`` is not an integer.
+
+    """
+    if kind not in ('packages', 'packagers'):
+        raise PkgdbException('Invalid kind of names provided')
+
+    try:
+        limit = abs(int(limit))
+    except ValueError:
+        raise PkgdbException('Wrong limit provided')
+
+    index = pkgdb2.lib.typeahead.get_index(session)
+    if kind == 'packagers':
+        return index.complete_packagers(prefix, limit=limit)
+    return index.complete_packages(prefix, namespace=namespace, limit=limit)
+
+
 def search_actions(
         session, namespace='rpms', package=None, packager=None,
         action=None, status='Awaiting Review', page=None,
-        limit=None, count=False, order='asc'):
+        limit=None, count=False, order='asc', cursor=None):
     """ Return the list of actions requiring an admin and matching the
     given criteria.
 
@@ -926,12 +1067,16 @@ def search_actions(
     :kwarg order: the order in which to return the requests, default to
         ``asc`` meaning from the oldest to the most recent, can be
         ``desc`` meaning from the most recent to the oldest.
+    :kwarg cursor: a cursor, as returned by `encode_cursor` for the
+        creation date and identifier of the last action seen, to return
+        the actions coming after it instead of using ``page``.
     :returns: a list of ``Log`` entry corresponding to the given criterias.
     :rtype: list(Log)
     :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``cursor`` is invalid.
             - The ``package`` name specified does not correspond to any
                 package.
 
@@ -962,6 +1107,11 @@ def search_actions(
     if status and status.lower() == 'all':
         status = None
 
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, (datetime, int))
+        page = None
+
     return model.AdminAction.search(
         session,
         package_id=package_id,
@@ -972,11 +1122,29 @@ def search_actions(
         limit=limit,
         count=count,
         order=order,
+        after=after,
     )
 
 
+def get_last_change(session):
+    """ Return the number of transactions which committed changes and the
+    date at which the last one was committed.
+
+    Unlike the log entries, these follow the order in which the changes
+    were committed.
+
+    :arg session: session with which to connect to the database.
+    :returns: a tuple of the number of changes and of the date of the last
+        one, (0, None) if nothing was changed yet.
+    :rtype: tuple
+
+    """
+    return model.ChangeCounter.current(session)
+
+
 def search_logs(session, namespace=None, package=None, packager=None,
-                from_date=None, page=None, limit=None, count=False):
+                from_date=None, page=None, limit=None, count=False,
+                cursor=None):
     """ Return the list of Collection matching the given criteria.
 
     :arg session: session with which to connect to the database.
@@ -988,12 +1156,16 @@ def search_logs(session, namespace=None, package=None, packager=None,
     :kwarg limit: the number of results to return.
     :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+    :kwarg cursor: a cursor, as returned by `encode_cursor` for the change
+        time and identifier of the last entry seen, to return the older
+        entries instead of using ``page``.
     :returns: a list of ``Log`` entry corresponding to the given criterias.
     :rtype: list(Log)
     :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``cursor`` is invalid.
             - The ``package`` name specified does not correspond to any
                 package.
 
@@ -1026,13 +1198,19 @@ def search_logs(session, namespace=None, package=None, packager=None,
         # Make sure we get all the events of the day asked
         from_date = from_date + timedelta(days=1)
 
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, (datetime, int))
+        page = None
+
     return model.Log.search(session,
                             package_id=package_id,
                             packager=packager,
                             from_date=from_date,
                             offset=page,
                             limit=limit,
-                            count=count)
+                            count=count,
+                            after=after)
 
 
 def get_acl_packager(
@@ -1373,6 +1551,146 @@ def edit_package(
             raise PkgdbException('Could not edit package.')
 
 
+def update_packages_info(
+        session, packages_info, user, namespace='rpms', names=None,
+        changed=None, batch_size=500):
+    """ Update the summary, description and upstream URL of the approved
+    packages of a namespace from the provided information, for example the
+    metadata of a repo.
+
+    The packages are compared in memory and only the ones changed are
+    updated, by batches, logging the changes as `edit_package` does.
+
+    This method only flushes the changes, nothing is committed to the
+    database.
+
+    :arg session: the session with which to connect to the database.
+    :arg packages_info: a dict associating the name of the packages to a
+        tuple of their summary, description and upstream URL.
+    :arg user: The user performing the update.
+    :kwarg namespace: the namespace of the packages to update.
+    :kwarg names: restrict the update to the packages of these names.
+    :kwarg changed: restrict the comparison to the packages of these names,
+        the other packages found in the provided information being
+        considered up to date.
+    :kwarg batch_size: the number of packages updated per statement.
+    :returns: a dict giving the names of the packages ``found`` in the
+        provided information, of those ``updated`` and of those
+        ``missing`` from the provided information.
+    :rtype: dict
+    :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
+        this exception beeing raised:
+            - You are not allowed to edit a package, only pkgdb admin can.
+            - An error occured while updating the packages in the database
+                the message returned is a dummy information message to
+                return to the user, the trace back is in the logs.
+
+    """
+    if not pkgdb2.is_pkgdb_admin(user):
+        raise PkgdbException('You are not allowed to edit packages')
+
+    output = {'found': [], 'updated': [], 'missing': []}
+    changes = []
+    edited = {}
+    for row in model.Package.get_info(session, namespace, names=names):
+        if row.name not in packages_info:
+            output['missing'].append(row.name)
+            continue
+        output['found'].append(row.name)
+        if changed is not None and row.name not in changed:
+            continue
+
+        summary, description, upstream_url = packages_info[row.name]
+        change = {
+            'id': row.id,
+            'summary': row.summary,
+            'description': row.description,
+            'upstream_url': row.upstream_url,
+        }
+        fields = []
+        for field, value in (
+                ('summary', summary),
+                ('description', description),
+                ('upstream_url', upstream_url)):
+            # Same as edit_package, empty values do not erase the data
+            if value and value != change[field]:
+                change[field] = value
+                fields.append(field)
+        if fields:
+            changes.append(change)
+            edited[row.id] = fields
+
+    try:
+        for idx in range(0, len(changes), batch_size):
+            batch = changes[idx:idx + batch_size]
+            model.Package.update_info(session, batch)
+            for package in model.Package.by_ids(
+                    session, [change['id'] for change in batch]):
+                output['updated'].append(package.name)
+                pkgdb2.lib.utils.log(session, None, 'package.update', dict(
+                    agent=user.username,
+                    fields=edited[package.id],
+                    package=package.to_json(acls=False),
+                ))
+        session.flush()
+    except SQLAlchemyError as err:  # pragma: no cover
+        pkgdb2.LOG.exception(err)
+        raise PkgdbException('Could not edit packages.')
+
+    return output
+
+
+def get_repo_sync(session, name):
+    """ Return the state of the metadata of the repo the last time the
+    information of the packages were synced with it.
+
+    :arg session: the session with which to connect to the database.
+    :arg name: the name of the repo.
+    :returns: a tuple of the checksum of the primary_db of the repo and of
+        a dict associating the name of its packages to the hash of their
+        metadata, or (None, {}) if the repo was never synced.
+    :rtype: tuple
+
+    """
+    repo = model.RepoSync.by_name(session, name)
+    if repo is None:
+        return (None, {})
+    return (repo.checksum, model.RepoPackageHash.by_repo(session, repo.id))
+
+
+def save_repo_sync(session, name, checksum, revision, hashes):
+    """ Record the state of the metadata of the repo the information of the
+    packages were just synced with.
+
+    This method only flushes the changes, nothing is committed to the
+    database.
+
+    :arg session: the session with which to connect to the database.
+    :arg name: the name of the repo.
+    :arg checksum: the checksum of the primary_db of the repo.
+    :arg revision: the revision of the metadata of the repo.
+    :arg hashes: a dict associating the name of the packages of the repo
+        to the hash of their metadata.
+    :raises pkgdb2.lib.PkgdbException: An error occured while storing the
+        state of the repo.
+
+    """
+    repo = model.RepoSync.by_name(session, name)
+    if repo is None:
+        repo = model.RepoSync(name=name, checksum=checksum)
+        session.add(repo)
+    repo.checksum = checksum
+    repo.revision = revision
+
+    try:
+        session.flush()
+        model.RepoPackageHash.save(session, repo.id, hashes)
+        session.flush()
+    except SQLAlchemyError as err:  # pragma: no cover
+        pkgdb2.LOG.exception(err)
+        raise PkgdbException('Could not save the state of the repo.')
+
+
 def update_collection_status(session, clt_branchname, clt_status, user):
     """ Update the status of a collection.
 
@@ -1514,23 +1832,140 @@ def has_acls(session, user, namespace, package, acl, branch=None):
     if package is None or acl is None:
         return False
 
-    acls = get_acl_user_package(
-        session, user=user, namespace=namespace,
-        package=package, status='Approved')
+    acls = _get_user_acls(session, user, namespace, package)
 
     if isinstance(acl, basestring):
         acl = [acl]
 
-    user_has_acls = False
-    for user_acl in acls:
-        if not branch and user_acl['acl'] in acl:
-            user_has_acls = True
-            break
-        elif branch and user_acl['collection'] == branch \
-                and user_acl['acl'] in acl:
-            user_has_acls = True
-            break
-    return user_has_acls
+    if branch:
+        return any((branch, user_acl) in acls for user_acl in acl)
+    return any(user_acl in acl for _, user_acl in acls)
+
+
+def has_acls_packages(session, user, packages, acl=None):
+    """ Return which of the specified acl the specified user has on each
+    of the specified packages, retrieving the ACLs of all these packages
+    at once.
+
+    :arg session: session with which to connnect to the database.
+    :arg user: the name of the user for which to check the acl.
+    :arg packages: a list of (namespace, package) or (namespace, package,
+        branch) tuples to check the acl on. Without branch, having the acl
+        on one branch of the package is enough.
+    :kwarg acl: one or more ACLs to check for the user on the packages,
+        defaults to all of them.
+    :returns: a dict associating each of the specified tuples to a dict
+        associating each acl to whether the user has it.
+    :rtype: dict
+
+    """
+    if acl is None:
+        acl = ACLS
+    elif isinstance(acl, basestring):
+        acl = [acl]
+
+    cache = _user_acls_cache()
+    missing = sorted(set(
+        (pkg[0], pkg[1]) for pkg in packages
+        if (user, pkg[0], pkg[1]) not in cache))
+    for namespace, package in missing:
+        cache[(user, namespace, package)] = set()
+    # Keep the number of parameters of the query within the limits of the
+    # databases
+    for idx in range(0, len(missing), 500):
+        for namespace, package, branch, user_acl in \
+                model.PackageListingAcl.get_acls_packages(
+                    session, user, missing[idx:idx + 500],
+                    status='Approved'):
+            cache[(user, namespace, package)].add((branch, user_acl))
+
+    output = {}
+    for pkg in packages:
+        acls = cache[(user, pkg[0], pkg[1])]
+        if len(pkg) > 2 and pkg[2]:
+            output[pkg] = dict(
+                (user_acl, (pkg[2], user_acl) in acls) for user_acl in acl)
+        else:
+            branch_acls = set(user_acl for _, user_acl in acls)
+            output[pkg] = dict(
+                (user_acl, user_acl in branch_acls) for user_acl in acl)
+    return output
+
+
+def _get_user_acls(session, user, namespace, package):
+    """ Return the set of (branch, acl) approved for the specified user on
+    the specified package.
+
+    Within a request, the ACLs of a user on a package are only retrieved
+    once and kept on ``flask.g`` until the ACLs, listings or packages are
+    changed.
+
+    :arg session: session with which to connnect to the database.
+    :arg user: the name of the user for which to retrieve the ACLs.
+    :arg namespace: the namespace of the package.
+    :arg package: the name of the package.
+
+    """
+    cache = _user_acls_cache()
+    key = (user, namespace, package)
+    if key not in cache:
+        cache[key] = set(
+            (user_acl['collection'], user_acl['acl'])
+            for user_acl in get_acl_user_package(
+                session, user=user, namespace=namespace,
+                package=package, status='Approved')
+        )
+    return cache[key]
+
+
+def _user_acls_cache():
+    """ Return the dict of the ACLs of the users on the packages kept for
+    the current request, an empty dict outside of a request.
+    """
+    if not flask.has_app_context():
+        return {}
+    cache = getattr(flask.g, USER_ACLS_CACHE, None)
+    if cache is None:
+        cache = {}
+        setattr(flask.g, USER_ACLS_CACHE, cache)
+    return cache
+
+
+def _reset_user_acls(session):
+    """ Drop the ACLs of the users kept for the current request, the
+    changes of a rolled back session being gone.
+    """
+    if flask.has_app_context():
+        setattr(flask.g, USER_ACLS_CACHE, None)
+
+
+def _reset_user_acls_on_flush(session, flush_context):
+    """ Drop the ACLs of the users kept for the current request once the
+    ACLs, listings or packages are changed.
+    """
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, (model.PackageListingAcl, model.PackageListing,
+                            model.Package))
+           for obj in changed):
+        _reset_user_acls(session)
+
+
+def _reset_user_acls_on_execute(
+        conn, clauseelement, multiparams, params, result):
+    """ Drop the ACLs of the users kept for the current request once the
+    ACLs, listings or packages are changed by a statement executed outside
+    of the flushes, such as the bulk inserts and updates.
+    """
+    if isinstance(clauseelement, UpdateBase) and clauseelement.table in (
+            model.PackageListingAcl.__table__,
+            model.PackageListing.__table__,
+            model.Package.__table__):
+        _reset_user_acls(None)
+
+
+event.listen(Session, 'after_flush', _reset_user_acls_on_flush)
+event.listen(Session, 'after_rollback', _reset_user_acls)
+event.listen(Engine, 'after_execute', _reset_user_acls_on_execute)
 
 
 def get_status(session, status='all'):
@@ -1719,16 +2154,26 @@ def unorphan_package(
     )
 
 
-def add_branch(session, clt_from, clt_to, user):
+def add_branch(session, clt_from, clt_to, user, chunk_size=None,
+               progress=None):
     """ Clone a permission from a branch to another.
 
-    This method only flushes the new objects, the only thing committed is
-    the log message when the branching starts.
+    The packages are branched by chunks of ``chunk_size`` packages,
+    committing each chunk. How far the branching went is recorded, so
+    calling this method again after an interruption resumes the branching
+    where it stopped.
 
     :arg session: session with which to connect to the database.
     :arg clt_from: the ``branchname`` of the collection to branch from.
     :arg clt_to: the ``branchname`` of the collection to branch to.
     :arg user: the user making the action.
+    :kwarg chunk_size: the number of packages branched per transaction,
+        defaults to the ``PKGDB2_BRANCH_CHUNK_SIZE`` configuration key.
+    :kwarg progress: a function called after each chunk with a dict
+        giving the number of packages branched (``packages``) out of the
+        ``total``, the number of ``listings`` and ``acls`` created, the
+        number of rows created per second (``rate``) and the estimated
+        number of seconds left (``eta``).
     :returns: a list of errors generated while branching, these errors
         might be the results of trying to create a PackageListing object
         already existing.
@@ -1754,6 +2199,9 @@ def add_branch(session, clt_from, clt_to, user):
     except NoResultFound:
         raise PkgdbException('Branch %s not found' % clt_to)
 
+    if chunk_size is None:
+        chunk_size = pkgdb2.APP.config.get('PKGDB2_BRANCH_CHUNK_SIZE', 500)
+
     # Compute a list of namespaces that should *not* be handled in this branch.
     policy = pkgdb2.APP.config.get('PKGDB2_NAMESPACE_POLICY')
     exempted_namespaces = [
@@ -1762,6 +2210,19 @@ def add_branch(session, clt_from, clt_to, user):
     ]
     pkgdb2.LOG.info("Exempted namespaces %r" % exempted_namespaces)
 
+    state = model.BranchProgress.get(session, clt_from.id, clt_to.id)
+    if state is None:
+        state = model.BranchProgress(
+            collection_from_id=clt_from.id, collection_to_id=clt_to.id)
+    elif state.date_completed:
+        # Branching again, there may be new packages to branch
+        state.date_created = datetime.utcnow()
+        state.last_package_id = 0
+        state.listings = 0
+        state.acls = 0
+        state.date_completed = None
+    session.add(state)
+
     pkgdb2.lib.utils.log(session, None, 'branch.start', dict(
         agent=user.username,
         collection_from=clt_from.to_json(),
@@ -1770,72 +2231,68 @@ def add_branch(session, clt_from, clt_to, user):
     ))
     session.commit()
 
-    q1 = '''INSERT INTO package_listing (
-        package_id, point_of_contact, collection_id, status, critpath,
-        status_change
-    )
-    SELECT
-        package_listing.package_id,
-        package_listing.point_of_contact,
-        %s,
-        package_listing.status,
-        package_listing.critpath,
-        package_listing.status_change
-    FROM package_listing, package
-    WHERE package_listing.collection_id = %s
-    AND package.id = package_listing.package_id
-    AND package_listing.status IN ('Approved','Orphaned')
-    ''' % (clt_to.id, clt_from.id)
-
-    q2 = '''INSERT INTO package_listing_acl (
-        fas_name, packagelisting_id, acl, status, date_created
-    )
-    SELECT package_listing_acl.fas_name, p2.id,
-           package_listing_acl.acl, package_listing_acl.status, '%s'
-    FROM package_listing as p1, package_listing as p2, package_listing_acl,
-         package
-    WHERE p1.collection_id = %s
-    AND p2.collection_id = %s
-    AND p1.package_id = p2.package_id
-    AND package_listing_acl.packagelisting_id = p1.id
-    AND package.id = p1.package_id
-    ''' % (datetime.utcnow(), clt_from.id, clt_to.id)
-
-    for namespace in exempted_namespaces:
-        q1 += ''' AND "package".namespace != '%s' ''' % namespace
-        q2 += ''' AND "package".namespace != '%s' ''' % namespace
-
-    q1 += ";"
-    q2 += ";"
+    package_ids = model.PackageListing.branch_package_ids(
+        session, clt_from.id, exempted_namespaces)
+    todo = [pkg_id for pkg_id in package_ids if pkg_id > state.last_package_id]
+    # The last chunk has no upper bound, copying the ACLs of every package
+    # having a listing in both collections
+    highs = [
+        todo[idx - 1] for idx in range(chunk_size, len(todo), chunk_size)
+    ] + [None]
 
     messages = []
-    try:
-        messages.append(q1)
-        session.execute(q1)
-        session.commit()
-        messages.append(
-            'SUCCESS: successfully branched (PackageListing) %s from '
-            'to %s %s' % (clt_from.name, clt_to.name, clt_to.version))
-    except SQLAlchemyError as err:  # pragma: no cover
-        session.rollback()
-        pkgdb2.LOG.debug(err)
-        messages.append(
-            'FAILED: failed to branch (PackageListing) %s from to %s %s' % (
-                clt_from.name, clt_to.name, clt_to.version))
-
-    try:
-        messages.append(q2)
-        session.execute(q2)
-        session.commit()
-        messages.append(
-            'SUCCESS: successfully branched (PackageListingAcl) %s from '
-            'to %s %s' % (clt_from.name, clt_to.name, clt_to.version))
-    except SQLAlchemyError as err:  # pragma: no cover
-        session.rollback()
-        pkgdb2.LOG.debug(err)
-        messages.append(
-            'FAILED: failed to branch (PackageListingAcl) %s from to %s %s' % (
-                clt_from.name, clt_to.name, clt_to.version))
+    start = time.time()
+    rows = 0
+    branched = 0
+    for high in highs:
+        low = state.last_package_id
+        try:
+            listings, acls = model.PackageListing.branch_packages(
+                session, clt_from.id, clt_to.id, exempted_namespaces,
+                low=low, high=high)
+            state.listings += listings
+            state.acls += acls
+            if high is None:
+                state.last_package_id = todo[-1] if todo else low
+                state.date_completed = datetime.utcnow()
+            else:
+                state.last_package_id = high
+            session.add(state)
+            session.commit()
+        except SQLAlchemyError as err:  # pragma: no cover
+            session.rollback()
+            pkgdb2.LOG.debug(err)
+            messages.append(
+                'FAILED: failed to branch %s %s to %s %s after the package '
+                '#%s, branch again to resume' % (
+                    clt_from.name, clt_from.version, clt_to.name,
+                    clt_to.version, low))
+            return messages
+
+        rows += listings + acls
+        branched = len(todo) if high is None else branched + chunk_size
+        if progress:
+            elapsed = max(time.time() - start, 0.001)
+            rate = branched / elapsed
+            progress({
+                'packages': len(package_ids) - len(todo) + branched,
+                'total': len(package_ids),
+                'listings': state.listings,
+                'acls': state.acls,
+                'rate': rows / elapsed,
+                'eta': (len(todo) - branched) / rate if rate else None,
+            })
+
+    messages.append(
+        'SUCCESS: successfully branched (PackageListing) %s %s to %s %s: '
+        '%s listings created' % (
+            clt_from.name, clt_from.version, clt_to.name, clt_to.version,
+            state.listings))
+    messages.append(
+        'SUCCESS: successfully branched (PackageListingAcl) %s %s to %s %s: '
+        '%s ACLs created' % (
+            clt_from.name, clt_from.version, clt_to.name, clt_to.version,
+            state.acls))
 
     pkgdb2.lib.utils.log(session, None, 'branch.complete', dict(
         agent=user.username,
@@ -1847,6 +2304,67 @@ def add_branch(session, clt_from, clt_to, user):
     return messages
 
 
+def plan_branch(session, clt_from, clt_to, chunk_size=None):
+    """ Return what branching a collection into another would do, without
+    changing anything.
+
+    :arg session: session with which to connect to the database.
+    :arg clt_from: the ``branchname`` of the collection to branch from.
+    :arg clt_to: the ``branchname`` of the collection to branch to, it may
+        not exist yet.
+    :kwarg chunk_size: the number of packages branched per transaction,
+        defaults to the ``PKGDB2_BRANCH_CHUNK_SIZE`` configuration key.
+    :returns: a dict giving the ``exempted_namespaces``, the number of
+        ``listings`` and ``acls`` to create per namespace in
+        ``namespaces``, the (namespace, name) of the packages already
+        branched (``collisions``), the number of ``chunks`` and the
+        estimated number of seconds the branching takes (``estimate``),
+        based on the speed of the last branching, None if there was none.
+    :raises pkgdb2.lib.PkgdbException: The specified branch from is invalid
+        (does not exist).
+
+    """
+    try:
+        collection_from = model.Collection.by_name(session, clt_from)
+    except NoResultFound:
+        raise PkgdbException('Branch %s not found' % clt_from)
+
+    try:
+        clt_to_id = model.Collection.by_name(session, clt_to).id
+    except NoResultFound:
+        clt_to_id = None
+
+    if chunk_size is None:
+        chunk_size = pkgdb2.APP.config.get('PKGDB2_BRANCH_CHUNK_SIZE', 500)
+
+    policy = pkgdb2.APP.config.get('PKGDB2_NAMESPACE_POLICY')
+    exempted_namespaces = sorted(
+        namespace for namespace, specified_branches in policy.items()
+        if clt_to not in specified_branches
+    )
+
+    namespaces, collisions = model.PackageListing.branch_plan(
+        session, collection_from.id, clt_to_id, exempted_namespaces)
+    packages = len(model.PackageListing.branch_package_ids(
+        session, collection_from.id, exempted_namespaces))
+
+    rows = sum(
+        counts['listings'] + counts['acls'] for counts in namespaces.values())
+    estimate = None
+    last = model.BranchProgress.last_completed(session)
+    if last and last.rate:
+        estimate = rows / last.rate
+
+    return {
+        'exempted_namespaces': exempted_namespaces,
+        'namespaces': namespaces,
+        'collisions': collisions,
+        'packages': packages,
+        'chunks': max(packages - 1, 0) // chunk_size + 1,
+        'estimate': estimate,
+    }
+
+
 def add_new_branch_request(session, namespace, pkg_name, clt_to, user):
     """ Register a new branch request.
 
@@ -2170,19 +2688,53 @@ def notify(session, eol=False, name=None, version=None, acls=None):
         will return any person having one of these three acls for each
         package in the database.
         If the acls specified is ``all`` then all ACLs are used.
+    :return: a dict associating each `Package` to the sorted list of the
+        users to notify, the packages being in the order of the database,
+        as when they are streamed.
 
     """
-    output = {}
+    output = collections.OrderedDict()
     pkgs = model.notify(session=session, eol=eol, name=name,
                         version=version, acls=acls)
     for pkg in pkgs:
-        if pkg[0] in output:  # pragma: no cover
-            output[pkg[0]] += ',' + pkg[1]
-        else:
-            output[pkg[0]] = pkg[1]
+        if pkg[0] not in output:
+            output[pkg[0]] = set()
+        output[pkg[0]].add(pkg[1])
+
+    for pkg in output:
+        output[pkg] = sorted(output[pkg])
     return output
 
 
+def stream_notify(session, eol=False, name=None, version=None, acls=None):
+    """ Iterate over the packages and the users that should be notified
+    for each of them, the rows being fetched from the database by batches.
+
+    :arg session: the session to connect to the database with.
+    :kwarg eol: a boolean to specify wether the output should include End
+        Of Life releases or not.
+    :kwarg name: restricts the output to a specific collection name.
+    :kwarg version: restricts the output to a specific collection version.
+    :kwarg acls: a list of ACLs to filter the package/user to retrieve,
+        see `notify`.
+    :return: an iterator of (`Package`, users) tuples, users being the
+        sorted list of the users, ordered by package name.
+
+    """
+    package = None
+    users = set()
+    pkgs = model.notify(session=session, eol=eol, name=name,
+                        version=version, acls=acls, stream=True)
+    for pkg in pkgs:
+        if package is not None and pkg[0].id != package.id:
+            yield (package, sorted(users))
+            users = set()
+        package = pkg[0]
+        users.add(pkg[1])
+    if package is not None:
+        yield (package, sorted(users))
+
+
 def bugzilla(session, name=None, default_namespace='rpms'):
     """ Return the information to sync ACLs with bugzilla.
 
@@ -2191,116 +2743,124 @@ def bugzilla(session, name=None, default_namespace='rpms'):
     :kwarg default_namespace: the default namespace. If the package is in
         another namespace, that namespace will be included in the collection
         name used.
+    :return: a dict of dict giving the information of each package of each
+        collection, in the order of the database as when they are streamed.
 
     """
-    output = {}
-    pkgs = model.bugzilla(session=session, name=name)
+    output = collections.OrderedDict()
+    pkgs = model.bugzilla(
+        session=session, name=name, default_namespace=default_namespace)
+    for pkg in pkgs:
+        entry = _bugzilla_entry(pkg, default_namespace)
+        if entry['collection'] not in output:
+            output[entry['collection']] = collections.OrderedDict()
+        output[entry['collection']][entry['name']] = entry
+
+    return output
+
+
+def stream_bugzilla(session, name=None, default_namespace='rpms'):
+    """ Iterate over the information to sync ACLs with bugzilla, the rows
+    being fetched from the database by batches.
+
+    :arg session: the session to connect to the database with.
+    :kwarg name: restricts the output to a specific collection name.
+    :kwarg default_namespace: the default namespace, see `bugzilla`.
+    :return: an iterator of the dict of each package of each collection, as
+        returned by `bugzilla`, ordered by collection and package name.
+
+    """
+    pkgs = model.bugzilla(
+        session=session, name=name, stream=True,
+        default_namespace=default_namespace)
+    for pkg in pkgs:
+        yield _bugzilla_entry(pkg, default_namespace)
+
 
+def _bugzilla_entry(pkg, default_namespace):
+    """ Return the dict describing a package of a collection from a row
+    returned by `model.bugzilla`.
+
+    :arg pkg: the row returned by `model.bugzilla`.
+    :arg default_namespace: the default namespace. If the package is in
+        another namespace, that namespace will be included in the collection
+        name used.
+
+    """
     # 0  Collection.name
-    # 1  Collection.version
+    # 1  Package.namespace
     # 2  Package.name
     # 3  Package.summary
     # 4  PackageListing.point_of_contact
-    # 5  PackageListingAcl.fas_name
-    # 6  Collection.branchname
-    # 7  Package.namespace
+    # 5  cc list
+
+    collect_name = pkg[0]
+    if pkg[1] != default_namespace:
+        collect_name = '%s %s' % (collect_name, pkg[1].capitalize())
+
+    return {
+        'collection': collect_name,
+        'name': pkg[2],
+        'summary': pkg[3],
+        'poc': pkg[4],
+        'qa': '',
+        'cc': sorted(pkg[5].split(',')) if pkg[5] else [],
+    }
 
-    for pkg in pkgs:
-        version = pkg[1]
-        if pkg[1] == 'devel':
-            if pkg[4] != 'orphan':
-                version = 10000
-            else:
-                version = 0
-
-        collect_name = pkg[0]
-        if pkg[7] != default_namespace:
-            collect_name = '%s %s' % (collect_name, pkg[7].capitalize())
-
-        if collect_name in output:
-            if pkg[2] in output[collect_name]:
-                # Check poc
-                if pkg[4] == 'orphan':
-                    pass
-                elif output[collect_name][pkg[2]]['poc'] == 'orphan':
-                    output[collect_name][pkg[2]]['poc'] = pkg[4]
-                    output[collect_name][pkg[2]]['version'] = version
-                elif int(version) > int(output[collect_name][pkg[2]]['version']):
-                    output[collect_name][pkg[2]]['poc'] = pkg[4]
-                    output[collect_name][pkg[2]]['version'] = version
-                # If #5 is not poc, add it to cc
-                if pkg[5] != 'orphan' \
-                        and pkg[5] != output[collect_name][pkg[2]]['poc'] \
-                        and pkg[5] not in output[collect_name][pkg[2]]['cc']:
-                    if output[collect_name][pkg[2]]['cc']:
-                        output[collect_name][pkg[2]]['cc'] += ','
-                    output[collect_name][pkg[2]]['cc'] += pkg[5]
-            else:
-                cc = ''
-                if pkg[5] != pkg[4]:  # pragma: no cover
-                    cc = pkg[5]
-                output[collect_name][pkg[2]] = {
-                    'collection': collect_name,
-                    'name': pkg[2],
-                    'summary': pkg[3],
-                    'poc': pkg[4],
-                    'qa': '',
-                    'cc': cc,
-                    'version': version,
-                }
-        else:
-            cc = ''
-            if pkg[5] != pkg[4]:
-                cc = pkg[5]
-            output[collect_name] = {
-                pkg[2]: {
-                    'collection': collect_name,
-                    'name': pkg[2],
-                    'summary': pkg[3],
-                    'poc': pkg[4],
-                    'qa': '',
-                    'cc': cc,
-                    'version': version,
-                }
-            }
 
-    return output
+def _split_vcs_acls(usernames):
+    """ Split the comma separated list of users and groups returned by
+    `model.vcs_acls` into the sorted lists of the groups (without their
+    ``group::`` prefix) and of the users.
+
+    :arg usernames: the comma separated list of users and groups, or None.
+
+    """
+    groups = []
+    users = []
+    for username in sorted((usernames or '').split(',')):
+        if username.startswith('group::'):
+            groups.append(username.replace('group::', ''))
+        elif username:
+            users.append(username)
+    return groups, users
 
 
 def _vcs_acls_json(packages, skip_pp=None):
-    """ For a given list of package/user/branch build a dict of dict
+    """ For a given list of package/users/branch build a dict of dict
     representating of who has commit access to which package.
 
     The output dict is something like:
 
     {
-      pkg1: {
-        branch1: {
-          name: pkg1,
-          branch: branch1,
-          people: [user1, user2],
-          groups: [group1, group2]
-        },
-        branch2: {
-          name: pkg1,
-          branch: branch2,
-          people: [user1],
-          groups: [group1, group3]
+      namespace: {
+        pkg1: {
+          branch1: {
+            commit: {
+              people: [user1, user2],
+              groups: [group1, group2]
+            }
+          },
+          branch2: {
+            commit: {
+              people: [user1],
+              groups: [group1, group3]
+            }
+          },
         },
-      },
-      pkg2:
-      ...
+        pkg2:
+        ...
+      }
     }
     """
     output = {}
-    for pkgname, username, branchname, namespace in packages:
-        user = None
-        group = None
+    ppkger_grp = pkgdb2.APP.config.get(
+        'PROVEN_PKGER_GROUP', 'provenpackager')
+    for pkgname, usernames, branchname, namespace in packages:
+        groups, users = _split_vcs_acls(usernames)
 
-        if username and username.startswith('group::'):
-                group = username.replace('group::', '')
-        else:
-            user = username
+        if skip_pp and pkgname not in skip_pp and ppkger_grp:
+            groups.insert(0, ppkger_grp)
 
         if namespace not in output:
             output[namespace] = {}
@@ -2308,29 +2868,15 @@ def _vcs_acls_json(packages, skip_pp=None):
         if pkgname not in output[namespace]:
             output[namespace][pkgname] = {}
 
-        if branchname not in output[namespace][pkgname]:
-            groups = []
-            ppkger_grp = pkgdb2.APP.config.get(
-                'PROVEN_PKGER_GROUP', 'provenpackager')
-            if skip_pp and pkgname not in skip_pp and ppkger_grp:
-                groups.append(ppkger_grp)
-
-            output[namespace][pkgname][branchname] = {
-                'commit': {'groups': groups, 'people': []},
-            }
-
-        if group:
-            output[namespace][pkgname][branchname]['commit']['groups'].append(
-                group)
-        if user:
-            output[namespace][pkgname][branchname]['commit']['people'].append(
-                user)
+        output[namespace][pkgname][branchname] = {
+            'commit': {'groups': groups, 'people': users},
+        }
     return output
 
 
 def _vcs_acls_text(packages, skip_pp=None):
-    """ For a given list of package/user/branch return a dict of dict of dict
-    listing for each package, for each branch who has access to what.
+    """ For a given list of package/users/branch return a dict of dict of
+    dict listing for each package, for each branch who has access to what.
 
     The output dict is something like:
 
@@ -2339,8 +2885,8 @@ def _vcs_acls_text(packages, skip_pp=None):
         branch1: {
           name: "pkg1",
           branch: "branch1",
-          user: "user1, user2",
-          group: "@group1, @group2",
+          user: "user1,user2",
+          group: "@group1, @group2"
         },
         branch2: {
           name: "pkg1",
@@ -2354,54 +2900,36 @@ def _vcs_acls_text(packages, skip_pp=None):
       }
     }
 
+    The packages and branches are kept in the order of the rows.
+
     """
-    output = {}
-    for pkgname, username, branchname, namespace in packages:
-        user = None
-        group = None
-        if username and username.startswith('group::'):
-                group = username.replace('group::', '@')
+    output = collections.OrderedDict()
+    ppkger_grp = pkgdb2.APP.config.get(
+        'PROVEN_PKGER_GROUP', 'provenpackager')
+    for pkgname, usernames, branchname, namespace in packages:
+        groups, users = _split_vcs_acls(usernames)
+        groups = ['@%s' % group for group in groups]
+
+        if pkgname not in output:
+            output[pkgname] = collections.OrderedDict()
+
+        if branchname in output[pkgname]:
+            # Same package name and branch in another namespace
+            entry = output[pkgname][branchname]
+            entry['user'] = ','.join(
+                [user for user in [entry['user']] + users if user])
+            entry['group'] = ','.join(
+                [group for group in [entry['group']] + groups if group])
         else:
-            user = username
-
-        groups = ''
-        ppkger_grp = pkgdb2.APP.config.get(
-            'PROVEN_PKGER_GROUP', 'provenpackager')
-        if pkgname not in skip_pp and ppkger_grp:
-            groups = '@%s' % ppkger_grp
-
-        if pkgname in output:
-            if branchname in output[pkgname]:
-                if user:
-                    if output[pkgname][branchname]['user']:
-                        output[pkgname][branchname]['user'] += ','
-                    output[pkgname][branchname]['user'] += user
-                elif group:  # pragma: no cover
-                    if output[pkgname][branchname]['group'].strip():
-                        output[pkgname][branchname]['group'] += ','
-                    output[pkgname][branchname]['group'] += group
-            else:
-                if group and groups:  # pragma: no cover
-                    group = ',' + group
-
-                output[pkgname][branchname] = {
-                    'name': pkgname,
-                    'user': user or '',
-                    'group': groups + (group or ''),
-                    'branch': branchname,
-                    'namespace': namespace,
-                }
-        else:
-            if group and groups:
-                group = ',' + group
-            output[pkgname] = {
-                branchname: {
-                    'name': pkgname,
-                    'user': user or '',
-                    'group': groups + (group or ''),
-                    'branch': branchname,
-                    'namespace': namespace,
-                }
+            if pkgname not in skip_pp and ppkger_grp:
+                groups.insert(0, '@%s' % ppkger_grp)
+
+            output[pkgname][branchname] = {
+                'name': pkgname,
+                'user': ','.join(users),
+                'group': ','.join(groups),
+                'branch': branchname,
+                'namespace': namespace,
             }
     return output
 
@@ -2432,6 +2960,249 @@ def vcs_acls(
     return output
 
 
+def stream_vcs_acls(
+        session, eol=False, collection=None, skip_pp=None, namespace=None):
+    """ Iterate over the lines of the text export of the VCS ACLs, the rows
+    being fetched from the database by batches.
+
+    :arg session: the session to connect to the database with.
+    :kwarg eol: A boolean specifying whether to include information about
+        End Of Life collections or not. Defaults to ``False``.
+    :kwarg collection: Restrict the VCS info to a specific collection.
+    :kwarg skip_pp: A boolean to specify if we want to skip provenpackager
+        for some packages
+    :kwarg namespace: Restrict the ACLs returned to a given namespace
+    :return: an iterator of the lines, as returned by `format_vcs_acls`,
+        ordered by package and branch name.
+
+    """
+    rows = []
+    pkgs = model.vcs_acls(
+        session=session, eol=eol, collection=collection, namespace=namespace,
+        stream=True)
+    for pkg in pkgs:
+        if rows and (pkg[0], pkg[2]) != (rows[0][0], rows[0][2]):
+            for line in format_vcs_acls(_vcs_acls_text(rows, skip_pp)):
+                yield line
+            rows = []
+        rows.append(pkg)
+
+    for line in format_vcs_acls(_vcs_acls_text(rows, skip_pp)):
+        yield line
+
+
+def format_vcs_acls(packages, oformat='text'):
+    """ Format the output of `vcs_acls` the way it is exported by the API.
+
+    :arg packages: the output of `vcs_acls` in the specified format.
+    :kwarg oformat: Output format of the data, defaults to `text` can be
+        `json`.
+    :return: the dict with a title for `json`, the list of lines otherwise,
+        in the order of the database as when they are streamed.
+
+    """
+    output = []
+    if oformat == 'json':
+        output = packages
+        output['title'] = 'Fedora Package Database -- VCS ACLs'
+    else:
+        for package in packages:
+            for branch in packages[package]:
+                if packages[package][branch]['group']:
+                    packages[package][branch]['group'] += ','
+                output.append(
+                    'avail | %(group)s%(user)s | '
+                    '%(namespace)s/%(name)s/%(branch)s'
+                    % (packages[package][branch]))
+    return output
+
+
+def refresh_vcs_snapshot(session):
+    """ Generate a new snapshot of the VCS ACLs of the active collections.
+
+    If the ACLs did not change since the latest snapshot, this snapshot is
+    marked as up to date instead of creating a new generation.
+
+    This is done once the changes are committed, from a transaction started
+    afterward, a single thread of the process regenerating the snapshot at
+    a time. The processes regenerating it at the same time cannot create
+    two generations for the same changes.
+
+    :arg session: the session to connect to the database with.
+    :return: the `VcsSnapshot` now up to date.
+    :raises sqlalchemy.exc.IntegrityError: Another process regenerated the
+        snapshot for the same changes.
+
+    """
+    with _VCS_SNAPSHOT_LOCK:
+        return _refresh_vcs_snapshot(session)
+
+
+def _refresh_vcs_snapshot(session):
+    """ Generate a new snapshot of the VCS ACLs, see
+    `refresh_vcs_snapshot`.
+    """
+    # Retrieve the number of changes committed first so that anything
+    # committed while the snapshot is being generated makes it outdated
+    change_count = model.ChangeCounter.current(session)[0]
+
+    previous = model.VcsSnapshot.latest(session)
+    if previous and previous.change_count >= change_count:
+        # Already regenerated by another thread
+        return previous
+
+    skip_pp = pkgdb2.APP.config.get('PKGS_NOT_PROVENPACKAGER', None)
+    pkgs = model.vcs_acls(session=session)
+    text = '\n'.join(format_vcs_acls(_vcs_acls_text(pkgs, skip_pp), 'text'))
+    data = json.dumps(
+        format_vcs_acls(_vcs_acls_json(pkgs, skip_pp), 'json'),
+        sort_keys=True)
+
+    if previous and previous.text == text and previous.json == data:
+        previous.change_count = change_count
+        session.add(previous)
+        session.flush()
+        return previous
+
+    snapshot = model.VcsSnapshot(
+        change_count=change_count, text=text, json=data,
+        date_created=datetime.utcnow())
+    session.add(snapshot)
+    session.flush()
+
+    if previous:
+        old_acls = _flatten_vcs_acls(json.loads(previous.json))
+        new_acls = _flatten_vcs_acls(json.loads(data))
+        for key in sorted(set(old_acls) | set(new_acls)):
+            if old_acls.get(key) == new_acls.get(key):
+                continue
+            acls = None
+            if key in new_acls:
+                acls = json.dumps(new_acls[key], sort_keys=True)
+            session.add(model.VcsChange(
+                generation=snapshot.generation,
+                namespace=key[0],
+                package=key[1],
+                branch=key[2],
+                acls=acls,
+                date_created=snapshot.date_created,
+            ))
+        session.flush()
+
+    model.VcsSnapshot.prune(
+        session, max(1, pkgdb2.APP.config.get('PKGDB2_VCS_SNAPSHOT_KEEP', 3)))
+    model.VcsChange.prune(
+        session,
+        snapshot.date_created - timedelta(
+            days=pkgdb2.APP.config.get('PKGDB2_VCS_CHANGES_DAYS', 30)))
+    return snapshot
+
+
+def _flatten_vcs_acls(acls):
+    """ Return a dict associating the (namespace, package, branch) tuples
+    to their commit ACLs from the json export of the VCS ACLs.
+
+    :arg acls: the dict of the json export of the VCS ACLs.
+
+    """
+    output = {}
+    for namespace in acls:
+        if namespace == 'title':
+            continue
+        for pkgname in acls[namespace]:
+            for branch in acls[namespace][pkgname]:
+                output[(namespace, pkgname, branch)] = \
+                    acls[namespace][pkgname][branch]['commit']
+    return output
+
+
+def get_vcs_snapshot(session):
+    """ Return the latest snapshot of the VCS ACLs of the active
+    collections.
+
+    Nothing is written to the database, if there is no snapshot yet its
+    generation is left to the background thread.
+
+    :arg session: the session to connect to the database with.
+    :return: the latest `VcsSnapshot` or None if there is none yet.
+
+    """
+    snapshot = model.VcsSnapshot.latest(session)
+    if snapshot is None:
+        pkgdb2.lib.utils.schedule_vcs_snapshot_refresh()
+    return snapshot
+
+
+def get_vcs_changes(
+        session, since=None, since_date=None, namespace=None):
+    """ Return the commit ACLs of the branches of the active collections
+    which changed since the specified generation or date.
+
+    If the journal of the changes does not go back far enough, the ACLs of
+    every branch are returned and flagged as such with ``full``.
+
+    :arg session: the session to connect to the database with.
+    :kwarg since: the generation of the VCS ACLs snapshot known by the
+        client.
+    :kwarg since_date: a datetime, alternative to ``since`` to retrieve the
+        changes made after this date.
+    :kwarg namespace: Restrict the changes returned to a given namespace.
+    :return: a dict with the current ``generation``, the generation the
+        changes are relative to as ``since``, whether the output contains
+        every branch as ``full`` and the ``changes`` as a dict of dict of
+        dict listing for each namespace, for each package, for each branch
+        its commit ACLs, or None if the branch was removed.
+    :raises pkgdb2.lib.PkgdbException: There is no snapshot of the VCS
+        ACLs yet.
+
+    """
+    snapshot = get_vcs_snapshot(session)
+    if snapshot is None:
+        raise PkgdbException(
+            'The VCS ACLs are not available yet, try again later')
+
+    if since is None and since_date is not None:
+        since = model.VcsChange.generation_at(session, since_date)
+
+    full = True
+    if since is not None and since <= snapshot.generation:
+        first = model.VcsChange.first_generation(session)
+        if first is None:
+            full = since != snapshot.generation
+        else:
+            full = since < first - 1
+
+    if full:
+        changes = dict(
+            (key, value)
+            for key, value in _flatten_vcs_acls(
+                json.loads(snapshot.json)).items()
+            if not namespace or key[0] == namespace
+        )
+    else:
+        changes = {}
+        for change in model.VcsChange.search(session, since, namespace):
+            acls = None
+            if change.acls is not None:
+                acls = json.loads(change.acls)
+            changes[(change.namespace, change.package, change.branch)] = \
+                acls
+
+    output = {}
+    for (ns, pkgname, branch), acls in changes.items():
+        value = None
+        if acls is not None:
+            value = {'commit': acls}
+        output.setdefault(ns, {}).setdefault(pkgname, {})[branch] = value
+
+    return {
+        'generation': snapshot.generation,
+        'since': since,
+        'full': full,
+        'changes': output,
+    }
+
+
 def set_critpath_packages(
         session, namespace, pkg_name, pkg_branch, critpath=True, user=None):
     """ Set the provided critpath status on a specified package.
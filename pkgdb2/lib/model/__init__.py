@@ -29,6 +29,7 @@ import pkg_resources
 import datetime
 import json
 import logging
+import sys
 import time
 
 import sqlalchemy as sa
@@ -36,10 +37,15 @@ from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm import backref
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import subqueryload
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import relation
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import or_
 from sqlalchemy.sql import and_
 from sqlalchemy.sql import not_
@@ -50,6 +56,45 @@ ERROR_LOG = logging.getLogger('pkgdb2.lib.model.packages')
 
 DEFAULT_GROUPS = {'provenpackager': {'commit': True}}
 
+# Number of rows fetched at once when streaming the results of a query
+STREAM_BATCH_SIZE = 1000
+# Key set in the info dict of a session with the log entries to insert
+# before it is committed
+LOGS_PENDING = 'pkgdb2.logs.pending'
+# Key set in the info dict of a session which logged changes, for the
+# change counter to be incremented when it is committed
+LOGS_CHANGED = 'pkgdb2.logs.changed'
+# Number of log entries inserted per INSERT statement, keeping the number
+# of parameters of a statement below the limit of SQLite
+LOGS_BATCH_SIZE = 200
+
+
+def _after(columns, values, descending=False):
+    """ Return the condition selecting the rows coming after the one having
+    the given values, the rows being sorted on the given columns.
+
+    This allows to page through the results by keyset instead of using an
+    offset, which requires the database to read all the rows skipped.
+
+    :arg columns: the list of columns the rows are sorted on, the last one
+        being unique.
+    :arg values: the values of these columns for the last row seen.
+    :kwarg descending: a boolean specifying whether the rows are sorted in
+        descending order.
+
+    """
+    condition = None
+    for column, value in reversed(zip(columns, values)):
+        if descending:
+            after = column < value
+        else:
+            after = column > value
+        if condition is None:
+            condition = after
+        else:
+            condition = or_(after, and_(column == value, condition))
+    return condition
+
 
 ## Apparently some of our methods have too few public methods
 # pylint: disable=R0903
@@ -308,7 +353,8 @@ class PackageListingAcl(BASE):
         sa.Integer,
         sa.ForeignKey(
             'package_listing.id', ondelete='CASCADE', onupdate='CASCADE'),
-        nullable=False)
+        nullable=False,
+        index=True)
     acl = sa.Column(
         sa.String(50),
         sa.ForeignKey('pkg_acls.status', onupdate='CASCADE'),
@@ -501,6 +547,48 @@ class PackageListingAcl(BASE):
             )
         return query.all()
 
+    @classmethod
+    def get_acls_packages(cls, session, user, packages, status='Approved'):
+        """ Return the ACLs of the specified user on all the specified
+        packages, at once.
+
+        :arg session: the database session used to connect to the
+            database.
+        :arg user: the username of the packager whose ACL are asked for.
+        :arg packages: a list of (namespace, name) of the packages.
+        :kwarg status: status of the ACLs to be returned.
+        :returns: a list of (namespace, name, branchname, acl) tuples.
+
+        """
+        packages = set(packages)
+        if not packages:
+            return []
+
+        query = session.query(
+            Package.namespace, Package.name, Collection.branchname, cls.acl
+        ).filter(
+            cls.packagelisting_id == PackageListing.id
+        ).filter(
+            PackageListing.package_id == Package.id
+        ).filter(
+            PackageListing.collection_id == Collection.id
+        ).filter(
+            cls.fas_name == user
+        ).filter(
+            Package.namespace.in_(set(pkg[0] for pkg in packages))
+        ).filter(
+            Package.name.in_(set(pkg[1] for pkg in packages))
+        )
+
+        if status:
+            query = query.filter(cls.status == status)
+
+        # The namespaces and names are filtered separately, only keep
+        # the combinations asked for
+        return [
+            tuple(row) for row in query.all() if (row[0], row[1]) in packages
+        ]
+
     @classmethod
     def get(cls, session, user, packagelisting_id, acl):
         """ Retrieve the PersonPackageListing which associates a person
@@ -952,6 +1040,220 @@ class PackageListing(BASE):
             PackageListing.collection_id == collectionid
         ).all()
 
+    @classmethod
+    def branch_package_ids(cls, session, clt_from_id, exempted_namespaces):
+        """ Return the sorted identifiers of the packages whose listing is
+        copied when branching the specified collection.
+
+        :arg session: the session to connect to the database with
+        :arg clt_from_id: the identifier of the collection branched from
+        :arg exempted_namespaces: the namespaces of the packages not to
+            branch
+
+        """
+        query = session.query(
+            cls.package_id
+        ).filter(
+            cls.package_id == Package.id
+        ).filter(
+            cls.collection_id == clt_from_id
+        ).filter(
+            cls.status.in_(['Approved', 'Orphaned'])
+        ).order_by(
+            cls.package_id
+        )
+
+        if exempted_namespaces:
+            query = query.filter(
+                not_(Package.namespace.in_(exempted_namespaces)))
+
+        return [row.package_id for row in query.all()]
+
+    @classmethod
+    def branch_packages(cls, session, clt_from_id, clt_to_id,
+                        exempted_namespaces, low=None, high=None):
+        """ Copy the listings and the ACLs of the packages whose identifier
+        is in the specified range from a collection to another, skipping
+        those already present in the collection branched to.
+
+        :arg session: the session to connect to the database with
+        :arg clt_from_id: the identifier of the collection branched from
+        :arg clt_to_id: the identifier of the collection branched to
+        :arg exempted_namespaces: the namespaces of the packages not to
+            branch
+        :kwarg low: the identifier after which the packages are copied
+        :kwarg high: the identifier up to which the packages are copied
+        :returns: the number of listings and of ACLs created
+
+        """
+        listing = cls.__table__
+        source = listing.alias('source')
+        target = listing.alias('target')
+        package = Package.__table__
+
+        def conditions(column):
+            """ Return the conditions on the packages to copy. """
+            output = []
+            if low is not None:
+                output.append(column > low)
+            if high is not None:
+                output.append(column <= high)
+            if exempted_namespaces:
+                output.append(not_(package.c.namespace.in_(
+                    exempted_namespaces)))
+            return output
+
+        select = sa.select([
+            source.c.package_id,
+            source.c.point_of_contact,
+            sa.literal(clt_to_id, sa.Integer),
+            source.c.status,
+            source.c.critpath,
+            source.c.status_change,
+        ]).where(and_(
+            package.c.id == source.c.package_id,
+            source.c.collection_id == clt_from_id,
+            source.c.status.in_(['Approved', 'Orphaned']),
+            ~sa.exists().where(and_(
+                target.c.package_id == source.c.package_id,
+                target.c.collection_id == clt_to_id,
+            )),
+            *conditions(source.c.package_id)
+        ))
+        listings = session.execute(listing.insert().from_select(
+            ['package_id', 'point_of_contact', 'collection_id', 'status',
+             'critpath', 'status_change'],
+            select)).rowcount
+
+        acl = PackageListingAcl.__table__
+        existing = acl.alias('existing')
+        select = sa.select([
+            acl.c.fas_name,
+            target.c.id,
+            acl.c.acl,
+            acl.c.status,
+            sa.literal(datetime.datetime.utcnow(), sa.DateTime),
+        ]).where(and_(
+            acl.c.packagelisting_id == source.c.id,
+            source.c.collection_id == clt_from_id,
+            target.c.collection_id == clt_to_id,
+            target.c.package_id == source.c.package_id,
+            package.c.id == source.c.package_id,
+            ~sa.exists().where(and_(
+                existing.c.packagelisting_id == target.c.id,
+                existing.c.fas_name == acl.c.fas_name,
+                existing.c.acl == acl.c.acl,
+            )),
+            *conditions(source.c.package_id)
+        ))
+        acls = session.execute(acl.insert().from_select(
+            ['fas_name', 'packagelisting_id', 'acl', 'status',
+             'date_created'],
+            select)).rowcount
+
+        return listings, acls
+
+    @classmethod
+    def branch_plan(cls, session, clt_from_id, clt_to_id,
+                    exempted_namespaces):
+        """ Return what branching a collection into another would do,
+        without changing anything.
+
+        :arg session: the session to connect to the database with
+        :arg clt_from_id: the identifier of the collection branched from
+        :arg clt_to_id: the identifier of the collection branched to, None
+            if it does not exist yet
+        :arg exempted_namespaces: the namespaces of the packages not to
+            branch
+        :returns: a tuple of the dict giving per namespace the number of
+            listings and of ACLs to create and of the list of the
+            (namespace, name) of the packages already having a listing in
+            the collection branched to
+
+        """
+        target = aliased(cls)
+        existing = aliased(PackageListingAcl)
+        on_target = sa.exists().where(and_(
+            target.package_id == cls.package_id,
+            target.collection_id == clt_to_id,
+        ))
+
+        def in_scope(query):
+            """ Restrict the query to the listings branched. """
+            query = query.filter(
+                cls.package_id == Package.id
+            ).filter(
+                cls.collection_id == clt_from_id
+            ).filter(
+                cls.status.in_(['Approved', 'Orphaned'])
+            )
+            if exempted_namespaces:
+                query = query.filter(
+                    not_(Package.namespace.in_(exempted_namespaces)))
+            return query
+
+        plan = {}
+
+        def add(namespace, key, count):
+            """ Add the count to the plan of the namespace. """
+            if namespace not in plan:
+                plan[namespace] = {'listings': 0, 'acls': 0}
+            plan[namespace][key] += count
+
+        # The listings created with all the ACLs of their source listing
+        for namespace, count in in_scope(session.query(
+                Package.namespace, sa.func.count(cls.id)
+        )).filter(~on_target).group_by(Package.namespace).all():
+            add(namespace, 'listings', count)
+
+        for namespace, count in in_scope(session.query(
+                Package.namespace, sa.func.count(PackageListingAcl.id)
+        )).filter(
+            PackageListingAcl.packagelisting_id == cls.id
+        ).filter(~on_target).group_by(Package.namespace).all():
+            add(namespace, 'acls', count)
+
+        if clt_to_id is None:
+            return plan, []
+
+        collisions = [
+            (row.namespace, row.name)
+            for row in in_scope(session.query(
+                Package.namespace, Package.name
+            )).filter(on_target).order_by(
+                Package.namespace, Package.name
+            ).all()
+        ]
+
+        # The ACLs missing on the listings already in the collection
+        # branched to, whatever the status of their source listing
+        query = session.query(
+            Package.namespace, sa.func.count(PackageListingAcl.id)
+        ).filter(
+            PackageListingAcl.packagelisting_id == cls.id
+        ).filter(
+            cls.package_id == Package.id
+        ).filter(
+            cls.collection_id == clt_from_id
+        ).filter(
+            target.package_id == cls.package_id
+        ).filter(
+            target.collection_id == clt_to_id
+        ).filter(
+            ~sa.exists().where(and_(
+                existing.packagelisting_id == target.id,
+                existing.fas_name == PackageListingAcl.fas_name,
+                existing.acl == PackageListingAcl.acl,
+            ))
+        )
+        if exempted_namespaces:
+            query = query.filter(
+                not_(Package.namespace.in_(exempted_namespaces)))
+        for namespace, count in query.group_by(Package.namespace).all():
+            add(namespace, 'acls', count)
+
+        return plan, collisions
+
     @classmethod
     def search(cls, session, pkg_name, clt_id, pkg_owner=None,
                pkg_status=None, critpath=None, offset=None, limit=None,
@@ -1008,7 +1310,7 @@ class PackageListing(BASE):
 
     @classmethod
     def search_packagers(cls, session, pattern, eol=False, offset=None,
-                         limit=None, count=False):
+                         limit=None, count=False, after=None):
         """ Return all the packagers whose name match the pattern.
         Are packagers user having at least one commit ACL on one package.
 
@@ -1024,6 +1326,8 @@ class PackageListing(BASE):
         :kwarg limit: the number of results to return
         :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+        :kwarg after: a tuple of the name of the last packager seen, to
+            return only the packagers coming after it.
 
         """
         query = session.query(
@@ -1051,6 +1355,9 @@ class PackageListing(BASE):
         if count:
             return query.count()
 
+        if after:
+            query = query.filter(_after([PackageListingAcl.fas_name], after))
+
         if offset:
             query = query.offset(offset)
         if limit:
@@ -1185,6 +1492,46 @@ class Package(BASE):
             Package.namespace == namespace
         ).one()
 
+    @classmethod
+    def load_listings(cls, session, packages):
+        """ Load the listings of the given packages together with their
+        collection and ACLs, using a constant number of queries instead of
+        a few queries per package when serializing them with `to_json`.
+
+        :arg session: the session to connect to the database with.
+        :arg packages: the list of `Package` whose listings to load.
+            The packages whose listings are already loaded are left as
+            they are.
+        :return: the list of packages provided.
+
+        """
+        to_load = dict(
+            (pkg.id, []) for pkg in packages
+            if 'listings' not in pkg.__dict__
+        )
+        if not to_load:
+            return packages
+
+        listings = session.query(
+            PackageListing
+        ).filter(
+            PackageListing.package_id.in_(to_load.keys())
+        ).options(
+            joinedload(PackageListing.collection),
+            subqueryload(PackageListing.acls),
+        ).order_by(
+            PackageListing.id
+        ).all()
+
+        for listing in listings:
+            to_load[listing.package_id].append(listing)
+
+        for pkg in packages:
+            if pkg.id in to_load:
+                set_committed_value(pkg, 'listings', to_load[pkg.id])
+
+        return packages
+
     @property
     def requests_open(self):
         """ Returns the list of open requests (Pending or Awaiting Review)
@@ -1241,11 +1588,6 @@ class Package(BASE):
             monitor = False
         return monitor
 
-    def __hash__(self):
-        """ Returns the name of the package as hash. """
-        ord3 = lambda arg: '%.3d' % ord(arg)
-        return int(''.join([ord3(char) for char in self.name]))
-
     def __repr__(self):
         """ The string representation of this object.
 
@@ -1287,6 +1629,92 @@ class Package(BASE):
         """
         return session.query(cls).all()
 
+    @classmethod
+    def all_names(cls, session):
+        """ Return the namespace and name of all the Packages present in
+        the database, without loading the Packages themselves.
+
+        :arg cls: the class object
+        :arg session: the database session used to query the information.
+
+        """
+        return session.query(
+            cls.namespace, cls.name
+        ).order_by(cls.name, cls.namespace).all()
+
+    @classmethod
+    def get_info(cls, session, namespace, status='Approved', names=None):
+        """ Return the identifier, name, summary, description and upstream
+        URL of the Packages of the namespace, without loading the Packages
+        themselves.
+
+        :arg cls: the class object
+        :arg session: the database session used to query the information.
+        :arg namespace: the namespace of the packages.
+        :kwarg status: the status of the packages.
+        :kwarg names: restrict the packages to these names.
+
+        """
+        query = session.query(
+            cls.id, cls.name, cls.summary, cls.description, cls.upstream_url
+        ).filter(
+            cls.namespace == namespace
+        ).filter(
+            cls.status == status
+        ).order_by(cls.name)
+
+        if names is not None:
+            if not names:
+                return []
+            # Filtered in python as the list can be long
+            names = set(names)
+            return [row for row in query.all() if row.name in names]
+
+        return query.all()
+
+    @classmethod
+    def update_info(cls, session, changes):
+        """ Update the summary, description and upstream URL of many
+        Packages at once, without loading them.
+
+        :arg cls: the class object
+        :arg session: the database session used to query the information.
+        :arg changes: a list of dict giving the ``id`` of the package and
+            its new ``summary``, ``description`` and ``upstream_url``.
+
+        """
+        if not changes:
+            return
+        statement = cls.__table__.update().where(
+            cls.__table__.c.id == sa.bindparam('b_id')
+        ).values(
+            summary=sa.bindparam('b_summary'),
+            description=sa.bindparam('b_description'),
+            upstream_url=sa.bindparam('b_upstream_url'),
+        )
+        session.execute(statement, [
+            dict(('b_%s' % key, value) for key, value in change.items())
+            for change in changes
+        ])
+
+    @classmethod
+    def by_ids(cls, session, ids):
+        """ Return the Packages having the provided identifiers, refreshed
+        from the database.
+
+        :arg cls: the class object
+        :arg session: the database session used to query the information.
+        :arg ids: the identifiers of the packages.
+
+        """
+        if not ids:
+            return []
+        return session.query(
+            cls
+        ).filter(
+            cls.id.in_(ids)
+        ).populate_existing().order_by(cls.name).all()
+
     @classmethod
     def get_monitored(cls, session):
         """ Return the list of all Packages present in the database and
@@ -1345,14 +1773,17 @@ class Package(BASE):
     def search(
             cls, session, namespace, pkg_name, pkg_poc=None, pkg_status=None,
             pkg_branch=None, orphaned=None, critpath=None, eol=False,
-            offset=None, limit=None, count=False, case_sensitive=True):
+            offset=None, limit=None, count=False, case_sensitive=True,
+            with_count=False, after=None):
         """ Search the Packages for the one fitting the given pattern.
 
         :arg session: session with which to connect to the database
-        :arg pkg_name: the name of the package
+        :arg pkg_name: the name of the package, or a list of names, the
+            packages matching any of them are returned.
         :kwarg pkg_poc: name of the new point of contact for the package
-        :kwarg pkg_status: status of the package
-        :kwarg pkg_branch: branchname of the collection to search.
+        :kwarg pkg_status: status of the package, or a list of statuses.
+        :kwarg pkg_branch: branchname of the collection to search, or a list
+            of branchnames.
         :kwarg orphaned: a boolean specifying if the search should be
             restricted to only orphaned or not-orphaned packages.
         :kwarg critpath: Boolean to retrict the search to critpath packages.
@@ -1368,28 +1799,29 @@ class Package(BASE):
             if true, returns the data if false (default).
         :kwarg case_sensitive: a boolean to specify doing a case insensitive
             search. Defaults to True.
+        :kwarg with_count: a boolean to return a tuple of the packages and
+            of the total number of packages matching, computed by the same
+            query. Defaults to False.
+        :kwarg after: a tuple of the name and identifier of the last
+            package seen, to return only the packages coming after it.
 
         """
 
+        if isinstance(pkg_name, basestring):
+            pkg_name = [pkg_name]
+        if isinstance(pkg_status, basestring):
+            pkg_status = [pkg_status]
+        if isinstance(pkg_branch, basestring):
+            pkg_branch = [pkg_branch]
+
         query = session.query(
             sa.func.distinct(Package.id)
         )
-        if '%' not in pkg_name and case_sensitive:
-            query = query.filter(
-                Package.name == pkg_name
-            )
-        elif '%' in pkg_name and case_sensitive:
-            query = query.filter(
-                Package.name.like(pkg_name)
-            )
-        elif '%' not in pkg_name and not case_sensitive:
-            query = query.filter(
-                sa.func.lower(Package.name) == sa.func.lower(pkg_name)
-            )
-        else:
-            query = query.filter(
-                Package.name.ilike(pkg_name)
-            )
+
+        query = query.filter(or_(*[
+            _package_name_condition(session, name, case_sensitive)
+            for name in pkg_name
+        ]))
 
         if namespace:
             query = query.filter(
@@ -1409,7 +1841,7 @@ class Package(BASE):
             query = query.filter(
                 PackageListing.package_id == Package.id
             ).filter(
-                PackageListing.status == pkg_status
+                PackageListing.status.in_(pkg_status)
             ).filter(
                 PackageListing.collection_id == Collection.id
             ).filter(
@@ -1422,7 +1854,7 @@ class Package(BASE):
             ).filter(
                 PackageListing.collection_id == Collection.id
             ).filter(
-                Collection.branchname == pkg_branch
+                Collection.branchname.in_(pkg_branch)
             )
 
         if orphaned is not None:
@@ -1458,20 +1890,41 @@ class Package(BASE):
         final_query = session.query(
             Package
         ).filter(
-            Package.id.in_(query.subquery())
+            Package.id.in_(query.correlate(None).subquery())
         ).order_by(
-            Package.name
+            Package.name,
+            Package.id,
         )
 
         if count:
             return final_query.count()
 
+        page_query = final_query
+        if after:
+            page_query = page_query.filter(
+                _after([Package.name, Package.id], after))
+        elif with_count:
+            # The window is computed before the offset and limit apply
+            page_query = page_query.add_columns(sa.func.count().over())
+
         if offset:
-            final_query = final_query.offset(offset)
+            page_query = page_query.offset(offset)
         if limit:
-            final_query = final_query.limit(limit)
-
-        return final_query.all()
+            page_query = page_query.limit(limit)
+
+        if not with_count:
+            return page_query.all()
+        elif after:
+            # The window would only count the packages after the cursor
+            return page_query.all(), final_query.count()
+
+        rows = page_query.all()
+        if rows:
+            return [row[0] for row in rows], rows[0][1]
+        elif offset:
+            # Past the last page, there is no row to read the total from
+            return [], final_query.count()
+        return [], 0
 
     @classmethod
     def count_collection(cls, session):
@@ -1713,6 +2166,88 @@ class Package(BASE):
         return result
 
 
+# The indexes used to search the packages by name, see
+# `_package_name_condition`.
+# On PostgreSQL, a trigram index is used for the LIKE and ILIKE patterns and
+# an index on the lower case names, with an operator class supporting
+# LIKE, for the case insensitive searches.
+# On other databases (ie: SQLite), the index on the lower case names is
+# used for the case insensitive searches and the prefix searches are
+# turned into range conditions.
+sa.event.listen(
+    Package.__table__,
+    'after_create',
+    sa.DDL(
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm;'
+        'CREATE INDEX ix_package_name_trgm ON package '
+        'USING gin (name gin_trgm_ops);'
+        'CREATE INDEX ix_package_name_lower ON package '
+        '(lower(name) text_pattern_ops);'
+    ).execute_if(dialect='postgresql')
+)
+sa.event.listen(
+    Package.__table__,
+    'after_create',
+    sa.DDL(
+        'CREATE INDEX ix_package_name_lower ON package (lower(name))'
+    ).execute_if(callable_=lambda ddl, target, bind, **kw: (
+        bind.dialect.name != 'postgresql'))
+)
+
+
+def _like_prefix(pattern):
+    """ Return the fixed prefix of the given LIKE pattern if it only matches
+    the strings starting with this prefix (ie: ``gua%``), None otherwise.
+
+    :arg pattern: the LIKE pattern.
+
+    """
+    prefix = pattern[:-1]
+    if not prefix or not pattern.endswith('%') \
+            or '%' in prefix or '_' in prefix \
+            or ord(prefix[-1]) >= sys.maxunicode:
+        return None
+    return prefix
+
+
+def _package_name_condition(session, pattern, case_sensitive=True):
+    """ Return the condition selecting the packages whose name matches the
+    given pattern, in the form able to use the indexes of the database.
+
+    :arg session: the session to connect to the database with.
+    :arg pattern: the name of the package or a LIKE pattern, if it
+        contains a ``%``.
+    :kwarg case_sensitive: a boolean specifying whether the name should
+        match case sensitively or not.
+
+    """
+    column = Package.name
+    if not case_sensitive:
+        column = sa.func.lower(Package.name)
+
+    if '%' not in pattern:
+        if case_sensitive:
+            return column == pattern
+        return column == sa.func.lower(pattern)
+
+    prefix = _like_prefix(pattern)
+    if session.bind.dialect.name == 'postgresql':
+        if prefix is not None and not case_sensitive:
+            return column.like(pattern.lower())
+    elif prefix is not None:
+        if not case_sensitive:
+            prefix = prefix.lower()
+        # The range uses the index, unlike the LIKE
+        return and_(
+            column >= prefix,
+            column < prefix[:-1] + unichr(ord(prefix[-1]) + 1),
+        )
+
+    if case_sensitive:
+        return Package.name.like(pattern)
+    return Package.name.ilike(pattern)
+
+
 class Log(BASE):
     """Base Log record.
 
@@ -1750,7 +2285,7 @@ class Log(BASE):
     @classmethod
     def search(cls, session, package_id=None, packager=None,
                from_date=None, limit=None,
-               offset=None, count=False):
+               offset=None, count=False, after=None):
         """ Return the list of the last Log entries present in the database.
 
         :arg cls: the class object
@@ -1762,8 +2297,11 @@ class Log(BASE):
         :kwarg offset: start the result at row X
         :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+        :kwarg after: a tuple of the change time and identifier of the last
+            entry seen, to return only the older entries.
 
         """
+        cls.write_pending(session)
         query = session.query(
             cls
         )
@@ -1777,11 +2315,15 @@ class Log(BASE):
         if from_date:
             query = query.filter(cls.change_time <= from_date)
 
-        query = query.order_by(cls.change_time.desc())
+        query = query.order_by(cls.change_time.desc(), cls.id.desc())
 
         if count:
             return query.count()
 
+        if after:
+            query = query.filter(
+                _after([cls.change_time, cls.id], after, descending=True))
+
         if offset:
             query = query.offset(offset)
         if limit:
@@ -1793,6 +2335,9 @@ class Log(BASE):
     def insert(cls, session, user, package, description):
         """ Insert the given log entry into the database.
 
+        The entry is only written before the session is committed, all the
+        entries of the transaction being inserted at once.
+
         :arg session: the session to connect to the database with
         :arg user: the username of the user doing the action
         :arg package: the `Package` object of the package changed
@@ -1800,14 +2345,506 @@ class Log(BASE):
             performed
 
         """
-        if package:
-            log = Log(user, package.id, description)
-        else:
-            log = Log(user, None, description)
-        session.add(log)
+        session.info[LOGS_CHANGED] = True
+        session.info.setdefault(LOGS_PENDING, []).append({
+            'user': user,
+            'package_id': package.id if package else None,
+            'description': description,
+            'change_time': datetime.datetime.utcnow(),
+        })
+
+    @classmethod
+    def write_pending(cls, session):
+        """ Insert the log entries recorded in the session by `insert`, in
+        the order they were recorded, using as few statements as possible.
+
+        This is done before the session is committed and before the log
+        entries are read.
+
+        :arg session: the session to connect to the database with
+
+        """
+        entries = session.info.pop(LOGS_PENDING, None)
+        while entries:
+            session.execute(
+                cls.__table__.insert().values(entries[:LOGS_BATCH_SIZE]))
+            entries = entries[LOGS_BATCH_SIZE:]
+
+    @classmethod
+    def latest(cls, session):
+        """ Return the most recent Log entry or None if there are none.
+
+        :arg session: the session to connect to the database with
+
+        """
+        cls.write_pending(session)
+        return session.query(
+            cls
+        ).order_by(
+            cls.id.desc()
+        ).first()
+
+
+def _write_logs_before_commit(session):
+    """ Insert the log entries of the session about to be committed and
+    count it as a change.
+    """
+    Log.write_pending(session)
+    if session.info.pop(LOGS_CHANGED, False):
+        ChangeCounter.increment(session)
+
+
+def _drop_logs_on_rollback(session):
+    """ The log entries of a rolled back session are not inserted. """
+    session.info.pop(LOGS_PENDING, None)
+    session.info.pop(LOGS_CHANGED, None)
+
+
+sa.event.listen(Session, 'before_commit', _write_logs_before_commit)
+sa.event.listen(Session, 'after_rollback', _drop_logs_on_rollback)
+
+
+class ChangeCounter(BASE):
+    """This table stores a single row counting the transactions which
+    committed changes, incremented right before they are committed.
+
+    The row stays locked until the transaction incrementing it ends, so the
+    value follows the order in which the changes are committed, unlike the
+    identifiers and dates of the log entries which are taken earlier.
+
+    Table -- change_counter
+    """
+
+    __tablename__ = 'change_counter'
+    id = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    value = sa.Column(sa.Integer, nullable=False, default=0)
+    date_updated = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'ChangeCounter(value=%r, date_updated=%r)' % (
+            self.value, self.date_updated)
+
+    @classmethod
+    def increment(cls, session):
+        """ Increment the counter and record the date of the change.
+
+        The date never goes backward, even if the transaction waited for
+        another one to commit to increment the counter.
+
+        :arg session: the session to connect to the database with
+
+        """
+        table = cls.__table__
+        now = datetime.datetime.utcnow()
+        result = session.execute(table.update().where(
+            table.c.id == 1
+        ).values(
+            value=table.c.value + 1,
+            date_updated=sa.case(
+                [(table.c.date_updated > now, table.c.date_updated)],
+                else_=now),
+        ))
+        if not result.rowcount:
+            session.execute(table.insert().values(
+                id=1, value=1, date_updated=now))
+
+    @classmethod
+    def current(cls, session):
+        """ Return the value of the counter and the date of the last change
+        counted, (0, None) if nothing was counted yet.
+
+        :arg session: the session to connect to the database with
+
+        """
+        row = session.query(
+            cls.value, cls.date_updated
+        ).filter(
+            cls.id == 1
+        ).first()
+        if row is None:
+            return (0, None)
+        return (row.value, row.date_updated)
+
+
+class VcsSnapshot(BASE):
+    """This table stores the pre-computed exports of the VCS ACLs, each
+    snapshot being a new generation of the export.
+
+    Table -- vcs_snapshot
+    """
+
+    __tablename__ = 'vcs_snapshot'
+    generation = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    change_count = sa.Column(sa.Integer, nullable=False, default=0,
+                             unique=True)
+    text = sa.Column(sa.Text, nullable=False)
+    json = sa.Column(sa.Text, nullable=False)
+    date_created = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow)
+    date_updated = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow,
+                             onupdate=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'VcsSnapshot(generation=%r, change_count=%r)' % (
+            self.generation, self.change_count)
+
+    @classmethod
+    def latest(cls, session):
+        """ Return the most recent snapshot of the VCS ACLs or None if
+        there are none.
+
+        :arg session: the session to connect to the database with
+
+        """
+        return session.query(
+            cls
+        ).order_by(
+            cls.generation.desc()
+        ).first()
+
+    @classmethod
+    def get(cls, session, generation):
+        """ Return the snapshot of the specified generation.
+
+        :arg session: the session to connect to the database with
+        :arg generation: the generation of the snapshot to retrieve
+
+        """
+        return session.query(
+            cls
+        ).filter(
+            cls.generation == generation
+        ).one()
+
+    @classmethod
+    def prune(cls, session, keep):
+        """ Remove all the snapshots but the `keep` most recent ones.
+
+        :arg session: the session to connect to the database with
+        :arg keep: the number of snapshots to keep
+
+        """
+        kept = session.query(
+            cls.generation
+        ).order_by(
+            cls.generation.desc()
+        ).limit(keep).all()
+
+        if len(kept) < keep:
+            return
+
+        session.query(
+            cls
+        ).filter(
+            cls.generation < kept[-1].generation
+        ).delete(synchronize_session=False)
+        session.flush()
+
+
+class VcsChange(BASE):
+    """This table is the journal of the changes between the successive
+    generations of the VCS ACLs snapshot, one entry per branch of a package
+    whose commit ACLs changed.
+
+    Table -- vcs_change
+    """
+
+    __tablename__ = 'vcs_change'
+    id = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    generation = sa.Column(sa.Integer, nullable=False, index=True)
+    namespace = sa.Column(sa.String(50), nullable=False)
+    package = sa.Column(sa.Text, nullable=False)
+    branch = sa.Column(sa.String(32), nullable=False)
+    # JSON of the commit ACLs of the branch, NULL if it was removed
+    acls = sa.Column(sa.Text, nullable=True)
+    date_created = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow, index=True)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'VcsChange(generation=%r, %s/%s/%s)' % (
+            self.generation, self.namespace, self.package, self.branch)
+
+    @classmethod
+    def search(cls, session, since, namespace=None):
+        """ Return the changes made after the specified generation, the
+        oldest first.
+
+        :arg session: the session to connect to the database with
+        :arg since: the generation from which to return the changes
+        :kwarg namespace: restrict the changes to a given namespace
+
+        """
+        query = session.query(
+            cls
+        ).filter(
+            cls.generation > since
+        )
+
+        if namespace:
+            query = query.filter(cls.namespace == namespace)
+
+        return query.order_by(cls.generation, cls.id).all()
+
+    @classmethod
+    def first_generation(cls, session):
+        """ Return the oldest generation present in the journal or None if
+        the journal is empty.
+
+        :arg session: the session to connect to the database with
+
+        """
+        return session.query(sa.func.min(cls.generation)).scalar()
+
+    @classmethod
+    def generation_at(cls, session, date):
+        """ Return the most recent generation known to exist at the
+        specified date, be it from the journal or from the snapshots.
+
+        :arg session: the session to connect to the database with
+        :arg date: the datetime at which the generation was current
+
+        """
+        generations = [
+            session.query(
+                sa.func.max(cls.generation)
+            ).filter(
+                cls.date_created <= date
+            ).scalar(),
+            session.query(
+                sa.func.max(VcsSnapshot.generation)
+            ).filter(
+                VcsSnapshot.date_created <= date
+            ).scalar(),
+        ]
+        generations = [gen for gen in generations if gen is not None]
+        if generations:
+            return max(generations)
+
+    @classmethod
+    def prune(cls, session, before):
+        """ Remove the changes recorded before the specified date.
+
+        :arg session: the session to connect to the database with
+        :arg before: the datetime before which the changes are removed
+
+        """
+        session.query(
+            cls
+        ).filter(
+            cls.date_created < before
+        ).delete(synchronize_session=False)
         session.flush()
 
 
+class BranchProgress(BASE):
+    """This table records how far the branching of a collection into
+    another went, the packages being branched by chunks of increasing
+    identifiers, so that an interrupted branching resumes where it stopped.
+
+    Table -- branch_progress
+    """
+
+    __tablename__ = 'branch_progress'
+    id = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    collection_from_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False)
+    collection_to_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False)
+    # Identifier of the last package branched
+    last_package_id = sa.Column(sa.Integer, nullable=False, default=0)
+    listings = sa.Column(sa.Integer, nullable=False, default=0)
+    acls = sa.Column(sa.Integer, nullable=False, default=0)
+    date_created = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow)
+    date_updated = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow,
+                             onupdate=datetime.datetime.utcnow)
+    date_completed = sa.Column(sa.DateTime, nullable=True)
+
+    __table_args__ = (
+        sa.UniqueConstraint('collection_from_id', 'collection_to_id'),
+    )
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'BranchProgress(%r to %r, last_package_id=%r)' % (
+            self.collection_from_id, self.collection_to_id,
+            self.last_package_id)
+
+    @classmethod
+    def get(cls, session, clt_from_id, clt_to_id):
+        """ Return the progress of the branching of a collection into
+        another or None if it never started.
+
+        :arg session: the session to connect to the database with
+        :arg clt_from_id: the identifier of the collection branched from
+        :arg clt_to_id: the identifier of the collection branched to
+
+        """
+        return session.query(
+            cls
+        ).filter(
+            cls.collection_from_id == clt_from_id
+        ).filter(
+            cls.collection_to_id == clt_to_id
+        ).first()
+
+    @classmethod
+    def last_completed(cls, session):
+        """ Return the progress of the most recently completed branching or
+        None if there are none.
+
+        :arg session: the session to connect to the database with
+
+        """
+        return session.query(
+            cls
+        ).filter(
+            cls.date_completed.isnot(None)
+        ).order_by(
+            cls.date_completed.desc()
+        ).first()
+
+    @property
+    def rate(self):
+        """ Return the number of rows created per second by the branching
+        once completed, None otherwise.
+        """
+        if not self.date_completed:
+            return None
+        duration = (self.date_completed - self.date_created).total_seconds()
+        return (self.listings + self.acls) / max(duration, 1.0)
+
+
+class RepoSync(BASE):
+    """This table stores the state of the metadata of the repos the
+    information of the packages were last synced with.
+
+    Table -- repo_sync
+    """
+
+    __tablename__ = 'repo_sync'
+    id = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    name = sa.Column(sa.String(50), nullable=False, unique=True)
+    # Revision of the repomd.xml and checksum of its primary_db
+    revision = sa.Column(sa.Text, nullable=True)
+    checksum = sa.Column(sa.Text, nullable=False)
+    date_updated = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow,
+                             onupdate=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'RepoSync(%r, checksum=%r)' % (self.name, self.checksum)
+
+    @classmethod
+    def by_name(cls, session, name):
+        """ Return the state of the repo of the specified name or None if
+        it was never synced.
+
+        :arg session: the session to connect to the database with
+        :arg name: the name of the repo
+
+        """
+        return session.query(
+            cls
+        ).filter(
+            cls.name == name
+        ).first()
+
+
+class RepoPackageHash(BASE):
+    """This table stores the hash of the metadata of each package of the
+    repos the information of the packages were last synced with.
+
+    Table -- repo_package_hash
+    """
+
+    __tablename__ = 'repo_package_hash'
+    repo_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'repo_sync.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False,
+        primary_key=True)
+    name = sa.Column(sa.Text, nullable=False, primary_key=True)
+    hash = sa.Column(sa.String(40), nullable=False)
+
+    @classmethod
+    def by_repo(cls, session, repo_id):
+        """ Return a dict associating the name of the packages of the repo
+        to the hash of their metadata.
+
+        :arg session: the session to connect to the database with
+        :arg repo_id: the identifier of the repo
+
+        """
+        return dict(session.query(
+            cls.name, cls.hash
+        ).filter(
+            cls.repo_id == repo_id
+        ).all())
+
+    @classmethod
+    def save(cls, session, repo_id, hashes, batch_size=500):
+        """ Store the hashes of the metadata of the packages of the repo,
+        only writing the ones that changed.
+
+        :arg session: the session to connect to the database with
+        :arg repo_id: the identifier of the repo
+        :arg hashes: a dict associating the name of the packages of the
+            repo to the hash of their metadata
+        :kwarg batch_size: the number of rows written per statement
+
+        """
+        table = cls.__table__
+        current = cls.by_repo(session, repo_id)
+        removed = sorted(set(current) - set(hashes))
+        added = [
+            {'repo_id': repo_id, 'name': name, 'hash': hashes[name]}
+            for name in sorted(hashes) if name not in current
+        ]
+        changed = [
+            {'b_name': name, 'b_hash': hashes[name]}
+            for name in sorted(hashes)
+            if name in current and current[name] != hashes[name]
+        ]
+
+        for idx in range(0, len(removed), batch_size):
+            session.execute(table.delete().where(and_(
+                table.c.repo_id == repo_id,
+                table.c.name.in_(removed[idx:idx + batch_size]),
+            )))
+        if added:
+            session.execute(table.insert(), added)
+        if changed:
+            session.execute(table.update().where(and_(
+                table.c.repo_id == repo_id,
+                table.c.name == sa.bindparam('b_name'),
+            )).values(hash=sa.bindparam('b_hash')), changed)
+
+
 class AdminAction(BASE):
     """This table stores the actions asked by user and requiring an
     intervention from an admin (often a rel-eng person).
@@ -1911,7 +2948,7 @@ class AdminAction(BASE):
     def search(cls, session, package_id=None, collection_id=None,
                packager=None, action=None, user=None,
                status=None, offset=None, limit=None, count=False,
-               order='asc'):
+               order='asc', after=None):
         """ Return the list of actions present in the database and
         matching these criterias.
 
@@ -1929,6 +2966,9 @@ class AdminAction(BASE):
         :kwarg order: the order in which to return the requests, default to
             ``asc`` meaning from the oldest to the most recent, can be
             ``desc`` meaning from the most recent to the oldest.
+        :kwarg after: a tuple of the creation date and identifier of the
+            last request seen, to return only the requests coming after it
+            in the order requested.
 
         """
         query = session.query(
@@ -1984,13 +3024,18 @@ class AdminAction(BASE):
                 )
 
         if order == 'desc':
-            query = query.order_by(cls.date_created.desc())
+            query = query.order_by(cls.date_created.desc(), cls.id.desc())
         else:
-            query = query.order_by(cls.date_created.asc())
+            query = query.order_by(cls.date_created.asc(), cls.id.asc())
 
         if count:
             return query.count()
 
+        if after:
+            query = query.filter(_after(
+                [cls.date_created, cls.id], after,
+                descending=(order == 'desc')))
+
         if offset:
             query = query.offset(offset)
         if limit:
@@ -2013,7 +3058,8 @@ class AdminAction(BASE):
         return query.first()
 
 
-def notify(session, eol=False, name=None, version=None, acls=None):
+def notify(session, eol=False, name=None, version=None, acls=None,
+           stream=False):
     """ Return the user that should be notify for each package.
 
     :arg session: the session to connect to the database with.
@@ -2027,6 +3073,8 @@ def notify(session, eol=False, name=None, version=None, acls=None):
         will return any person having one of these three acls for each
         package in the database.
         If the acls specified is ``all`` then all ACLs are used.
+    :kwarg stream: a boolean to return an iterator fetching the rows by
+        batches instead of the list of all the rows.
 
     """
 
@@ -2060,8 +3108,9 @@ def notify(session, eol=False, name=None, version=None, acls=None):
     ).group_by(
         Package.name, PackageListingAcl.fas_name, Package.id
     ).order_by(
-        Package.namespace,
         Package.name,
+        Package.namespace,
+        Package.id,
     )
 
     if eol is False:
@@ -2073,75 +3122,175 @@ def notify(session, eol=False, name=None, version=None, acls=None):
     if version:
         query = query.filter(Collection.version == version)
 
+    if stream:
+        return query.yield_per(STREAM_BATCH_SIZE)
+
     return query.all()
 
 
-def bugzilla(session, name=None):
+def _string_agg(session, column, distinct=False):
+    """ Return the aggregate function concatenating the values of the given
+    column with commas, as supported by the database used.
+
+    :arg session: the session to connect to the database with.
+    :arg column: the column whose values to concatenate.
+    :kwarg distinct: a boolean specifying whether to concatenate only the
+        distinct values.
+
+    """
+    if distinct:
+        column = sa.distinct(column)
+    if session.bind.dialect.name == 'postgresql':
+        return sa.func.string_agg(column, ',')
+    # SQLite and MySQL separate the values with a comma by default
+    return sa.func.group_concat(column)
+
+
+def bugzilla(session, name=None, stream=False, default_namespace='rpms'):
     """ Return information for each package to sync with bugzilla.
 
+    For each package of each collection name (ie: product), the point of
+    contact is the one of the most recent branch not orphaned (devel being
+    the most recent) and the cc list the comma separated list of the
+    people watching the bugs of any of its branches but the point of
+    contact, or None if there are none.
+
     :arg session: the session to connect to the database with.
     :kwarg name: restricts the output to a specific collection name.
+    :kwarg stream: a boolean to return an iterator fetching the rows by
+        batches instead of the list of all the rows.
+    :kwarg default_namespace: the namespace whose packages come first for
+        each collection name, the others being exported as a collection of
+        their own.
 
     """
+    watched = sa.exists().where(
+        and_(
+            PackageListingAcl.packagelisting_id == PackageListing.id,
+            PackageListingAcl.acl == 'watchbugzilla',
+            PackageListingAcl.status == 'Approved',
+        )
+    )
+
+    # Rank the branches watched of each package of each product, the best
+    # point of contact coming first
+    listings = session.query(
+        Collection.name.label('collection'),
+        PackageListing.package_id.label('package_id'),
+        PackageListing.point_of_contact.label('poc'),
+        sa.func.row_number().over(
+            partition_by=[Collection.name, PackageListing.package_id],
+            order_by=[
+                sa.case(
+                    [(PackageListing.point_of_contact == 'orphan', 1)],
+                    else_=0),
+                sa.case(
+                    [(Collection.version == 'devel', 10000)],
+                    else_=sa.cast(Collection.version, sa.Integer)).desc(),
+                PackageListing.id,
+            ]
+        ).label('rank'),
+    ).filter(
+        PackageListing.collection_id == Collection.id
+    ).filter(
+        Collection.status != 'EOL'
+    ).filter(
+        watched
+    )
+
+    if name:
+        listings = listings.filter(Collection.name == name)
+
+    listings = listings.subquery()
+
+    watcher = sa.case(
+        [(
+            and_(
+                PackageListingAcl.fas_name != listings.c.poc,
+                PackageListingAcl.fas_name != 'orphan',
+            ),
+            PackageListingAcl.fas_name
+        )]
+    )
+
     query = session.query(
-        Collection.name,  # 0
-        Collection.version,  # 1
+        listings.c.collection,  # 0
+        Package.namespace,  # 1
         Package.name,  # 2
         Package.summary,  # 3
-        PackageListing.point_of_contact,  # 4
-        PackageListingAcl.fas_name,  # 5
-        Collection.branchname,  # 6
-        Package.namespace,  # 7
+        listings.c.poc,  # 4
+        _string_agg(session, watcher, distinct=True),  # 5
     ).filter(
-        Package.id == PackageListing.package_id
+        listings.c.rank == 1
     ).filter(
-        PackageListingAcl.packagelisting_id == PackageListing.id
+        Package.id == listings.c.package_id
+    ).filter(
+        Package.status == 'Approved'
+    ).filter(
+        PackageListing.package_id == Package.id
     ).filter(
         PackageListing.collection_id == Collection.id
     ).filter(
-        Package.status == 'Approved'
+        Collection.name == listings.c.collection
     ).filter(
         Collection.status != 'EOL'
     ).filter(
-        PackageListingAcl.acl.in_(
-            ['watchbugzilla'])
+        PackageListingAcl.packagelisting_id == PackageListing.id
+    ).filter(
+        PackageListingAcl.acl == 'watchbugzilla'
     ).filter(
         PackageListingAcl.status == 'Approved'
     ).group_by(
-        Collection.name, Package.namespace, Package.name,
-        PackageListing.point_of_contact, PackageListingAcl.fas_name,
-        Package.summary, Collection.branchname, Collection.version
+        listings.c.collection, Package.namespace, Package.name,
+        Package.summary, listings.c.poc,
     ).order_by(
-        Package.name
+        listings.c.collection,
+        Package.namespace != default_namespace,
+        Package.namespace,
+        Package.name,
     )
 
-    if name:
-        query = query.filter(Collection.name == name)
+    if stream:
+        return query.yield_per(STREAM_BATCH_SIZE)
 
     return query.all()
 
 
-def vcs_acls(session, eol=False, collection=None, namespace=None):
+def vcs_acls(session, eol=False, collection=None, namespace=None,
+             stream=False):
     """ Return information for each package to sync with git.
 
+    Each row contains the package name, the comma separated list of the
+    users and groups having commit access on the branch, or None if there
+    are none, the branch name and the namespace of the package.
+
     :arg session: the session to connect to the database with.
     :kwarg eol: A boolean specifying whether to include information about
         End Of Life collections or not. Defaults to ``False``.
     :kwarg collection: Restrict the VCS info to a specific collection
     :kwarg namespace: Restrict the VCS info returned to a given namespace
+    :kwarg stream: a boolean to return an iterator fetching the rows by
+        batches instead of the list of all the rows.
 
     """
     query = session.query(
         Package.name,  # 0
-        PackageListingAcl.fas_name,  # 1
+        _string_agg(session, PackageListingAcl.fas_name),  # 1
         Collection.branchname,  # 2
-        Package.namespace,  # 2
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListingAcl.packagelisting_id == PackageListing.id
-    ).filter(
-        PackageListing.collection_id == Collection.id
+        Package.namespace,  # 3
+    ).select_from(
+        PackageListing
+    ).join(
+        Package, Package.id == PackageListing.package_id
+    ).join(
+        Collection, PackageListing.collection_id == Collection.id
+    ).outerjoin(
+        PackageListingAcl,
+        and_(
+            PackageListingAcl.packagelisting_id == PackageListing.id,
+            PackageListingAcl.acl == 'commit',
+            PackageListingAcl.status == 'Approved',
+        )
     ).filter(
         PackageListing.status.in_(['Approved', 'Orphaned'])
     )
@@ -2160,59 +3309,18 @@ def vcs_acls(session, eol=False, collection=None, namespace=None):
             Package.namespace == namespace
         )
 
-    query = query.filter(
-        PackageListingAcl.acl == 'commit'
-    ).filter(
-        PackageListingAcl.status == 'Approved'
-    ).group_by(
-        Package.namespace, Package.name, PackageListingAcl.fas_name,
-        Collection.branchname,
+    query = query.group_by(
+        Package.namespace, Package.name, Collection.branchname,
     ).order_by(
-        Package.name
-    )
-
-    data = query.all()
-    sub = set([(it[0], it[2]) for it in data])
-
-    query2 = session.query(
-        Package.name,  # 0
-        Collection.branchname,  # 1
-        Package.namespace,  # 2
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListing.collection_id == Collection.id
-    ).filter(
-        PackageListing.status.in_(['Approved', 'Orphaned'])
-    ).group_by(
-        Package.namespace,
         Package.name,
         Collection.branchname,
-    ).order_by(
-        Package.name,
-        Collection.branchname
+        Package.namespace,
     )
 
-    if collection is not None:
-        query2 = query2.filter(
-            Collection.branchname == collection
-        )
-
-    if not eol:
-        query2 = query2.filter(
-            Collection.status != 'EOL')
+    if stream:
+        return query.yield_per(STREAM_BATCH_SIZE)
 
-    if namespace is not None:
-        query2 = query2.filter(
-            Package.namespace == namespace
-        )
-
-    sub2 = set(query2.all())
-
-    for entry in sub2 - sub:
-        data.append([entry[0], None, entry[1], entry[2]])
-
-    return data
+    return query.all()
 
 
 def get_groups(session):
@@ -27,45 +27,279 @@ messages.  If it is not installed, it will return silently.
 
 """
 
+import Queue
+import atexit
+import collections
 import smtplib
+import socket
+import threading
+import time
 import warnings
 
 from email.mime.text import MIMEText
 
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 import pkgdb2
 
+## Ignore message about fedmsg import
+# pylint: disable=F0401
+try:
+    import fedmsg
+except ImportError:  # pragma: no cover
+    fedmsg = None
+
+## We use global variable for a reason
+# pylint: disable=W0603
+
+
+# Keys set in the info dict of a session with the messages and emails to
+# send once it is committed
+_FEDMSG_PENDING = 'pkgdb2.fedmsg.pending'
+_EMAIL_PENDING = 'pkgdb2.email.pending'
+# Connection to the SMTP server kept open by the thread sending the emails
+_SMTP = None
+
+
+class NotificationQueue(object):
+    """ Bounded queue of notifications sent by a background thread, by
+    batches of the notifications queued while the previous batch was being
+    sent.
+    """
+
+    def __init__(self, name, send, counters, size_key, batch_size_key,
+                 idle=None, idle_key=None):
+        """ Constructor.
+
+        :arg name: the name of the thread sending the notifications.
+        :arg send: the function sending a batch of notifications, returning
+            a dict of the counters to increment.
+        :arg counters: the names of the counters returned by ``send``.
+        :arg size_key: the configuration key of the maximum number of
+            notifications waiting in the queue.
+        :arg batch_size_key: the configuration key of the maximum number of
+            notifications sent at once.
+        :kwarg idle: a function to call when the queue stayed empty for the
+            number of seconds specified by the ``idle_key`` configuration key.
+        :kwarg idle_key: the configuration key of the number of seconds
+            after which ``idle`` is called.
+
+        """
+        self.name = name
+        self.send = send
+        self.size_key = size_key
+        self.batch_size_key = batch_size_key
+        self.idle = idle
+        self.idle_key = idle_key
+        self._lock = threading.Lock()
+        self._counters = ['dropped', 'batches'] + list(counters)
+        self._queue = None
+        self._thread = None
+        self._stats = None
+        self.reset()
+
+    def reset(self):
+        """ Start over with a new queue and new counters. """
+        with self._lock:
+            self._queue = None
+            self._thread = None
+            self._stats = dict((key, 0) for key in self._counters)
+
+    def put(self, notifications):
+        """ Queue the notifications, starting the thread sending them if
+        needed, and dropping them rather than blocking if the queue is full.
+
+        :arg notifications: the list of notifications to queue.
+        :returns: the number of notifications dropped.
+
+        """
+        with self._lock:
+            if self._queue is None:
+                self._queue = Queue.Queue(
+                    pkgdb2.APP.config.get(self.size_key, 1000))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._work, args=(self._queue,), name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+            queue = self._queue
+
+        dropped = 0
+        for notification in notifications:
+            try:
+                queue.put_nowait(notification)
+            except Queue.Full:
+                dropped += 1
+        if dropped:
+            with self._lock:
+                self._stats['dropped'] += dropped
+            pkgdb2.LOG.warning(
+                '%s queue full, %s notifications dropped', self.name, dropped)
+        return dropped
+
+    def _work(self, queue):
+        """ Send the notifications of the queue. """
+        ## We catch Exception as the thread must keep running
+        # pylint: disable=W0703
+        while True:
+            timeout = None
+            if self.idle is not None:
+                timeout = pkgdb2.APP.config.get(self.idle_key, 30)
+            try:
+                batch = [queue.get(timeout=timeout)]
+            except Queue.Empty:
+                self.idle()
+                continue
+
+            batch_size = pkgdb2.APP.config.get(self.batch_size_key, 100)
+            while len(batch) < batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            try:
+                counters = self.send(batch)
+            except Exception as err:  # pragma: no cover
+                pkgdb2.LOG.exception(err)
+                counters = {'failed': len(batch)}
+
+            with self._lock:
+                self._stats['batches'] += 1
+                for key in counters:
+                    self._stats[key] += counters[key]
+            for _ in batch:
+                queue.task_done()
+
+    def stats(self):
+        """ Return the number of notifications waiting in the queue, whether
+        the thread sending them is running and the counters of what
+        happened to the notifications so far.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = 0
+            stats['running'] = False
+            if self._queue is not None:
+                stats['queued'] = self._queue.qsize()
+                stats['running'] = self._thread is not None \
+                    and self._thread.is_alive()
+        return stats
+
+    def flush(self, timeout=None):
+        """ Wait for the notifications queued to be sent.
+
+        :kwarg timeout: the maximum number of seconds to wait, wait as long
+            as needed if None.
+        :returns: a boolean specifying whether every notification was
+            handled.
+
+        """
+        queue = self._queue
+        if queue is None:
+            return True
+        start = time.time()
+        while queue.unfinished_tasks:
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(0.01)
+        return True
+
 
-def fedmsg_publish(*args, **kwargs):  # pragma: no cover
-    ''' Try to publish a message on the fedmsg bus. '''
+def fedmsg_publish(*args, **kwargs):
+    ''' Try to publish a message on the fedmsg bus.
+
+    :returns: a boolean specifying whether the message was published.
+    '''
     ## We catch Exception if we want :-p
     # pylint: disable=W0703
-    ## Ignore message about fedmsg import
-    # pylint: disable=F0401
     kwargs['modname'] = 'pkgdb'
+    if fedmsg is None:  # pragma: no cover
+        warnings.warn('No module named fedmsg')
+        return False
     try:
-        import fedmsg
         fedmsg.publish(*args, **kwargs)
+        return True
     except Exception as err:
         warnings.warn(str(err))
+        return False
 
 
-def email_publish(
-        user, package, message, subject=None,
-        to_email=None):  # pragma: no cover
-    ''' Send notification by email. '''
+def _publish_fedmsg_batch(batch):
+    ''' Publish the (topic, message) of the batch on the fedmsg bus. '''
+    published = 0
+    for topic, message in batch:
+        if fedmsg_publish(topic=topic, msg=message):
+            published += 1
+    return {'published': published, 'failed': len(batch) - published}
+
+
+FEDMSG_QUEUE = NotificationQueue(
+    'pkgdb2-fedmsg', _publish_fedmsg_batch, ['published', 'failed'],
+    'PKGDB2_FEDMSG_QUEUE_SIZE', 'PKGDB2_FEDMSG_BATCH_SIZE')
+
+
+def fedmsg_publish_on_commit(session, topic, message):
+    ''' Publish a message on the fedmsg bus once the session is committed,
+    from a background thread, so that neither a rolled back change nor a
+    stalled bus affects the request.
+
+    :arg session: the session in which the change is made.
+    :arg topic: the topic of the message.
+    :arg message: the content of the message.
+
+    '''
+    session.info.setdefault(_FEDMSG_PENDING, []).append((topic, message))
+
 
-    if not package and not to_email:
+def fedmsg_queue_stats():
+    ''' Return the state of the queue of the fedmsg messages. '''
+    return FEDMSG_QUEUE.stats()
+
+
+def fedmsg_flush(timeout=None):
+    ''' Wait for the fedmsg messages queued to be published.
+
+    :kwarg timeout: the maximum number of seconds to wait, wait as long as
+        needed if None.
+    :returns: a boolean specifying whether every message was handled.
+
+    '''
+    return FEDMSG_QUEUE.flush(timeout)
+
+
+def email_body(messages, package_name=None):
+    ''' Return the body of the email notifying of the specified changes.
+
+    :arg messages: the list of the messages describing the changes.
+    :kwarg package_name: the name of the package changed, if any.
+
+    '''
+    body = '\n\n'.join(messages)
+    if package_name:
+        body = '{0}\n\nTo make changes to this package see:\n' \
+            '{1}/package/{2}'.format(
+                body, pkgdb2.APP.config.get('SITE_URL'), package_name)
+    return body
+
+
+def _build_email(user, package_name, message, subject=None, to_email=None):
+    ''' Return the sender, the recipients and the text of the email
+    notifying of a change, None if there is nobody to send it to.
+    '''
+    if not package_name and not to_email:
         # If we have no package and no to_email, we have no way to know
         # where to send the email
-        return
+        return None
 
     msg = MIMEText(message)
 
     if subject:
         msg['Subject'] = '[PkgDB] %s' % subject
-    elif package:
+    elif package_name:
         msg['Subject'] = '[PkgDB] {0} updated {1}'.format(
-            user, package.name)
+            user, package_name)
     else:
         msg['Subject'] = '[PkgDB] updated by {0}'.format(user)
 
@@ -73,9 +307,7 @@ def email_publish(
         'PKGDB2_EMAIL_FROM', 'nobody@fedoraproject.org')
 
     if not to_email:
-        email_to_template = pkgdb2.APP.config.get(
-            'PKGDB2_EMAIL_TO', '{pkg_name}-owner@fedoraproject.org')
-        to_email = email_to_template.format(pkg_name=package.name)
+        to_email = _email_recipient(package_name)
 
     msg['From'] = from_email
     msg['To'] = to_email
@@ -90,9 +322,211 @@ def email_publish(
     if cc_email:
         to_email.extend(cc_email)
 
+    return from_email, to_email, msg.as_string()
+
+
+def _email_recipient(package_name):
+    ''' Return the address the notifications about the package are sent
+    to.
+    '''
+    email_to_template = pkgdb2.APP.config.get(
+        'PKGDB2_EMAIL_TO', '{pkg_name}-owner@fedoraproject.org')
+    return email_to_template.format(pkg_name=package_name)
+
+
+def email_publish(
+        user, package, message, subject=None,
+        to_email=None):  # pragma: no cover
+    ''' Send notification by email. '''
+    email = _build_email(
+        user, package.name if package else None, message,
+        subject=subject, to_email=to_email)
+    if email is None:
+        return
+
     # Send the message via our own SMTP server, but don't include the
     # envelope header.
     smtp = smtplib.SMTP(pkgdb2.APP.config.get(
         'PKGDB2_EMAIL_SMTP_SERVER', 'localhost'))
-    smtp.sendmail(from_email, to_email, msg.as_string())
+    smtp.sendmail(*email)
     smtp.quit()
+
+
+def email_publish_on_commit(
+        session, user, package, message, subject=None, to_email=None):
+    ''' Send a notification by email once the session is committed, from
+    a background thread.
+
+    The notifications sent to the same address by a session are merged in
+    a single email.
+
+    :arg session: the session in which the change is made.
+    :arg user: the user making the change.
+    :arg package: the package changed, if any.
+    :arg message: the message describing the change.
+    :kwarg subject: the subject of the email, defaults to one built from
+        the user and the package.
+    :kwarg to_email: the address to send the email to, defaults to the one
+        built from the package name using ``PKGDB2_EMAIL_TO``.
+
+    '''
+    session.info.setdefault(_EMAIL_PENDING, []).append((
+        user, package.name if package else None, message, subject, to_email))
+
+
+def _digest_emails(notifications):
+    ''' Return the emails to send for the (user, package name, message,
+    subject, recipient) notifications, merging those sent to the same
+    address, in the order of their first notification.
+    '''
+    recipients = collections.OrderedDict()
+    for notification in notifications:
+        user, package_name, _, _, to_email = notification
+        if not package_name and not to_email:
+            continue
+        recipient = to_email or _email_recipient(package_name)
+        if isinstance(recipient, list):
+            recipient = tuple(recipient)
+        recipients.setdefault(recipient, []).append(notification)
+
+    emails = []
+    for recipient, entries in recipients.items():
+        if len(entries) == 1:
+            user, package_name, message, subject, to_email = entries[0]
+            emails.append(_build_email(
+                user, package_name, email_body([message], package_name),
+                subject=subject, to_email=list(to_email)
+                if isinstance(to_email, (list, tuple)) else to_email))
+            continue
+
+        users = []
+        package_names = []
+        subjects = []
+        for user, package_name, _, subject, _ in entries:
+            for values, value in (
+                    (users, user), (package_names, package_name),
+                    (subjects, subject)):
+                if value not in values:
+                    values.append(value)
+
+        subject = subjects[0] if len(subjects) == 1 else None
+        package_name = package_names[0] if len(package_names) == 1 else None
+        if subject is None and package_name is None:
+            subject = '{0} changes by {1}'.format(
+                len(entries), ', '.join(users))
+
+        messages = [entry[2] for entry in entries]
+        emails.append(_build_email(
+            ', '.join(users), package_name,
+            email_body(messages, package_name),
+            subject=subject, to_email=list(recipient)
+            if isinstance(recipient, tuple) else recipient))
+    return emails
+
+
+def _close_smtp():
+    ''' Close the connection to the SMTP server, if any. '''
+    global _SMTP
+    smtp, _SMTP = _SMTP, None
+    if smtp is None:
+        return
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, socket.error):
+        smtp.close()
+
+
+def _is_temporary(err):
+    ''' Return whether sending the email again may succeed. '''
+    if isinstance(err, smtplib.SMTPRecipientsRefused):
+        return all(
+            400 <= code < 500 for code, _ in err.recipients.values())
+    if isinstance(err, smtplib.SMTPResponseException):
+        return 400 <= err.smtp_code < 500
+    return True
+
+
+def _send_email_batch(batch):
+    ''' Send the (sender, recipients, text) emails of the batch, using a
+    connection to the SMTP server kept open between batches, retrying with
+    an increasing delay in case of temporary failures.
+    '''
+    global _SMTP
+    counters = {'sent': 0, 'failed': 0, 'retried': 0, 'connections': 0}
+    retries = pkgdb2.APP.config.get('PKGDB2_EMAIL_RETRIES', 3)
+    delay = pkgdb2.APP.config.get('PKGDB2_EMAIL_RETRY_DELAY', 1)
+    for email in batch:
+        attempt = 0
+        while True:
+            try:
+                if _SMTP is None:
+                    _SMTP = smtplib.SMTP(pkgdb2.APP.config.get(
+                        'PKGDB2_EMAIL_SMTP_SERVER', 'localhost'))
+                    counters['connections'] += 1
+                _SMTP.sendmail(*email)
+                counters['sent'] += 1
+                break
+            except (smtplib.SMTPException, socket.error) as err:
+                _close_smtp()
+                if attempt >= retries or not _is_temporary(err):
+                    counters['failed'] += 1
+                    pkgdb2.LOG.error(
+                        'Could not send the email to %s: %s', email[1], err)
+                    break
+                time.sleep(delay * 2 ** attempt)
+                attempt += 1
+                counters['retried'] += 1
+    return counters
+
+
+EMAIL_QUEUE = NotificationQueue(
+    'pkgdb2-email', _send_email_batch,
+    ['sent', 'failed', 'retried', 'connections'],
+    'PKGDB2_EMAIL_QUEUE_SIZE', 'PKGDB2_EMAIL_BATCH_SIZE',
+    idle=_close_smtp, idle_key='PKGDB2_EMAIL_SMTP_IDLE')
+
+
+def email_queue_stats():
+    ''' Return the state of the queue of the emails. '''
+    return EMAIL_QUEUE.stats()
+
+
+def email_flush(timeout=None):
+    ''' Wait for the emails queued to be sent.
+
+    :kwarg timeout: the maximum number of seconds to wait, wait as long as
+        needed if None.
+    :returns: a boolean specifying whether every email was handled.
+
+    '''
+    return EMAIL_QUEUE.flush(timeout)
+
+
+def _queue_on_commit(session):
+    ''' Queue the fedmsg messages and the emails of the session committed,
+    in the order they were emitted.
+    '''
+    messages = session.info.pop(_FEDMSG_PENDING, None)
+    if messages:
+        FEDMSG_QUEUE.put(messages)
+    emails = session.info.pop(_EMAIL_PENDING, None)
+    if emails:
+        EMAIL_QUEUE.put(_digest_emails(emails))
+
+
+def _drop_on_rollback(session):
+    ''' The changes of a rolled back session are not announced. '''
+    session.info.pop(_FEDMSG_PENDING, None)
+    session.info.pop(_EMAIL_PENDING, None)
+
+
+event.listen(Session, 'after_commit', _queue_on_commit)
+event.listen(Session, 'after_rollback', _drop_on_rollback)
+
+
+@atexit.register
+def _flush_at_exit():  # pragma: no cover
+    ''' Give the notifications still queued a chance to be sent. '''
+    timeout = pkgdb2.APP.config.get('PKGDB2_NOTIFICATIONS_EXIT_TIMEOUT', 5)
+    fedmsg_flush(timeout=timeout)
+    email_flush(timeout=timeout)
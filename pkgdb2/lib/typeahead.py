@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+In-memory index of the names of the packages and packagers, completing
+the beginning of a name typed in the search box without querying the
+database.
+'''
+
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+import pkgdb2
+from pkgdb2.lib import model
+
+
+## We use global variable for a reason
+# pylint: disable=W0603
+
+
+# Key set in the info dict of a session with the names of the packages and
+# packagers it added, renamed or deleted, in the order of the changes
+_PENDING = 'pkgdb2.typeahead.pending'
+# The index in use, built when the application starts or at the first
+# completion asked for
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+# The changes of names committed while a new index is being built, to apply
+# to it before using it, None if no index is being built
+_BUILD_CHANGES = None
+# Lock held by the thread building a new index
+_BUILD_LOCK = threading.Lock()
+
+
+class NameIndex(object):
+    """ Sorted list of names completing the prefixes asked for,
+    independently of their case.
+    """
+
+    def __init__(self, entries=None):
+        """ Constructor.
+
+        :kwarg entries: an iterable of (name, value) tuples, the value being
+            what is returned when the name completes a prefix.
+
+        """
+        self._entries = sorted(set(
+            (name.lower(), value) for name, value in entries or []))
+
+    def __len__(self):
+        """ Return the number of names in the index. """
+        return len(self._entries)
+
+    def add(self, name, value):
+        """ Add the name to the index if it is not already in.
+
+        :arg name: the name to add.
+        :arg value: the value to return when the name completes a prefix.
+
+        """
+        entry = (name.lower(), value)
+        idx = bisect.bisect_left(self._entries, entry)
+        if idx == len(self._entries) or self._entries[idx] != entry:
+            self._entries.insert(idx, entry)
+
+    def remove(self, name, value):
+        """ Remove the name from the index if it is in.
+
+        :arg name: the name to remove.
+        :arg value: the value returned when the name completes a prefix.
+
+        """
+        entry = (name.lower(), value)
+        idx = bisect.bisect_left(self._entries, entry)
+        if idx < len(self._entries) and self._entries[idx] == entry:
+            del self._entries[idx]
+
+    def complete(self, prefix, limit=None):
+        """ Return the values of the names starting with the prefix, in the
+        order of the names.
+
+        :arg prefix: the beginning of the names to return.
+        :kwarg limit: the maximum number of values to return.
+
+        """
+        prefix = prefix.lower()
+        output = []
+        idx = bisect.bisect_left(self._entries, (prefix,))
+        while idx < len(self._entries) and (not limit or len(output) < limit):
+            name, value = self._entries[idx]
+            if not name.startswith(prefix):
+                break
+            output.append(value)
+            idx += 1
+        return output
+
+
+class Typeahead(object):
+    """ The indexes of the names of the packages (overall and per namespace)
+    and of the packagers.
+    """
+
+    def __init__(self, packages, packagers):
+        """ Constructor.
+
+        :arg packages: a list of (namespace, name) of the packages.
+        :arg packagers: a list of the names of the packagers.
+
+        """
+        self.built = time.time()
+        self._lock = threading.Lock()
+        self.packages = NameIndex(
+            (name, (namespace, name)) for namespace, name in packages)
+        self.namespaces = {}
+        for namespace, name in packages:
+            if namespace not in self.namespaces:
+                self.namespaces[namespace] = []
+            self.namespaces[namespace].append((name, name))
+        for namespace in self.namespaces:
+            self.namespaces[namespace] = NameIndex(self.namespaces[namespace])
+        self.packagers = NameIndex((name, name) for name in packagers)
+
+    def add_package(self, namespace, name):
+        """ Add the package to the indexes.
+
+        :arg namespace: the namespace of the package.
+        :arg name: the name of the package.
+
+        """
+        with self._lock:
+            self.packages.add(name, (namespace, name))
+            if namespace not in self.namespaces:
+                self.namespaces[namespace] = NameIndex()
+            self.namespaces[namespace].add(name, name)
+
+    def remove_package(self, namespace, name):
+        """ Remove the package from the indexes.
+
+        :arg namespace: the namespace of the package.
+        :arg name: the name of the package.
+
+        """
+        with self._lock:
+            self.packages.remove(name, (namespace, name))
+            if namespace in self.namespaces:
+                self.namespaces[namespace].remove(name, name)
+
+    def add_packager(self, name):
+        """ Add the packager to the index.
+
+        :arg name: the name of the packager.
+
+        """
+        with self._lock:
+            self.packagers.add(name, name)
+
+    def complete_packages(self, prefix, namespace=None, limit=None):
+        """ Return the (namespace, name) of the packages whose name starts
+        with the prefix.
+
+        :arg prefix: the beginning of the name of the packages.
+        :kwarg namespace: the namespace to restrict the packages to.
+        :kwarg limit: the maximum number of packages to return.
+
+        """
+        with self._lock:
+            if namespace is None:
+                return self.packages.complete(prefix, limit=limit)
+            if namespace not in self.namespaces:
+                return []
+            return [
+                (namespace, name)
+                for name in self.namespaces[namespace].complete(
+                    prefix, limit=limit)
+            ]
+
+    def complete_packagers(self, prefix, limit=None):
+        """ Return the names of the packagers starting with the prefix.
+
+        :arg prefix: the beginning of the name of the packagers.
+        :kwarg limit: the maximum number of packagers to return.
+
+        """
+        with self._lock:
+            return self.packagers.complete(prefix, limit=limit)
+
+
+def build(session):
+    """ Build the index from the database and use it from now on.
+
+    The names committed while the index is being built are added to it or
+    removed from it before it is used.
+
+    :arg session: the session to connect to the database with.
+    :returns: the `Typeahead` built.
+
+    """
+    global _INDEX, _BUILD_CHANGES
+    with _INDEX_LOCK:
+        _BUILD_CHANGES = []
+    index = None
+    try:
+        packages = model.Package.all_names(session)
+        packagers = [
+            row[0]
+            for row in model.PackageListing.search_packagers(session, '%')
+        ]
+        index = Typeahead(packages, packagers)
+    finally:
+        with _INDEX_LOCK:
+            if index is not None:
+                _apply_changes(index, _BUILD_CHANGES)
+                _INDEX = index
+            _BUILD_CHANGES = None
+    return index
+
+
+def preload(session):
+    """ Build the index when the application starts, if the
+    ``PKGDB2_TYPEAHEAD_PRELOAD`` configuration key is set, so that no
+    request pays for it. If the database cannot be queried yet, the index
+    is built at the first completion asked for instead.
+
+    :arg session: the session to connect to the database with.
+
+    """
+    if not pkgdb2.APP.config.get('PKGDB2_TYPEAHEAD_PRELOAD', False):
+        return
+    try:
+        build(session)
+    except SQLAlchemyError as err:  # pragma: no cover
+        pkgdb2.LOG.warning(
+            'Could not build the typeahead index at startup: %s', err)
+        session.rollback()
+    finally:
+        session.close()
+
+
+def get_index(session):
+    """ Return the index in use, building it if there is none yet or if it
+    is older than the ``PKGDB2_TYPEAHEAD_REFRESH`` configuration key, in
+    seconds.
+
+    A single thread rebuilds an index too old at a time, the others keep
+    using it meanwhile.
+
+    :arg session: the session to connect to the database with.
+    :returns: the `Typeahead` in use.
+
+    """
+    index = _INDEX
+    if index is None:
+        with _BUILD_LOCK:
+            index = _INDEX
+            if index is None:
+                index = build(session)
+    elif _is_stale(index) and _BUILD_LOCK.acquire(False):
+        try:
+            index = _INDEX
+            if _is_stale(index):
+                index = build(session)
+        finally:
+            _BUILD_LOCK.release()
+    return index
+
+
+def _is_stale(index):
+    """ Return whether the index is older than the
+    ``PKGDB2_TYPEAHEAD_REFRESH`` configuration key, in seconds.
+    """
+    refresh = pkgdb2.APP.config.get('PKGDB2_TYPEAHEAD_REFRESH', 3600)
+    return bool(refresh) and time.time() - index.built > refresh
+
+
+def reset():
+    """ Drop the index in use, the next completion building a new one. """
+    global _INDEX
+    with _INDEX_LOCK:
+        _INDEX = None
+
+
+def _previous_name(package):
+    """ Return the (namespace, name) the package had before the changes
+    being flushed.
+    """
+    previous = []
+    for attr in ('namespace', 'name'):
+        history = get_history(package, attr)
+        if history.deleted:
+            previous.append(history.deleted[0])
+        else:
+            previous.append(getattr(package, attr))
+    return tuple(previous)
+
+
+def _collect_names(session, flush_context):
+    """ Record the names of the packages and of the packagers with an
+    approved ACL added or changed by the flush, to add them to the index
+    once committed, as well as the names of the packages renamed or
+    deleted, to remove them from it.
+    """
+    changes = session.info.setdefault(_PENDING, [])
+    for obj in session.deleted:
+        if isinstance(obj, model.Package):
+            changes.append(('remove_package',) + _previous_name(obj))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, model.Package):
+            if obj in session.dirty:
+                previous = _previous_name(obj)
+                if previous != (obj.namespace, obj.name):
+                    changes.append(('remove_package',) + previous)
+            changes.append(('package', obj.namespace, obj.name))
+        elif isinstance(obj, model.PackageListingAcl) \
+                and obj.status == 'Approved':
+            changes.append(('packager', obj.fas_name))
+
+
+def _update_on_commit(session):
+    """ Apply the changes of names recorded in the session committed to the
+    index in use, if any, and to the index being built, if any.
+    """
+    changes = session.info.pop(_PENDING, None)
+    if not changes:
+        return
+    with _INDEX_LOCK:
+        if _BUILD_CHANGES is not None:
+            _BUILD_CHANGES.extend(changes)
+        if _INDEX is not None:
+            _apply_changes(_INDEX, changes)
+
+
+def _apply_changes(index, changes):
+    """ Apply the changes of names recorded by `_collect_names` to the
+    index, in the order they were made.
+    """
+    for change in changes:
+        if change[0] == 'package':
+            index.add_package(change[1], change[2])
+        elif change[0] == 'remove_package':
+            index.remove_package(change[1], change[2])
+        else:
+            index.add_packager(change[1])
+
+
+def _reset_on_rollback(session):
+    """ The names added by a rolled back session are not in the database.
+    """
+    session.info.pop(_PENDING, None)
+
+
+event.listen(Session, 'after_flush', _collect_names)
+event.listen(Session, 'after_commit', _update_on_commit)
+event.listen(Session, 'after_rollback', _reset_on_rollback)
@@ -25,7 +25,10 @@ Utilities for all classes to use
 
 import datetime
 import hashlib
+import inspect
+import threading
 import urllib
+import uuid
 
 import requests
 
@@ -33,6 +36,10 @@ import pkgdb2
 import pkgdb2.lib.exceptions
 
 from bugzilla import Bugzilla
+from dogpile.cache.api import NO_VALUE
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
 
 # The Fedora Account System Module
 from fedora.client.fas2 import AccountSystem
@@ -51,6 +58,28 @@ _BUGZILLA = None
 _FAS = None
 # Have a global dict with all the RHEL versions in
 _RHEL_PKGS = None
+# Key under which the current generation of the cached exports is stored
+EXPORTS_GENERATION_KEY = 'pkgdb2.exports.generation'
+# Key set in the info dict of a session which changed the exports
+_EXPORTS_STALE = 'pkgdb2.exports.stale'
+# Key set in the info dict of a session which changed the VCS ACLs
+_VCS_STALE = 'pkgdb2.vcs.stale'
+# Topics of the changes which can change the VCS ACLs: ACLs, point of
+# contact, status and branches (and renaming the packages, see `log`)
+_VCS_TOPICS = frozenset([
+    'acl.update', 'acl.delete', 'owner.update', 'branch.start',
+    'branch.complete', 'package.branch.new', 'package.branch.delete',
+    'package.new', 'package.delete', 'package.update.status',
+    'collection.new', 'collection.update',
+])
+# Topics of the changes which can change the exports, the summary of the
+# packages being in the bugzilla export and their name in every export
+_EXPORTS_TOPICS = _VCS_TOPICS | frozenset(['package.update'])
+# Thread regenerating the snapshot of the VCS ACLs in the background and
+# the event used to wake it up
+_VCS_SNAPSHOT_THREAD = None
+_VCS_SNAPSHOT_EVENT = threading.Event()
+_VCS_SNAPSHOT_LOCK = threading.Lock()
 
 
 def get_fas():  # pragma: no cover
@@ -120,6 +149,136 @@ def get_bz_email_user(username):  # pragma: no cover
     return fas.person_by_username(username)
 
 
+def get_exports_generation():
+    ''' Return the generation of the cached exports (bugzilla, notify,
+    vcs...) currently valid, starting a new one if there is none in the
+    cache.
+    '''
+    generation = pkgdb2.CACHE.get(EXPORTS_GENERATION_KEY)
+    if generation is NO_VALUE:
+        generation = invalidate_exports_cache()
+    return generation
+
+
+def invalidate_exports_cache():
+    ''' Start a new generation of the cached exports, making all the
+    exports cached so far unreachable.
+    '''
+    generation = uuid.uuid4().hex
+    pkgdb2.CACHE.set(EXPORTS_GENERATION_KEY, generation)
+    return generation
+
+
+def exports_key_generator(namespace, fn, to_str=unicode):
+    ''' Key generator to use with ``pkgdb2.CACHE.cache_on_arguments`` for
+    the exports.
+
+    The keys generated include the current generation of the exports and
+    every argument of the function, whether it is given as positional or
+    keyword argument or left to its default value.
+    '''
+    argnames, _, _, defaults = inspect.getargspec(fn)
+    defaults = dict(zip(argnames[len(argnames) - len(defaults or []):],
+                        defaults or []))
+
+    prefix = '%s:%s' % (fn.__module__, fn.__name__)
+    if namespace is not None:
+        prefix = '%s|%s' % (prefix, namespace)
+
+    def generate_key(*args, **kwargs):
+        ''' Return the key for the provided arguments. '''
+        values = dict(defaults)
+        values.update(zip(argnames, args))
+        values.update(kwargs)
+        arguments = '|'.join(to_str(values.get(arg)) for arg in argnames)
+        return '%s|%s|%s' % (
+            prefix, get_exports_generation(),
+            hashlib.sha1(arguments.encode('utf-8')).hexdigest())
+
+    return generate_key
+
+
+def _refresh_vcs_snapshot(session):
+    ''' Regenerate the snapshot of the VCS ACLs with the changes committed,
+    in the provided session, another process regenerating it at the same
+    time being fine.
+    '''
+    try:
+        pkgdb2.lib.refresh_vcs_snapshot(session)
+        session.commit()
+    except IntegrityError:
+        # Regenerated by another process for the same changes
+        session.rollback()
+    except SQLAlchemyError:  # pragma: no cover
+        session.rollback()
+        raise
+
+
+def _refresh_vcs_snapshot_worker():
+    ''' Regenerate the snapshot of the VCS ACLs every time it is asked
+    for, changes committed while it is being regenerated leading to a
+    single new regeneration.
+    '''
+    while True:
+        _VCS_SNAPSHOT_EVENT.wait()
+        _VCS_SNAPSHOT_EVENT.clear()
+        try:
+            try:
+                _refresh_vcs_snapshot(pkgdb2.SESSION())
+            finally:
+                pkgdb2.SESSION.remove()
+        except Exception as err:  # pragma: no cover
+            # Keep the thread running for the next changes
+            pkgdb2.LOG.exception(err)
+
+
+def schedule_vcs_snapshot_refresh():
+    ''' Ask for the snapshot of the VCS ACLs to be regenerated in the
+    background, starting the thread doing it if needed.
+    '''
+    global _VCS_SNAPSHOT_THREAD
+    with _VCS_SNAPSHOT_LOCK:
+        if _VCS_SNAPSHOT_THREAD is None or \
+                not _VCS_SNAPSHOT_THREAD.is_alive():
+            _VCS_SNAPSHOT_THREAD = threading.Thread(
+                target=_refresh_vcs_snapshot_worker,
+                name='pkgdb2-vcs-snapshot')
+            _VCS_SNAPSHOT_THREAD.daemon = True
+            _VCS_SNAPSHOT_THREAD.start()
+    _VCS_SNAPSHOT_EVENT.set()
+
+
+def _invalidate_exports_on_commit(session):
+    ''' Invalidate the cached exports once a session which changed them has
+    been committed, and regenerate the snapshot of the VCS ACLs if they
+    changed, in the background unless configured otherwise.
+    '''
+    if session.info.pop(_EXPORTS_STALE, False):
+        invalidate_exports_cache()
+    if session.info.pop(_VCS_STALE, False) \
+            and pkgdb2.APP.config.get('PKGDB2_VCS_SNAPSHOT', True):
+        if pkgdb2.APP.config.get('PKGDB2_VCS_SNAPSHOT_BACKGROUND', True):
+            schedule_vcs_snapshot_refresh()
+        else:
+            # The committed session cannot start a new transaction here
+            refresh_session = Session(bind=session.get_bind())
+            try:
+                _refresh_vcs_snapshot(refresh_session)
+            finally:
+                refresh_session.close()
+
+
+def _reset_exports_on_rollback(session):
+    ''' The changes of a rolled back session do not affect the exports.
+    '''
+    session.info.pop(_EXPORTS_STALE, None)
+    session.info.pop(_VCS_STALE, None)
+
+
+event.listen(Session, 'after_commit', _invalidate_exports_on_commit)
+event.listen(Session, 'after_rollback', _reset_exports_on_rollback)
+
+
 def get_bz():  # pragma: no cover
     '''Retrieve a connection to bugzilla
 
@@ -231,10 +390,15 @@ def log(session, package, topic, message):
 
     # To avoid a circular import.
     import pkgdb2.lib.model as model
-    from pkgdb2.lib.notifications import fedmsg_publish, email_publish
+    from pkgdb2.lib.notifications import (
+        fedmsg_publish, fedmsg_publish_on_commit, email_publish,
+        email_publish_on_commit, email_body)
 
     if pkgdb2.APP.config.get('PKGDB2_FEDMSG_NOTIFICATION', True):
-        fedmsg_publish(topic, message)
+        if pkgdb2.APP.config.get('PKGDB2_FEDMSG_ASYNC', False):
+            fedmsg_publish_on_commit(session, topic, message)
+        else:
+            fedmsg_publish(topic, message)
 
     # A big lookup of fedmsg topics to model.Log template strings.
     templates = {
@@ -345,15 +509,23 @@ def log(session, package, topic, message):
         subject = subject_templates[topic] % substitutions
 
     model.Log.insert(session, message['agent'], package, final_msg)
-
-    if pkgdb2.APP.config.get(
-            'PKGDB2_EMAIL_NOTIFICATION', False):  # pragma: no cover
-        body_email = final_msg
-        if package:
-            body_email = '{0}\n\nTo make changes to this package see:\n' \
-                '{1}/package/{2}'.format(
-                    final_msg, pkgdb2.APP.config.get('SITE_URL'),
-                    package.name)
+    # The cached exports and the VCS ACLs they depend on need to be
+    # regenerated when this is committed
+    if topic in _EXPORTS_TOPICS:
+        session.info[_EXPORTS_STALE] = True
+    renamed = 'name' in message.get('fields', [])
+    if topic in _VCS_TOPICS or (topic == 'package.update' and renamed):
+        session.info[_VCS_STALE] = True
+
+    if not pkgdb2.APP.config.get('PKGDB2_EMAIL_NOTIFICATION', False):
+        return final_msg
+
+    if pkgdb2.APP.config.get('PKGDB2_EMAIL_ASYNC', False):
+        email_publish_on_commit(
+            session, message['agent'], package, final_msg, subject=subject)
+    else:  # pragma: no cover
+        body_email = email_body(
+            [final_msg], package.name if package else None)
         email_publish(
             message['agent'], package, body_email, subject=subject)
 
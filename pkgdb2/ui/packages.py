@@ -73,7 +73,7 @@ def list_packages(namespace=None, motif=None, orphaned=None, status=None,
         limit = APP.config['ITEMS_PER_PAGE']
         flask.flash('Incorrect limit provided, using default', 'errors')
 
-    packages = pkgdblib.search_package(
+    packages, packages_count = pkgdblib.search_package(
         SESSION,
         namespace=namespace,
         pkg_name=pattern,
@@ -84,19 +84,7 @@ def list_packages(namespace=None, motif=None, orphaned=None, status=None,
         page=page,
         limit=limit,
         case_sensitive=case_sensitive,
-    )
-    packages_count = pkgdblib.search_package(
-        SESSION,
-        namespace=namespace,
-        pkg_name=pattern,
-        pkg_branch=branches,
-        pkg_poc=owner,
-        orphaned=orphaned,
-        status=status,
-        page=page,
-        limit=limit,
-        count=True,
-        case_sensitive=case_sensitive,
+        with_count=True,
     )
     total_page = int(ceil(packages_count / float(limit)))
 
@@ -37,7 +37,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
 from pkgdb2 import APP, FAS, LOG
-from pkgdb2.lib import model
+from pkgdb2.lib import model, typeahead
 
 #DB_PATH = 'sqlite:///:memory:'
 ## A file database is required to check the integrity, don't ask
@@ -120,6 +120,10 @@ class Modeltests(unittest.TestCase):
             if os.path.exists(dbfile):
                 os.unlink(dbfile)
         self.session = model.create_tables(DB_PATH, debug=False)
+        # Each test has its own database, thus its own names
+        typeahead.reset()
+        # The tests check the snapshot of the VCS ACLs right after commit
+        APP.config['PKGDB2_VCS_SNAPSHOT_BACKGROUND'] = False
         # Create the docker namespace
         obj = model.Namespace('docker')
         self.session.add(obj)
@@ -332,6 +332,9 @@ engineers need to create packages and spin them into a distribution."""
             '<LongName>pkgdb Web OpenSearch</LongName>' in output.data)
         self.assertTrue(
             '<Param name="type" value="packages"/>' in output.data)
+        self.assertTrue(
+            '/api/typeahead?type=packages&amp;format=opensearch'
+            '&amp;term={searchTerms}' in output.data)
 
         output = self.app.get('/opensearch/pkgdb_packager.xml')
         self.assertTrue(
@@ -91,6 +91,30 @@ class FlaskApiAdminTest(Modeltests):
         self.assertEqual(data['page_total'], 2)
         self.assertEqual(data['output'], 'ok')
 
+        # Page through the actions with a cursor
+        output = self.app.get('/api/admin/actions/')
+        actions = [act['id'] for act in json.loads(output.data)['actions']]
+        self.assertEqual(len(actions), 2)
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            output = self.app.get(
+                '/api/admin/actions/?limit=1&cursor=%s' % cursor)
+            self.assertEqual(output.status_code, 200)
+            data = json.loads(output.data)
+            self.assertFalse('page_total' in data)
+            self.assertEqual(data['output'], 'ok')
+            seen.extend([act['id'] for act in data['actions']])
+            cursor = data['next_cursor']
+        self.assertEqual(seen, actions)
+
+        output = self.app.get('/api/admin/actions/?cursor=foo')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(data['output'], 'notok')
+        self.assertEqual(data['error'], 'Invalid cursor provided')
+
         output = self.app.get('/api/admin/actions/?package=guake')
         data = json.loads(output.data)
         self.assertEqual(data['page'], 1)
@@ -26,18 +26,24 @@ pkgdb tests for the Flask API regarding collections.
 __requires__ = ['SQLAlchemy >= 0.8']
 import pkg_resources
 
+import calendar
+import datetime
 import json
 import unittest
 import sys
 import os
+import time
+
+from dogpile.cache.backends.memory import MemoryBackend
+from mock import patch
 
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
 import pkgdb2
-from tests import (Modeltests, create_package_acl, create_package_acl2,
-                   create_package_critpath, create_retired_pkgs,
-                   create_docker_packages)
+from tests import (Modeltests, FakeFasUserAdmin, create_package_acl,
+                   create_package_acl2, create_package_critpath,
+                   create_retired_pkgs, create_docker_packages)
 
 
 def clean_since_pending_acls(data):
@@ -67,6 +73,12 @@ class FlaskApiExtrasTest(Modeltests):
         # Let's make sure the cache is empty for the tests
         pkgdb2.CACHE.invalidate()
 
+        # The snapshot of the VCS ACLs is not generated in the background,
+        # the tests share their session with the application
+        patcher = patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_api_bugzilla_empty(self):
         """ Test the api_bugzilla function with an empty database. """
 
@@ -117,7 +129,7 @@ class FlaskApiExtrasTest(Modeltests):
 # Collection|Package|Description|Owner|Initial QA|Initial CCList
 # Backslashes (\) are escaped as \u005c Pipes (|) are escaped as \u007c
 
-Fedora|fedocal|A web-based calendar for Fedora|pingou||pingou
+Fedora|fedocal|A web-based calendar for Fedora|pingou||
 Fedora|geany|A fast and lightweight IDE using GTK2|group::gtk-sig||
 Fedora|guake|Top down terminal for GNOME|pingou||spot"""
         self.assertEqual(output.data, expected)
@@ -137,7 +149,7 @@ Fedora|guake|Top down terminal for GNOME|pingou||spot"""
                         "owner": "pingou",
                         "cclist": {
                             "groups": [],
-                            "people": ["pingou"]
+                            "people": []
                         },
                         "qacontact": None,
                         "summary": "A web-based calendar for Fedora"
@@ -195,7 +207,7 @@ Fedora|guake|Top down terminal for GNOME|pingou||spot"""
 # Collection|Package|Description|Owner|Initial QA|Initial CCList
 # Backslashes (\) are escaped as \u005c Pipes (|) are escaped as \u007c
 
-Fedora|fedocal|A web-based calendar for Fedora|pingou||pingou
+Fedora|fedocal|A web-based calendar for Fedora|pingou||
 Fedora|geany|A fast and lightweight IDE using GTK2|group::gtk-sig||
 Fedora|guake|Top down terminal for GNOME|pingou||spot
 Fedora Docker|cockpit|Server Management GUI|puiterwijk||group::gtk-sig,pingou
@@ -217,7 +229,7 @@ Fedora Docker|fedocal|A web-based calendar for Fedora|pingou||spot"""
                         "owner": "pingou",
                         "cclist": {
                             "groups": [],
-                            "people": ["pingou"]
+                            "people": []
                         },
                         "qacontact": None,
                         "summary": "A web-based calendar for Fedora"
@@ -690,6 +702,272 @@ avail | @provenpackager, | docker/offlineimap/master"""
 
         self.assertEqual(data, expected)
 
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.lib.utils.get_bz_email_user')
+    def test_api_vcs_cached(self, bz_mail_func, pkger_func):
+        """ Test that the output of api_vcs is cached and that the cache
+        is invalidated when the ACLs change. """
+        bz_mail_func.return_value = 1
+        pkger_func.return_value = ['pingou', 'spot']
+        create_package_acl2(self.session)
+
+        expected = """# VCS ACLs
+# avail|@groups,users|namespace/Package/branch
+
+avail | @provenpackager,pingou | rpms/fedocal/f17"""
+
+        with patch.object(pkgdb2.CACHE, 'backend', MemoryBackend({})):
+            with patch('pkgdb2.lib.vcs_acls',
+                       wraps=pkgdb2.lib.vcs_acls) as vcs_func:
+                output = self.app.get('/api/vcs/?collection=f17')
+                self.assertEqual(output.status_code, 200)
+                self.assertEqual(output.data, expected)
+                self.assertEqual(vcs_func.call_count, 1)
+
+                # Served from the cache
+                output = self.app.get('/api/vcs/?collection=f17')
+                self.assertEqual(output.status_code, 200)
+                self.assertEqual(output.data, expected)
+                self.assertEqual(vcs_func.call_count, 1)
+
+                # Different arguments, different entry in the cache
+                output = self.app.get('/api/vcs/?collection=f18')
+                self.assertEqual(output.status_code, 200)
+                self.assertEqual(vcs_func.call_count, 2)
+
+                # Changing an ACL invalidates the cache once committed
+                pkgdb2.lib.set_acl_package(
+                    self.session,
+                    namespace='rpms',
+                    pkg_name='fedocal',
+                    pkg_branch='f17',
+                    pkg_user='spot',
+                    acl='commit',
+                    status='Approved',
+                    user=FakeFasUserAdmin(),
+                )
+                self.session.commit()
+                output = self.app.get('/api/vcs/?collection=f17')
+                self.assertEqual(output.status_code, 200)
+                self.assertEqual(
+                    output.data,
+                    expected.replace('pingou |', 'pingou,spot |'))
+                self.assertEqual(vcs_func.call_count, 3)
+
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.lib.utils.get_bz_email_user')
+    def test_api_vcs_snapshot(self, bz_mail_func, pkger_func):
+        """ Test that api_vcs is served from a snapshot regenerated when the
+        ACLs change. """
+        bz_mail_func.return_value = 1
+        pkger_func.return_value = ['pingou', 'spot']
+        create_package_acl2(self.session)
+
+        # No snapshot yet, the ACLs are computed and the snapshot generated
+        # in the background
+        with patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh') \
+                as schedule_func:
+            output = self.app.get('/api/vcs/')
+            self.assertEqual(output.status_code, 200)
+            self.assertFalse('X-Pkgdb-Generation' in output.headers)
+            self.assertTrue(schedule_func.called)
+        expected = output.data
+        self.assertEqual(
+            self.session.query(pkgdb2.lib.model.VcsSnapshot).count(), 0)
+
+        pkgdb2.lib.refresh_vcs_snapshot(self.session)
+        self.session.commit()
+
+        output = self.app.get('/api/vcs/')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '1')
+        self.assertEqual(output.data, expected)
+        self.assertTrue(
+            'avail | @provenpackager,pingou | rpms/fedocal/f17\n'
+            in output.data)
+
+        output = self.app.get('/api/vcs/?format=json&callback=foo')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '1')
+        self.assertTrue(output.data.startswith('foo({'))
+
+        # Nothing changed, no new generation
+        output = self.app.get('/api/vcs/')
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '1')
+        self.assertEqual(
+            self.session.query(pkgdb2.lib.model.VcsSnapshot).count(), 1)
+
+        pkgdb2.lib.set_acl_package(
+            self.session,
+            namespace='rpms',
+            pkg_name='fedocal',
+            pkg_branch='f17',
+            pkg_user='spot',
+            acl='commit',
+            status='Approved',
+            user=FakeFasUserAdmin(),
+        )
+        # Regenerated with the changes committed
+        self.session.commit()
+
+        output = self.app.get('/api/vcs/?format=json')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '2')
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['rpms']['fedocal']['f17']['commit']['people'],
+            ['pingou', 'spot'])
+
+        # Regenerated in the background, the outdated snapshot is served
+        pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_BACKGROUND'] = True
+        try:
+            with patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh') \
+                    as schedule_func:
+                pkgdb2.lib.set_acl_package(
+                    self.session,
+                    namespace='rpms',
+                    pkg_name='fedocal',
+                    pkg_branch='f17',
+                    pkg_user='spot',
+                    acl='commit',
+                    status='Obsolete',
+                    user=FakeFasUserAdmin(),
+                )
+                self.session.commit()
+                self.assertEqual(schedule_func.call_count, 1)
+
+                output = self.app.get('/api/vcs/')
+                self.assertEqual(output.headers['X-Pkgdb-Generation'], '2')
+                self.assertEqual(schedule_func.call_count, 1)
+        finally:
+            pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_BACKGROUND'] = False
+        self.assertEqual(
+            self.session.query(pkgdb2.lib.model.VcsSnapshot).count(), 2)
+
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.lib.utils.get_bz_email_user')
+    def test_api_vcs_since(self, bz_mail_func, pkger_func):
+        """ Test the api_vcs function returning the changes since a given
+        generation. """
+        bz_mail_func.return_value = 1
+        pkger_func.return_value = ['pingou', 'spot']
+        create_package_acl2(self.session)
+
+        output = self.app.get('/api/vcs/?since=abc')
+        self.assertEqual(output.status_code, 400)
+        data = json.loads(output.data)
+        self.assertEqual(data['error'], 'Invalid since or since_date argument')
+
+        output = self.app.get('/api/vcs/?since=1&collection=f17')
+        self.assertEqual(output.status_code, 400)
+
+        # No snapshot yet
+        with patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh'):
+            output = self.app.get('/api/vcs/?since=1')
+        self.assertEqual(output.status_code, 503)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['error'],
+            'The VCS ACLs are not available yet, try again later')
+
+        pkgdb2.lib.refresh_vcs_snapshot(self.session)
+        self.session.commit()
+
+        # First generation, nothing changed since
+        output = self.app.get('/api/vcs/?since=1&format=json')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['generation'], 1)
+        self.assertEqual(data['full'], False)
+        self.assertEqual(data['changes'], {})
+
+        # Unknown generation, everything is returned
+        output = self.app.get('/api/vcs/?since=42&format=json')
+        data = json.loads(output.data)
+        self.assertEqual(data['full'], True)
+        self.assertEqual(
+            sorted(data['changes']), ['docker', 'modules', 'rpms'])
+
+        pkgdb2.lib.set_acl_package(
+            self.session,
+            namespace='rpms',
+            pkg_name='fedocal',
+            pkg_branch='f17',
+            pkg_user='spot',
+            acl='commit',
+            status='Approved',
+            user=FakeFasUserAdmin(),
+        )
+        self.session.commit()
+
+        output = self.app.get('/api/vcs/?since=1')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '2')
+        expected = """# VCS ACLs changes
+# avail|@groups,users|namespace/Package/branch
+# unavail||namespace/Package/branch
+# generation: 2
+# since: 1
+# full: False
+
+avail | @provenpackager,pingou,spot | rpms/fedocal/f17"""
+        self.assertEqual(output.data, expected)
+
+        output = self.app.get('/api/vcs/?since=1&namespace=docker')
+        self.assertEqual(
+            output.data.split('\n')[-2], '# full: False')
+
+        # Changes since a date
+        output = self.app.get('/api/vcs/?since_date=0&format=json')
+        data = json.loads(output.data)
+        self.assertEqual(data['full'], True)
+
+        output = self.app.get(
+            '/api/vcs/?since_date=%s&format=json' % time.time())
+        data = json.loads(output.data)
+        self.assertEqual(data['since'], 2)
+        self.assertEqual(data['changes'], {})
+
+        snapshot = pkgdb2.lib.model.VcsSnapshot.get(self.session, 1)
+        snapshot.date_created = datetime.datetime(2016, 10, 1)
+        self.session.add(snapshot)
+        self.session.commit()
+        output = self.app.get(
+            '/api/vcs/?since_date=%s&format=json'
+            % calendar.timegm(datetime.date(2016, 10, 2).timetuple()))
+        data = json.loads(output.data)
+        self.assertEqual(data['since'], 1)
+        self.assertEqual(data['full'], False)
+        self.assertEqual(
+            data['changes'],
+            {'rpms': {'fedocal': {'f17': {'commit': {
+                'groups': ['provenpackager'], 'people': ['pingou', 'spot'],
+            }}}}})
+
+    def test_api_exports_stream(self):
+        """ Test that the streamed text exports are the same as the ones
+        sent at once. """
+        create_package_acl2(self.session)
+        create_docker_packages(self.session)
+
+        # Both are in the order of the database
+        for url in [
+                '/api/vcs/', '/api/vcs/?eol=True', '/api/vcs/?collection=f18',
+                '/api/notify/', '/api/notify/?namespace=1', '/api/bugzilla/',
+                '/api/notify/all', '/api/notify/all?name=Fedora']:
+            output = self.app.get(url)
+            self.assertEqual(output.status_code, 200)
+            separator = '&' if '?' in url else '?'
+            output_stream = self.app.get(url + separator + 'stream=1')
+            self.assertEqual(output_stream.status_code, 200)
+            self.assertEqual(output_stream.data, output.data)
+
+        output_stream = self.app.get('/api/vcs/?stream=1&namespace=foo')
+        self.assertEqual(output_stream.status_code, 200)
+        self.assertEqual(
+            output_stream.data,
+            '# VCS ACLs\n# avail|@groups,users|namespace/Package/branch\n\n')
+
     def test_api_critpath_empty(self):
         """ Test the api_critpath function with an empty database. """
 
@@ -1148,6 +1426,179 @@ kernel-maint"""
 
         self.assertEqual(data, expected)
 
+    def test_api_conditional_get(self):
+        """ Test the ETag and Last-Modified headers of the read-only
+        endpoints and the answers to the conditional requests. """
+        create_package_acl(self.session)
+        create_package_critpath(self.session)
+
+        output = self.app.get('/api/koschei/')
+        self.assertEqual(output.status_code, 200)
+        etag = output.headers['ETag']
+
+        with patch('pkgdb2.lib.get_koschei_monitored_package') as func:
+            output = self.app.get(
+                '/api/koschei/', headers={'If-None-Match': etag})
+            self.assertEqual(output.status_code, 304)
+            self.assertEqual(output.data, '')
+            self.assertEqual(output.headers['ETag'], etag)
+            self.assertFalse(func.called)
+
+        # The representation depends on the arguments
+        output = self.app.get(
+            '/api/koschei/?format=json', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertNotEqual(output.headers['ETag'], etag)
+
+        pkgdb2.lib.set_koschei_monitor_package(
+            self.session, 'rpms', 'guake', True, user=FakeFasUserAdmin())
+        self.session.commit()
+
+        output = self.app.get(
+            '/api/koschei/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(
+            output.data, "# Number of packages: 2\nguake\nkernel")
+        self.assertNotEqual(output.headers['ETag'], etag)
+        last_modified = output.headers['Last-Modified']
+
+        output = self.app.get(
+            '/api/koschei/', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(output.status_code, 304)
+
+        # A change committed after another one, but logged before it with a
+        # lower identifier, is not missed
+        etag = output.headers['ETag']
+        pkgdb2.lib.set_koschei_monitor_package(
+            self.session, 'rpms', 'guake', False, user=FakeFasUserAdmin())
+        pkgdb2.lib.model.Log.write_pending(self.session)
+        self.session.query(pkgdb2.lib.model.Log).filter(
+            pkgdb2.lib.model.Log.id
+            == pkgdb2.lib.model.Log.latest(self.session).id
+        ).update({'id': 0, 'change_time': datetime.datetime(2016, 1, 1)})
+        self.session.commit()
+
+        output = self.app.get(
+            '/api/koschei/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.data, "# Number of packages: 1\nkernel")
+        output = self.app.get(
+            '/api/koschei/',
+            headers={'If-Modified-Since': 'Sat, 01 Oct 2016 00:00:00 GMT'})
+        self.assertEqual(output.status_code, 200)
+
+        output = self.app.get(
+            '/api/groups/',
+            headers={'If-Modified-Since': 'Sat, 01 Oct 2016 00:00:00 GMT'})
+        self.assertEqual(output.status_code, 200)
+
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.lib.utils.get_bz_email_user')
+    def test_api_vcs_conditional_get(self, bz_mail_func, pkger_func):
+        """ Test that the validators of api_vcs are those of the snapshot
+        served. """
+        bz_mail_func.return_value = 1
+        pkger_func.return_value = ['pingou', 'spot']
+        create_package_acl2(self.session)
+        pkgdb2.lib.refresh_vcs_snapshot(self.session)
+        self.session.commit()
+
+        output = self.app.get('/api/vcs/')
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '1')
+        etag = output.headers['ETag']
+
+        # Changed, but the snapshot is not regenerated yet
+        pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_BACKGROUND'] = True
+        try:
+            with patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh'):
+                pkgdb2.lib.set_acl_package(
+                    self.session,
+                    namespace='rpms',
+                    pkg_name='fedocal',
+                    pkg_branch='f17',
+                    pkg_user='spot',
+                    acl='commit',
+                    status='Approved',
+                    user=FakeFasUserAdmin(),
+                )
+                self.session.commit()
+        finally:
+            pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_BACKGROUND'] = False
+
+        output = self.app.get('/api/vcs/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 304)
+
+        # The changes are served with a new ETag once regenerated
+        pkgdb2.lib.refresh_vcs_snapshot(self.session)
+        self.session.commit()
+        output = self.app.get('/api/vcs/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers['X-Pkgdb-Generation'], '2')
+        self.assertNotEqual(output.headers['ETag'], etag)
+        self.assertTrue(
+            'avail | @provenpackager,pingou,spot | rpms/fedocal/f17'
+            in output.data)
+
+        # The ACLs computed, not from the snapshot, use the last change
+        output = self.app.get('/api/vcs/?eol=True')
+        etag = output.headers['ETag']
+        pkgdb2.lib.set_koschei_monitor_package(
+            self.session, 'rpms', 'fedocal', True, user=FakeFasUserAdmin())
+        self.session.commit()
+        output = self.app.get(
+            '/api/vcs/?eol=True', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+
+    def test_api_typeahead(self):
+        """ Test the api_typeahead function.  """
+        output = self.app.get('/api/typeahead/?term=gu')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data, {'output': 'ok', 'packages': []})
+
+        create_package_acl(self.session)
+        create_docker_packages(self.session)
+
+        output = self.app.get('/api/typeahead/?term=G')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['packages'],
+            [
+                {'namespace': 'rpms', 'name': 'geany'},
+                {'namespace': 'rpms', 'name': 'guake'},
+            ]
+        )
+
+        output = self.app.get('/api/typeahead/?term=G&limit=1')
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['packages'], [{'namespace': 'rpms', 'name': 'geany'}])
+
+        output = self.app.get('/api/typeahead/?term=o&namespace=docker')
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['packages'], [{'namespace': 'docker', 'name': 'offlineimap'}])
+
+        output = self.app.get('/api/typeahead/?term=p&type=packager')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data, {'output': 'ok', 'packagers': ['pingou']})
+
+        output = self.app.get(
+            '/api/typeahead/?term=gua&type=packages&format=opensearch')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(
+            output.headers['Content-Type'], 'application/x-suggestions+json')
+        self.assertEqual(json.loads(output.data), ['gua', ['guake']])
+
+        output = self.app.get('/api/typeahead/?term=gu&type=foo')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {'output': 'notok', 'error': 'Invalid kind of names provided'})
+
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(FlaskApiExtrasTest)
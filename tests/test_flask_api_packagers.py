@@ -275,6 +275,132 @@ class FlaskApiPackagersTest(Modeltests):
         self.assertEqual(len(output['packagers']), 1)
         self.assertEqual(output['packagers'][0], 'pingou')
 
+        output = self.app.get('/api/packagers/')
+        packagers = json.loads(output.data)['packagers']
+        self.assertTrue(len(packagers) > 2)
+
+        # Page through the packagers with a cursor
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            output = self.app.get(
+                '/api/packagers/?limit=2&cursor=%s' % cursor)
+            self.assertEqual(output.status_code, 200)
+            output = json.loads(output.data)
+            self.assertEqual(
+                sorted(output.keys()),
+                ['next_cursor', 'output', 'packagers'])
+            self.assertTrue(len(output['packagers']) <= 2)
+            seen.extend(output['packagers'])
+            cursor = output['next_cursor']
+        self.assertEqual(seen, packagers)
+
+        output = self.app.get('/api/packagers/?cursor=foo')
+        self.assertEqual(output.status_code, 500)
+        output = json.loads(output.data)
+        self.assertEqual(
+            output,
+            {
+                "output": "notok",
+                "error": "Invalid cursor provided",
+            }
+        )
+
+    def test_packager_permissions(self):
+        """ Test the api_packager_permissions function.  """
+        output = self.app.get('/api/packager/permissions/')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {"output": "notok", "error": "Invalid request"})
+
+        output = self.app.get(
+            '/api/packager/permissions/pingou/?packages=guake&acls=foo')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                "output": "notok",
+                "error": 'Invalid request, "foo" is an invalid acl'
+            }
+        )
+
+        output = self.app.get(
+            '/api/packager/permissions/pingou/?packages=rpms/guake/f18/foo')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                "output": "notok",
+                "error": 'Invalid request, "rpms/guake/f18/foo" is an '
+                'invalid package'
+            }
+        )
+
+        create_package_acl(self.session)
+
+        output = self.app.get(
+            '/api/packager/permissions/pingou/?packages=guake'
+            '&packages=rpms/guake/f18&packages=docker/guake'
+            '&acls=commit&acls=approveacls')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                "output": "ok",
+                "packager": "pingou",
+                "acls": ["commit", "approveacls"],
+                "packages": [
+                    {
+                        "namespace": "rpms",
+                        "name": "guake",
+                        "branch": None,
+                        "acls": {"commit": True, "approveacls": True},
+                    },
+                    {
+                        "namespace": "rpms",
+                        "name": "guake",
+                        "branch": "f18",
+                        "acls": {"commit": True, "approveacls": False},
+                    },
+                    {
+                        "namespace": "docker",
+                        "name": "guake",
+                        "branch": None,
+                        "acls": {"commit": False, "approveacls": False},
+                    },
+                ]
+            }
+        )
+
+        data = {
+            'packagername': 'toshio',
+            'packages': ['rpms/guake/master', 'rpms/geany/master'],
+        }
+        output = self.app.post('/api/packager/permissions/', data=data)
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['packager'], 'toshio')
+        self.assertEqual(
+            data['acls'],
+            ['commit', 'watchbugzilla', 'watchcommits', 'approveacls'])
+        self.assertEqual(
+            [pkg['acls'] for pkg in data['packages']],
+            [
+                {
+                    "commit": False, "watchbugzilla": False,
+                    "watchcommits": False, "approveacls": False,
+                },
+                {
+                    "commit": False, "watchbugzilla": False,
+                    "watchcommits": False, "approveacls": False,
+                },
+            ]
+        )
+
     def test_packager_stats(self):
         """ Test the api_packager_stats function.  """
 
@@ -31,6 +31,7 @@ import unittest
 import sys
 import os
 
+import sqlalchemy as sa
 from mock import patch
 
 sys.path.insert(0, os.path.join(os.path.dirname(
@@ -1431,6 +1432,127 @@ class FlaskApiPackagesTest(Modeltests):
         self.assertEqual(data['packages'][0]['name'], 'geany')
         self.assertEqual(data['packages'][1]['name'], 'guake')
 
+        # Skip the total number of packages
+        output = self.app.get('/api/packages/g*/?count=false')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            sorted(data.keys()),
+            ['output', 'packages', 'page'])
+        self.assertEqual(data['output'], 'ok')
+        self.assertEqual(len(data['packages']), 2)
+
+        # The pages are computed over all the patterns and branches
+        output = self.app.get(
+            '/api/packages/?pattern=guake&pattern=gea*&branches=master'
+            '&branches=f18&limit=1&page=2')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['output'], 'ok')
+        self.assertEqual(data['page'], 2)
+        self.assertEqual(data['page_total'], 2)
+        self.assertEqual(
+            [pkg['name'] for pkg in data['packages']], ['guake'])
+
+        output = self.app.get(
+            '/api/packages/?pattern=guake&pattern=gea*&branches=master'
+            '&branches=f18&count=1')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], 2)
+
+        # Page through the packages with a cursor
+        output = self.app.get('/api/packages/?acls=0')
+        packages = [pkg['name'] for pkg in json.loads(output.data)['packages']]
+        self.assertTrue(len(packages) > 2)
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            output = self.app.get(
+                '/api/packages/?acls=0&limit=2&cursor=%s' % cursor)
+            self.assertEqual(output.status_code, 200)
+            data = json.loads(output.data)
+            self.assertEqual(
+                sorted(data.keys()),
+                ['next_cursor', 'output', 'packages', 'page'])
+            seen.extend([pkg['name'] for pkg in data['packages']])
+            cursor = data['next_cursor']
+        self.assertEqual(seen, packages)
+
+        for cursor in ['foo', pkgdb2.lib.encode_cursor('a', 'b')]:
+            output = self.app.get('/api/packages/?cursor=%s' % cursor)
+            self.assertEqual(output.status_code, 500)
+            data = json.loads(output.data)
+            self.assertEqual(data['output'], 'notok')
+            self.assertEqual(data['error'], 'Invalid cursor provided')
+
+    def test_api_package_list_queries(self):
+        """ Test that the number of queries ran by api_package_list does
+        not depend on the number of packages returned.  """
+        create_package_acl(self.session)
+        create_package_critpath(self.session)
+
+        queries = []
+
+        def count_query(*args, **kwargs):
+            """ Record each query ran. """
+            queries.append(args[2])
+
+        def get_packages():
+            """ Return the number of packages listed and of queries ran. """
+            del queries[:]
+            sa.event.listen(
+                self.session.bind, 'before_cursor_execute', count_query)
+            try:
+                output = self.app.get('/api/packages/?acls=1')
+            finally:
+                sa.event.remove(
+                    self.session.bind, 'before_cursor_execute', count_query)
+            self.assertEqual(output.status_code, 200)
+            data = json.loads(output.data)
+            self.assertTrue(
+                all(pkg['acls'] for pkg in data['packages']))
+            return len(data['packages']), len(queries)
+
+        nb_packages, nb_queries = get_packages()
+        self.assertEqual(nb_packages, 4)
+
+        collections = [
+            model.Collection.by_name(self.session, 'master'),
+            model.Collection.by_name(self.session, 'f18'),
+        ]
+        for cnt in range(10):
+            package = model.Package(
+                name='package%s' % cnt,
+                summary='Package number %s' % cnt,
+                status='Approved',
+            )
+            self.session.add(package)
+            self.session.flush()
+            for collection in collections:
+                listing = model.PackageListing(
+                    point_of_contact='pingou',
+                    status='Approved',
+                    package_id=package.id,
+                    collection_id=collection.id,
+                )
+                self.session.add(listing)
+                self.session.flush()
+                for acl in ['commit', 'watchcommits', 'watchbugzilla']:
+                    self.session.add(model.PackageListingAcl(
+                        fas_name='pingou',
+                        packagelisting_id=listing.id,
+                        acl=acl,
+                        status='Approved',
+                    ))
+        self.session.commit()
+
+        nb_packages2, nb_queries2 = get_packages()
+        self.assertEqual(nb_packages2, 14)
+        self.assertEqual(nb_queries2, nb_queries)
+        self.assertTrue(nb_queries <= 5)
+
     @patch('pkgdb2.lib.utils')
     @patch('pkgdb2.is_admin')
     def test_api_package_edit(self, login_func, mock_func):
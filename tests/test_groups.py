@@ -121,7 +121,7 @@ class PkgdbGrouptests(Modeltests):
 # Collection|Package|Description|Owner|Initial QA|Initial CCList
 # Backslashes (\) are escaped as \u005c Pipes (|) are escaped as \u007c
 
-Fedora|fedocal|A web-based calendar for Fedora|pingou||group::infra-sig,pingou
+Fedora|fedocal|A web-based calendar for Fedora|pingou||group::infra-sig
 Fedora|geany|A fast and lightweight IDE using GTK2|group::gtk-sig||
 Fedora|guake|Top down terminal for GNOME|pingou||spot"""
         self.assertEqual(output.data, expected)
@@ -135,7 +135,7 @@ Fedora|guake|Top down terminal for GNOME|pingou||spot"""
                         "owner": "pingou",
                         "cclist": {
                             "groups": ["@infra-sig"],
-                            "people": ["pingou"]
+                            "people": []
                         },
                         "qacontact": None,
                         "summary": "A web-based calendar for Fedora"
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+pkgdb tests for the notifications sent in the background.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import asyncore
+import email
+import json
+import smtpd
+import threading
+import unittest
+import sys
+import os
+
+from mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pkgdb2
+import pkgdb2.lib as pkgdblib
+from pkgdb2.lib import notifications
+from tests import Modeltests, FakeFasUser, create_package_acl
+
+
+class StubSMTPServer(smtpd.SMTPServer):
+    """ SMTP server keeping the emails it receives, refusing them with the
+    reply set, temporarily by default, as long as asked to.
+    """
+
+    def __init__(self):
+        """ Listen on a free port of the loopback interface. """
+        self.messages = []
+        self.connections = 0
+        self.refuse = 0
+        self.reply = '451 Try again later'
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.address = '%s:%s' % self.socket.getsockname()
+        # The loop stops once the server and its channels are closed
+        self.thread = threading.Thread(
+            target=asyncore.loop, kwargs={'timeout': 0.05})
+        self.thread.daemon = True
+
+    def handle_accept(self):
+        """ Count the connections. """
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        """ Keep the email received, unless asked to refuse it. """
+        if self.refuse:
+            self.refuse -= 1
+            return self.reply
+        self.messages.append((mailfrom, rcpttos, email.message_from_string(
+            data)))
+
+
+class Notificationstests(Modeltests):
+    """ Notifications tests. """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(Notificationstests, self).setUp()
+        pkgdb2.APP.config['PKGDB2_FEDMSG_ASYNC'] = True
+        # Start each test with new queues and new counters
+        notifications.FEDMSG_QUEUE.reset()
+        notifications.EMAIL_QUEUE.reset()
+
+    def tearDown(self):
+        """ Restore the configuration, ran after every tests. """
+        pkgdb2.APP.config['PKGDB2_FEDMSG_ASYNC'] = False
+        pkgdb2.APP.config['PKGDB2_FEDMSG_QUEUE_SIZE'] = 10000
+        pkgdb2.APP.config['PKGDB2_EMAIL_NOTIFICATION'] = False
+        pkgdb2.APP.config['PKGDB2_EMAIL_ASYNC'] = False
+        pkgdb2.APP.config['PKGDB2_EMAIL_SMTP_SERVER'] = 'localhost'
+        pkgdb2.APP.config['PKGDB2_EMAIL_RETRIES'] = 3
+        pkgdb2.APP.config['PKGDB2_EMAIL_RETRY_DELAY'] = 1
+        notifications._close_smtp()
+        super(Notificationstests, self).tearDown()
+
+    def start_smtp_server(self):
+        """ Start a stub SMTP server and send the emails to it. """
+        server = StubSMTPServer()
+        server.thread.start()
+        self.addCleanup(server.close)
+        pkgdb2.APP.config['PKGDB2_EMAIL_NOTIFICATION'] = True
+        pkgdb2.APP.config['PKGDB2_EMAIL_ASYNC'] = True
+        pkgdb2.APP.config['PKGDB2_EMAIL_SMTP_SERVER'] = server.address
+        return server
+
+    @patch('pkgdb2.lib.notifications.fedmsg')
+    def test_fedmsg_on_commit(self, fedmsg):
+        """ Test that the fedmsg messages are published once committed. """
+        create_package_acl(self.session)
+
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUser())
+        self.assertTrue(notifications.fedmsg_flush(timeout=5))
+        self.assertEqual(fedmsg.publish.call_count, 0)
+
+        self.session.commit()
+        self.assertTrue(notifications.fedmsg_flush(timeout=5))
+        self.assertEqual(fedmsg.publish.call_count, 1)
+        kwargs = fedmsg.publish.call_args[1]
+        self.assertEqual(kwargs['topic'], 'package.monitor.update')
+        self.assertEqual(kwargs['modname'], 'pkgdb')
+        self.assertEqual(kwargs['msg']['package']['name'], 'guake')
+
+        # The messages of a rolled back change are not published
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', False, FakeFasUser())
+        self.session.rollback()
+        self.session.commit()
+        self.assertTrue(notifications.fedmsg_flush(timeout=5))
+        self.assertEqual(fedmsg.publish.call_count, 1)
+
+        stats = notifications.fedmsg_queue_stats()
+        self.assertEqual(stats['published'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertTrue(stats['running'])
+
+    @patch('pkgdb2.lib.notifications.fedmsg')
+    def test_fedmsg_queue_full(self, fedmsg):
+        """ Test that a stalled bus does not block the requests. """
+        pkgdb2.APP.config['PKGDB2_FEDMSG_QUEUE_SIZE'] = 1
+        started = threading.Event()
+        release = threading.Event()
+
+        def publish(**kwargs):
+            """ Publish the first message only once released. """
+            started.set()
+            release.wait()
+            if kwargs['topic'] == 'test.failed':
+                raise IOError('Could not publish')
+
+        fedmsg.publish.side_effect = publish
+
+        notifications.fedmsg_publish_on_commit(self.session, 'test.1', {})
+        self.session.commit()
+        self.assertTrue(started.wait(5))
+
+        # The bus is stalled, one message is queued, the other dropped
+        notifications.fedmsg_publish_on_commit(
+            self.session, 'test.failed', {})
+        notifications.fedmsg_publish_on_commit(self.session, 'test.3', {})
+        self.session.commit()
+
+        stats = notifications.fedmsg_queue_stats()
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertFalse(notifications.fedmsg_flush(timeout=0.1))
+
+        release.set()
+        self.assertTrue(notifications.fedmsg_flush(timeout=5))
+        self.assertEqual(
+            [call[1]['topic'] for call in fedmsg.publish.call_args_list],
+            ['test.1', 'test.failed'])
+
+        stats = notifications.fedmsg_queue_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['published'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['dropped'], 1)
+
+    @patch('pkgdb2.lib.notifications.fedmsg')
+    def test_email_digest(self, fedmsg):
+        """ Test that the emails of a transaction are merged and sent over
+        a single connection once committed. """
+        server = self.start_smtp_server()
+        create_package_acl(self.session)
+
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUser())
+        pkgdblib.set_koschei_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUser())
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(server.messages, [])
+
+        self.session.commit()
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(len(server.messages), 1)
+        mailfrom, rcpttos, msg = server.messages[0]
+        self.assertEqual(mailfrom, 'nobody@fedoraproject.org')
+        self.assertEqual(rcpttos, ['guake-owner@fedoraproject.org'])
+        self.assertEqual(msg['Subject'], '[PkgDB] pingou updated guake')
+        body = msg.get_payload()
+        self.assertIn(
+            'user: pingou updated the monitoring status of guake to True\n\n'
+            'user: pingou updated the Koschei monitoring status of guake '
+            'to True', body)
+        self.assertEqual(
+            body.count('To make changes to this package see:'), 1)
+
+        # The connection is reused by the next transaction
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', False, FakeFasUser())
+        self.session.commit()
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(len(server.messages), 2)
+
+        # The emails of a rolled back change are not sent
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUser())
+        self.session.rollback()
+        self.session.commit()
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(len(server.messages), 2)
+
+        stats = notifications.email_queue_stats()
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(server.connections, 1)
+
+    @patch('pkgdb2.lib.notifications.fedmsg')
+    def test_email_retry(self, fedmsg):
+        """ Test that the emails temporarily refused are sent again. """
+        server = self.start_smtp_server()
+        server.refuse = 1
+        pkgdb2.APP.config['PKGDB2_EMAIL_RETRY_DELAY'] = 0.01
+        create_package_acl(self.session)
+
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUser())
+        self.session.commit()
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(len(server.messages), 1)
+
+        stats = notifications.email_queue_stats()
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['connections'], 2)
+
+        # Permanent failures are not retried
+        server.refuse = 1
+        server.reply = '550 No such user'
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', False, FakeFasUser())
+        self.session.commit()
+        self.assertTrue(notifications.email_flush(timeout=5))
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(server.refuse, 0)
+
+        stats = notifications.email_queue_stats()
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(stats['failed'], 1)
+
+    def test_api_queues(self):
+        """ Test the api_queues function. """
+        app = pkgdb2.APP.test_client()
+        output = app.get('/api/queues/')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                'output': 'ok',
+                'fedmsg': {
+                    'batches': 0,
+                    'dropped': 0,
+                    'failed': 0,
+                    'published': 0,
+                    'queued': 0,
+                    'running': False,
+                },
+                'email': {
+                    'batches': 0,
+                    'connections': 0,
+                    'dropped': 0,
+                    'failed': 0,
+                    'queued': 0,
+                    'retried': 0,
+                    'running': False,
+                    'sent': 0,
+                },
+            }
+        )
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Notificationstests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -56,6 +56,29 @@ class Packagetests(Modeltests):
                          "reviewurl=u'https://bugzilla.redhat.com/450189')",
                          packages[0].__repr__())
 
+    def test_hash_package(self):
+        """ Test that packages are hashed and compared on their identity. """
+        create_package(self.session)
+        package = model.Package.by_name(self.session, 'rpms', 'guake')
+
+        # The same row is the same object
+        self.assertTrue(
+            package is model.Package.by_name(self.session, 'rpms', 'guake'))
+        self.assertEqual(
+            len(set(model.Package.all(self.session))),
+            len(model.Package.all(self.session)))
+
+        other = model.Package(
+            name='guake', namespace='rpms', summary='Another summary',
+            status='Approved')
+        self.assertNotEqual(package, other)
+        self.assertEqual(len(set([package, other])), 2)
+
+        # Renaming a package does not lose it
+        packages = set([package])
+        package.name = 'guake2'
+        self.assertTrue(package in packages)
+
     def test_to_json(self):
         """ Test the to_json function of Package. """
         create_package(self.session)
@@ -135,6 +158,40 @@ class Packagetests(Modeltests):
         self.assertEqual(len(packages), 1)
         self.assertEqual(packages[0].name, 'geany')
 
+    def test_search_prefix(self):
+        """ Test the search function of Package on name prefixes. """
+        create_package_acl(self.session)
+
+        packages = model.Package.search(
+            session=self.session, namespace='rpms', pkg_name='G%',
+            case_sensitive=False)
+        self.assertEqual(
+            [pkg.name for pkg in packages], ['geany', 'guake'])
+
+        packages = model.Package.search(
+            session=self.session, namespace='rpms', pkg_name='gu%')
+        self.assertEqual([pkg.name for pkg in packages], ['guake'])
+
+        packages = model.Package.search(
+            session=self.session, namespace='rpms', pkg_name='G%')
+        self.assertEqual(packages, [])
+
+        packages = model.Package.search(
+            session=self.session, namespace='rpms', pkg_name='GUAKE',
+            case_sensitive=False)
+        self.assertEqual([pkg.name for pkg in packages], ['guake'])
+
+        packages = model.Package.search(
+            session=self.session, namespace='rpms', pkg_name='%A%',
+            case_sensitive=False)
+        self.assertEqual(
+            [pkg.name for pkg in packages], ['fedocal', 'geany', 'guake'])
+
+        self.assertEqual(model._like_prefix('gu%'), 'gu')
+        self.assertEqual(model._like_prefix('g_%'), None)
+        self.assertEqual(model._like_prefix('%gu%'), None)
+        self.assertEqual(model._like_prefix('guake'), None)
+
     def test_get_package_of_user(self):
         """ Test the get_package_of_user function of Package. """
         create_package_acl(self.session)
@@ -35,7 +35,7 @@ from datetime import datetime
 
 from mock import patch
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
@@ -758,6 +758,54 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(pkgs[0].name, 'geany')
         self.assertEqual(pkgs[1].name, 'guake')
 
+        # The packages of the page and the total number of packages
+        pkgs, cnt = pkgdblib.search_package(self.session,
+                                            namespace='rpms',
+                                            pkg_name='g*',
+                                            pkg_branch='f18',
+                                            limit=1,
+                                            page=2,
+                                            with_count=True
+                                            )
+        self.assertEqual([pkg.name for pkg in pkgs], ['guake'])
+        self.assertEqual(cnt, 2)
+
+        pkgs, cnt = pkgdblib.search_package(self.session,
+                                            namespace='rpms',
+                                            pkg_name='g*',
+                                            pkg_branch='f18',
+                                            limit=1,
+                                            page=3,
+                                            with_count=True
+                                            )
+        self.assertEqual(pkgs, [])
+        self.assertEqual(cnt, 2)
+
+        pkgs, cnt = pkgdblib.search_package(self.session,
+                                            namespace='rpms',
+                                            pkg_name='foo*',
+                                            with_count=True
+                                            )
+        self.assertEqual(pkgs, [])
+        self.assertEqual(cnt, 0)
+
+        # Several patterns, branches and statuses at once
+        pkgs = pkgdblib.search_package(self.session,
+                                       namespace='rpms',
+                                       pkg_name=['guake', 'gea*', 'foo'],
+                                       pkg_branch=['master', 'f18'],
+                                       status=['Approved', 'Orphaned'],
+                                       )
+        self.assertEqual([pkg.name for pkg in pkgs], ['geany', 'guake'])
+
+        pkgs = pkgdblib.search_package(self.session,
+                                       namespace='rpms',
+                                       pkg_name=['guake', 'gea*'],
+                                       pkg_branch=['el4', 'f18'],
+                                       status=['Retired'],
+                                       )
+        self.assertEqual(pkgs, [])
+
         pkgs = pkgdblib.search_package(self.session,
                                        namespace='docker',
                                        pkg_name='g*',
@@ -1139,6 +1187,126 @@ class PkgdbLibtests(Modeltests):
                           page='a'
                           )
 
+    def test_complete_names(self):
+        """ Test the complete_names function. """
+        create_package_acl(self.session)
+
+        names = pkgdblib.complete_names(self.session, 'G')
+        self.assertEqual(names, [('rpms', 'geany'), ('rpms', 'guake')])
+
+        names = pkgdblib.complete_names(
+            self.session, 'pi', kind='packagers')
+        self.assertEqual(names, ['pingou'])
+
+        # Packages committed are added to the index built
+        package = pkgdblib.model.Package(
+            name='Gnome-shell', namespace='rpms', summary='Gnome shell',
+            status='Approved')
+        self.session.add(package)
+        self.session.commit()
+        package = pkgdblib.model.Package(
+            name='gnumeric', namespace='rpms', summary='Spreadsheet',
+            status='Approved')
+        self.session.add(package)
+        self.session.flush()
+        self.session.rollback()
+
+        names = pkgdblib.complete_names(self.session, 'gn', limit=5)
+        self.assertEqual(names, [('rpms', 'Gnome-shell')])
+
+        # Packages renamed are completed under their new name only
+        package = pkgdblib.model.Package.by_name(
+            self.session, 'rpms', 'guake')
+        pkgdblib.edit_package(
+            self.session, package, pkg_name='guake2',
+            user=FakeFasUserAdmin())
+        self.session.commit()
+        names = pkgdblib.complete_names(self.session, 'gu')
+        self.assertEqual(names, [('rpms', 'guake2')])
+
+        # Packages deleted are no longer completed
+        package = pkgdblib.model.Package.by_name(
+            self.session, 'rpms', 'Gnome-shell')
+        self.session.delete(package)
+        self.session.commit()
+        names = pkgdblib.complete_names(self.session, 'gn')
+        self.assertEqual(names, [])
+
+        # The index is rebuilt once it is too old
+        index = pkgdb2.lib.typeahead.get_index(self.session)
+        self.assertEqual(
+            pkgdb2.lib.typeahead.get_index(self.session), index)
+        index.built -= pkgdb2.APP.config['PKGDB2_TYPEAHEAD_REFRESH'] + 1
+        self.assertNotEqual(
+            pkgdb2.lib.typeahead.get_index(self.session), index)
+
+        self.assertRaises(PkgdbException,
+                          pkgdblib.complete_names,
+                          self.session,
+                          'g',
+                          kind='foo'
+                          )
+
+        self.assertRaises(PkgdbException,
+                          pkgdblib.complete_names,
+                          self.session,
+                          'g',
+                          limit='a'
+                          )
+
+    def test_rebuild_typeahead(self):
+        """ Test that the typeahead index is rebuilt once, keeping the
+        old one in use meanwhile and without losing the names committed
+        during the rebuild. """
+        create_package_acl(self.session)
+        index = pkgdb2.lib.typeahead.get_index(self.session)
+        index.built -= pkgdb2.APP.config['PKGDB2_TYPEAHEAD_REFRESH'] + 1
+        all_names = pkgdblib.model.Package.all_names
+
+        def read_then_commit(session):
+            """ Read the names, then commit a new package while the index
+            is being built. """
+            names = all_names(session)
+            # Another request keeps using the index too old
+            self.assertEqual(
+                pkgdb2.lib.typeahead.get_index(self.session), index)
+            package = pkgdblib.model.Package(
+                name='gnumeric', namespace='rpms', summary='Spreadsheet',
+                status='Approved')
+            self.session.add(package)
+            self.session.commit()
+            return names
+
+        with patch('pkgdb2.lib.model.Package.all_names',
+                   side_effect=read_then_commit) as func:
+            new_index = pkgdb2.lib.typeahead.get_index(self.session)
+            self.assertEqual(func.call_count, 1)
+        self.assertNotEqual(new_index, index)
+        self.assertEqual(
+            pkgdb2.lib.typeahead.get_index(self.session), new_index)
+        self.assertEqual(
+            new_index.complete_packages('gn'), [('rpms', 'gnumeric')])
+
+    def test_preload_typeahead(self):
+        """ Test the preload function of the typeahead index. """
+        create_package_acl(self.session)
+
+        pkgdb2.lib.typeahead.preload(self.session)
+        self.assertEqual(pkgdb2.lib.typeahead._INDEX, None)
+
+        pkgdb2.APP.config['PKGDB2_TYPEAHEAD_PRELOAD'] = True
+        try:
+            pkgdb2.lib.typeahead.preload(self.session)
+        finally:
+            pkgdb2.APP.config['PKGDB2_TYPEAHEAD_PRELOAD'] = False
+        index = pkgdb2.lib.typeahead._INDEX
+        self.assertNotEqual(index, None)
+        self.assertEqual(
+            index.complete_packages('g'),
+            [('rpms', 'geany'), ('rpms', 'guake')])
+        self.assertEqual(
+            pkgdb2.lib.typeahead.get_index(self.session), index)
+
     def test_get_acl_packager(self):
         """ Test the get_acl_packager function. """
         acls = pkgdblib.get_acl_packager(self.session, 'pingou')
@@ -1281,6 +1449,122 @@ class PkgdbLibtests(Modeltests):
             self.session, 'toshio', 'rpms', 'guake', acl=['commit',
                                                           'approveacls']))
 
+    def test_has_acls_request(self):
+        """ Test that has_acls retrieves the ACLs once per request. """
+        create_package_acl(self.session)
+
+        with pkgdb2.APP.test_request_context():
+            with patch('pkgdb2.lib.get_acl_user_package',
+                       wraps=pkgdblib.get_acl_user_package) as acls:
+                for branch in ['master', 'f18', 'f17']:
+                    self.assertEqual(
+                        pkgdblib.has_acls(
+                            self.session, 'pingou', 'rpms', 'guake',
+                            acl='approveacls', branch=branch),
+                        branch == 'master')
+                self.assertTrue(pkgdb2.is_pkg_admin(
+                    self.session, FakeFasUser(), 'rpms', 'guake'))
+                self.assertEqual(acls.call_count, 1)
+
+                self.assertFalse(pkgdblib.has_acls(
+                    self.session, 'toshio', 'rpms', 'guake', acl='commit'))
+                self.assertEqual(acls.call_count, 2)
+
+                # Changing the ACLs drops what was retrieved
+                acl = pkgdblib.model.PackageListingAcl.get(
+                    self.session, 'pingou',
+                    pkgdblib.model.PackageListing.by_pkgid_collectionid(
+                        self.session,
+                        pkgdblib.model.Package.by_name(
+                            self.session, 'rpms', 'guake').id,
+                        pkgdblib.model.Collection.by_name(
+                            self.session, 'master').id).id,
+                    'approveacls')
+                acl.status = 'Obsolete'
+                self.session.add(acl)
+                self.session.flush()
+
+                self.assertFalse(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertEqual(acls.call_count, 3)
+
+                self.session.rollback()
+                self.assertTrue(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertEqual(acls.call_count, 4)
+
+                # Changing the ACLs in bulk drops what was retrieved
+                table = pkgdblib.model.PackageListingAcl.__table__
+                self.session.execute(table.update().where(
+                    table.c.fas_name == 'pingou'
+                ).values(status='Obsolete'))
+                self.assertFalse(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertEqual(acls.call_count, 5)
+
+                self.session.rollback()
+                self.assertTrue(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertEqual(acls.call_count, 6)
+                self.session.query(pkgdblib.model.PackageListingAcl).filter(
+                    pkgdblib.model.PackageListingAcl.fas_name == 'pingou'
+                ).update({'status': 'Obsolete'}, synchronize_session=False)
+                self.assertFalse(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertEqual(acls.call_count, 7)
+
+    def test_has_acls_packages(self):
+        """ Test the has_acls_packages function. """
+        packages = [
+            ('rpms', 'guake'), ('rpms', 'guake', 'master'),
+            ('rpms', 'guake', 'f18'), ('rpms', 'geany'), ('docker', 'guake'),
+        ]
+        output = pkgdblib.has_acls_packages(
+            self.session, 'pingou', packages, acl='commit')
+        self.assertEqual(
+            output, dict((pkg, {'commit': False}) for pkg in packages))
+
+        create_package_acl(self.session)
+
+        output = pkgdblib.has_acls_packages(
+            self.session, 'pingou', packages, acl=['commit', 'approveacls'])
+        self.assertEqual(
+            output,
+            {
+                ('rpms', 'guake'): {'commit': True, 'approveacls': True},
+                ('rpms', 'guake', 'master'): {
+                    'commit': True, 'approveacls': True},
+                ('rpms', 'guake', 'f18'): {
+                    'commit': True, 'approveacls': False},
+                ('rpms', 'geany'): {'commit': False, 'approveacls': False},
+                ('docker', 'guake'): {'commit': False, 'approveacls': False},
+            }
+        )
+
+        output = pkgdblib.has_acls_packages(
+            self.session, 'pingou', [('rpms', 'guake', 'master')])
+        self.assertEqual(
+            output[('rpms', 'guake', 'master')],
+            {'commit': True, 'approveacls': True, 'watchcommits': True,
+             'watchbugzilla': False})
+
+        # Within a request the ACLs retrieved are used by has_acls
+        with pkgdb2.APP.test_request_context():
+            with patch('pkgdb2.lib.get_acl_user_package') as acls:
+                pkgdblib.has_acls_packages(
+                    self.session, 'pingou', packages, acl='commit')
+                self.assertTrue(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'guake',
+                    acl='approveacls', branch='master'))
+                self.assertFalse(pkgdblib.has_acls(
+                    self.session, 'pingou', 'rpms', 'geany', acl='commit'))
+                self.assertEqual(acls.call_count, 0)
+
     def test_get_status(self):
         """ Test the get_status function. """
         obs = pkgdblib.get_status(self.session)
@@ -1429,6 +1713,90 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(package.summary, 'Youhou Fedora is awesome!')
         self.assertEqual(package.status, 'Orphaned')
 
+    def test_update_packages_info(self):
+        """ Test the update_packages_info function. """
+        create_package_acl(self.session)
+        info = {
+            # Unchanged
+            'guake': (
+                'Top down terminal for GNOME', 'Top down terminal...',
+                'http://guake.org'),
+            # New summary, the empty description is ignored
+            'geany': ('A fast IDE', '', 'http://www.geany.org/'),
+            'unknown': ('Not in pkgdb', 'Not in pkgdb', None),
+        }
+
+        self.assertRaises(PkgdbException,
+                          pkgdblib.update_packages_info,
+                          self.session,
+                          info,
+                          user=FakeFasUser())
+
+        output = pkgdblib.update_packages_info(
+            self.session, info, user=FakeFasUserAdmin())
+        self.assertEqual(
+            output,
+            {
+                'found': ['geany', 'guake'],
+                'updated': ['geany'],
+                'missing': ['fedocal'],
+            }
+        )
+        self.session.commit()
+
+        package = pkgdblib.search_package(self.session, 'rpms', 'geany')[0]
+        self.assertEqual(package.summary, 'A fast IDE')
+        self.assertEqual(package.description, 'Lightweight GNOME IDE...')
+        self.assertEqual(package.upstream_url, 'http://www.geany.org/')
+        self.assertEqual(
+            pkgdblib.search_logs(self.session, limit=1)[0].description,
+            "user: admin updated ['summary', 'upstream_url'] package: "
+            "geany")
+
+        # Restricted to some packages, nothing left to update
+        output = pkgdblib.update_packages_info(
+            self.session, info, user=FakeFasUserAdmin(),
+            names=['geany', 'fedocal'])
+        self.assertEqual(
+            output, {'found': ['geany'], 'updated': [], 'missing': ['fedocal']})
+
+        # Restricted to the packages changed, guake is left alone
+        info['guake'] = ('Drop-down terminal', '', None)
+        output = pkgdblib.update_packages_info(
+            self.session, info, user=FakeFasUserAdmin(), changed=['geany'])
+        self.assertEqual(
+            output,
+            {
+                'found': ['geany', 'guake'],
+                'updated': [],
+                'missing': ['fedocal'],
+            }
+        )
+
+    def test_repo_sync(self):
+        """ Test the get_repo_sync and save_repo_sync functions. """
+        self.assertEqual(
+            pkgdblib.get_repo_sync(self.session, 'rawhide'), (None, {}))
+
+        pkgdblib.save_repo_sync(
+            self.session, 'rawhide', 'abc', '1',
+            {'guake': '123', 'geany': '456'})
+        self.session.commit()
+        self.assertEqual(
+            pkgdblib.get_repo_sync(self.session, 'rawhide'),
+            ('abc', {'guake': '123', 'geany': '456'}))
+
+        # Only the hashes changed are written
+        pkgdblib.save_repo_sync(
+            self.session, 'rawhide', 'def', '2',
+            {'guake': '789', 'fedocal': '000'})
+        self.session.commit()
+        self.assertEqual(
+            pkgdblib.get_repo_sync(self.session, 'rawhide'),
+            ('def', {'guake': '789', 'fedocal': '000'}))
+        self.assertEqual(
+            pkgdblib.get_repo_sync(self.session, 'f23'), (None, {}))
+
     def test_get_top_maintainers(self):
         """ Test the get_top_maintainers funtion. """
         create_package_acl(self.session)
@@ -1512,6 +1880,97 @@ class PkgdbLibtests(Modeltests):
         logs = pkgdblib.search_logs(self.session, packager='pingou')
         self.assertEqual(len(logs), 0)
 
+        # Page through the logs with a cursor
+        logs = pkgdblib.search_logs(self.session)
+        seen = []
+        cursor = None
+        while True:
+            page = pkgdblib.search_logs(self.session, limit=5, cursor=cursor)
+            seen.extend(page)
+            if len(page) < 5:
+                break
+            cursor = pkgdblib.encode_cursor(
+                page[-1].change_time, page[-1].id)
+        self.assertEqual(seen, logs)
+
+        self.assertRaises(PkgdbException,
+                          pkgdblib.search_logs,
+                          self.session,
+                          cursor='foo'
+                          )
+
+    def test_log_insert_deferred(self):
+        """ Test that the log entries are inserted at once on commit. """
+        create_package_acl(self.session)
+        package = pkgdblib.model.Package.by_name(
+            self.session, 'rpms', 'guake')
+        log_table = pkgdblib.model.Log.__table__
+
+        def count_logs():
+            """ Count the log entries written in the database. """
+            return self.session.execute(log_table.count()).scalar()
+
+        before = count_logs()
+        for idx in range(250):
+            pkgdblib.model.Log.insert(
+                self.session, 'pingou', package, 'change %s' % idx)
+        pkgdblib.model.Log.insert(self.session, 'pingou', None, 'no package')
+        self.assertEqual(count_logs(), before)
+
+        self.session.commit()
+        self.assertEqual(count_logs(), before + 251)
+        logs = self.session.execute(
+            log_table.select().order_by(log_table.c.id.desc()).limit(3)
+        ).fetchall()
+        self.assertEqual(
+            [(log.description, log.package_id) for log in logs],
+            [('no package', None), ('change 249', package.id),
+             ('change 248', package.id)])
+
+        # The entries of a rolled back transaction are not inserted
+        pkgdblib.model.Log.insert(self.session, 'pingou', package, 'gone')
+        self.session.rollback()
+        self.session.commit()
+        self.assertEqual(count_logs(), before + 251)
+
+        # Reading the logs writes the pending entries first
+        pkgdblib.model.Log.insert(self.session, 'pingou', package, 'read')
+        self.assertEqual(
+            pkgdblib.model.Log.latest(self.session).description, 'read')
+
+    def test_cursor(self):
+        """ Test the encode_cursor and decode_cursor functions. """
+        date = datetime(2016, 10, 18, 12, 30, 15, 1234)
+        cursor = pkgdblib.encode_cursor(u'guake', 3, date)
+        self.assertEqual(
+            pkgdblib.decode_cursor(cursor, (basestring, int, datetime)),
+            (u'guake', 3, date))
+
+        for cursor in [
+                'foo', cursor, pkgdblib.encode_cursor({'a': 1}),
+                pkgdblib.encode_cursor('a', 'b'),
+                pkgdblib.encode_cursor('a', ['b']),
+                pkgdblib.encode_cursor(['a'], 1),
+                pkgdblib.encode_cursor('a', {'b': 1}),
+                pkgdblib.encode_cursor('a', True),
+                pkgdblib.encode_cursor('a', None),
+                pkgdblib.encode_cursor('a', 1.5)]:
+            self.assertRaises(PkgdbException,
+                              pkgdblib.decode_cursor,
+                              cursor,
+                              (basestring, int)
+                              )
+
+        for cursor in [
+                pkgdblib.encode_cursor(u'guake', 1),
+                pkgdblib.encode_cursor({'date': 1}, 1),
+                pkgdblib.encode_cursor({'date': 'foo'}, 1)]:
+            self.assertRaises(PkgdbException,
+                              pkgdblib.decode_cursor,
+                              cursor,
+                              (datetime, int)
+                              )
+
     def test_unorphan_package(self):
         """ Test the unorphan_package function. """
         create_package_acl(self.session)
@@ -1713,6 +2172,166 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(pkg_acl[0].acls[0].fas_name, 'josef')
         self.assertEqual(len(pkg_acl[0].acls), 3)
 
+    def test_add_branch_resume(self):
+        """ Test that add_branch branches by chunks and resumes. """
+        create_package_acl(self.session)
+        new_collection = pkgdblib.model.Collection(
+            name='Fedora',
+            version='19',
+            status='Active',
+            owner='toshio',
+            branchname='f19',
+            dist_tag='.fc19',
+        )
+        self.session.add(new_collection)
+        self.session.commit()
+
+        master = pkgdblib.model.Collection.by_name(self.session, 'master')
+        package_ids = pkgdblib.model.PackageListing.branch_package_ids(
+            self.session, master.id, ['modules'])
+        self.assertEqual(len(package_ids), 3)
+
+        # The branching fails on the second chunk
+        branch_packages = pkgdblib.model.PackageListing.branch_packages
+        calls = []
+
+        def failing_branch_packages(*args, **kwargs):
+            """ Fail on the second call. """
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise SQLAlchemyError('Connection lost')
+            return branch_packages(*args, **kwargs)
+
+        with patch('pkgdb2.lib.model.PackageListing.branch_packages',
+                   side_effect=failing_branch_packages):
+            output = pkgdblib.add_branch(
+                session=self.session,
+                clt_from='master',
+                clt_to='f19',
+                user=FakeFasUserAdmin(),
+                chunk_size=1,
+            )
+        self.assertEqual(
+            output,
+            ['FAILED: failed to branch Fedora devel to Fedora 19 after the '
+             'package #%s, branch again to resume' % package_ids[0]])
+
+        state = pkgdblib.model.BranchProgress.get(
+            self.session, master.id, new_collection.id)
+        self.assertEqual(state.last_package_id, package_ids[0])
+        self.assertEqual(state.listings, 1)
+        self.assertEqual(state.date_completed, None)
+
+        # Branching again resumes after the first package
+        reports = []
+        output = pkgdblib.add_branch(
+            session=self.session,
+            clt_from='master',
+            clt_to='f19',
+            user=FakeFasUserAdmin(),
+            chunk_size=1,
+            progress=reports.append,
+        )
+        self.assertEqual(
+            output,
+            ['SUCCESS: successfully branched (PackageListing) Fedora devel '
+             'to Fedora 19: 3 listings created',
+             'SUCCESS: successfully branched (PackageListingAcl) Fedora '
+             'devel to Fedora 19: 9 ACLs created'])
+        self.assertEqual(
+            [report['packages'] for report in reports], [2, 3])
+        self.assertEqual(reports[-1]['total'], 3)
+        self.assertEqual(reports[-1]['eta'], 0)
+        self.assertTrue(reports[-1]['rate'] > 0)
+
+        state = pkgdblib.model.BranchProgress.get(
+            self.session, master.id, new_collection.id)
+        self.assertEqual(state.last_package_id, package_ids[-1])
+        self.assertNotEqual(state.date_completed, None)
+
+        pkg_acl = pkgdblib.get_acl_package(self.session, 'rpms', 'guake')
+        self.assertEqual(pkg_acl[2].collection.branchname, 'f19')
+        self.assertEqual(len(pkg_acl[2].acls), 5)
+
+        # Branching again does not duplicate anything
+        output = pkgdblib.add_branch(
+            session=self.session,
+            clt_from='master',
+            clt_to='f19',
+            user=FakeFasUserAdmin(),
+        )
+        self.assertEqual(
+            output,
+            ['SUCCESS: successfully branched (PackageListing) Fedora devel '
+             'to Fedora 19: 0 listings created',
+             'SUCCESS: successfully branched (PackageListingAcl) Fedora '
+             'devel to Fedora 19: 0 ACLs created'])
+
+    def test_plan_branch(self):
+        """ Test the plan_branch function. """
+        create_package_acl(self.session)
+
+        self.assertRaises(PkgdbException,
+                          pkgdblib.plan_branch,
+                          session=self.session,
+                          clt_from='blah',
+                          clt_to='f19',
+                          )
+
+        # The collection branched to does not exist yet
+        plan = pkgdblib.plan_branch(self.session, 'master', 'f19')
+        self.assertEqual(
+            plan,
+            {
+                'exempted_namespaces': ['modules'],
+                'namespaces': {
+                    'docker': {'listings': 1, 'acls': 0},
+                    'rpms': {'listings': 2, 'acls': 9},
+                },
+                'collisions': [],
+                'packages': 3,
+                'chunks': 1,
+                'estimate': None,
+            }
+        )
+
+        # Some packages are already branched
+        plan = pkgdblib.plan_branch(
+            self.session, 'master', 'f18', chunk_size=2)
+        self.assertEqual(
+            plan['namespaces'],
+            {
+                'docker': {'listings': 1, 'acls': 0},
+                'rpms': {'listings': 0, 'acls': 7},
+            }
+        )
+        self.assertEqual(
+            plan['collisions'], [('rpms', 'geany'), ('rpms', 'guake')])
+        self.assertEqual(plan['chunks'], 2)
+
+        # Nothing is left to do once branched
+        new_collection = pkgdblib.model.Collection(
+            name='Fedora',
+            version='19',
+            status='Active',
+            owner='toshio',
+            branchname='f19',
+            dist_tag='.fc19',
+        )
+        self.session.add(new_collection)
+        self.session.commit()
+        pkgdblib.add_branch(
+            session=self.session,
+            clt_from='master',
+            clt_to='f19',
+            user=FakeFasUserAdmin()
+        )
+
+        plan = pkgdblib.plan_branch(self.session, 'master', 'f19')
+        self.assertEqual(plan['namespaces'], {})
+        self.assertEqual(len(plan['collisions']), 3)
+        self.assertEqual(plan['estimate'], 0)
+
     def test_get_critpath_packages(self):
         """ Test the get_critpath_packages method of pkgdblib. """
         create_package_acl(self.session)
@@ -1786,24 +2405,77 @@ class PkgdbLibtests(Modeltests):
 
         data = pkgdblib.notify(self.session, acls='commit')
         self.assertEqual(
-            data,
+            dict((pkg.name, users) for pkg, users in data.items()),
             {
-                u'guake': u'pingou',
-                u'geany': u'group::gtk-sig,josef',
-                u'core': 'josef',
+                u'guake': [u'pingou'],
+                u'geany': [u'group::gtk-sig', u'josef'],
+                u'core': [u'josef'],
             }
         )
 
         data = pkgdblib.notify(self.session)
         self.assertEqual(
-            data,
+            dict((pkg.name, users) for pkg, users in data.items()),
             {
-                u'guake': u'pingou',
-                u'geany': u'group::gtk-sig,josef',
-                u'core': 'josef',
+                u'guake': [u'pingou'],
+                u'geany': [u'group::gtk-sig', u'josef'],
+                u'core': [u'josef'],
             }
         )
 
+        data = list(pkgdblib.stream_notify(self.session))
+        self.assertEqual(
+            [(pkg.name, users) for pkg, users in data],
+            [
+                (u'core', [u'josef']),
+                (u'geany', [u'group::gtk-sig', u'josef']),
+                (u'guake', [u'pingou']),
+            ]
+        )
+
+    def test_bugzilla(self):
+        """ Test the bugzilla function. """
+        create_package_acl2(self.session)
+
+        # A watcher whose name starts with the name of another one
+        guake_pkg = pkgdblib.model.Package.by_name(
+            self.session, 'rpms', 'guake')
+        listing = pkgdblib.model.PackageListing.by_package_id(
+            self.session, guake_pkg.id)[0]
+        self.session.add(pkgdblib.model.PackageListingAcl(
+            fas_name='spo',
+            packagelisting_id=listing.id,
+            acl='watchbugzilla',
+            status='Approved',
+        ))
+        self.session.commit()
+
+        data = pkgdblib.bugzilla(self.session)
+        self.assertEqual(data.keys(), ['Fedora'])
+        self.assertEqual(
+            sorted(data['Fedora']), [u'fedocal', u'geany', u'guake'])
+        self.assertEqual(
+            data['Fedora']['guake'],
+            {
+                'collection': u'Fedora',
+                'name': u'guake',
+                'summary': u'Top down terminal for GNOME',
+                'poc': u'pingou',
+                'qa': '',
+                'cc': [u'spo', u'spot'],
+            }
+        )
+
+        data = list(pkgdblib.stream_bugzilla(self.session))
+        self.assertEqual(
+            [(pkg['name'], pkg['cc']) for pkg in data],
+            [
+                (u'fedocal', []),
+                (u'geany', []),
+                (u'guake', [u'spo', u'spot']),
+            ]
+        )
+
     def test_set_monitor_package(self):
         """ Test the set_monitor_package function. """
         self.assertFalse(
@@ -2370,6 +3042,134 @@ class PkgdbLibtests(Modeltests):
         result = pkgdblib.check_bz_url(BZ_BASE, "")
         self.assertEqual(result, None)
 
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.lib.utils.get_bz_email_user')
+    def test_refresh_vcs_snapshot(self, bz_mail_func, pkger_func):
+        """ Test the refresh_vcs_snapshot function. """
+        bz_mail_func.return_value = 1
+        pkger_func.return_value = ['pingou', 'spot']
+        create_package_acl(self.session)
+
+        # No snapshot yet, its generation is left to the background thread
+        with patch('pkgdb2.lib.utils.schedule_vcs_snapshot_refresh') \
+                as schedule_func:
+            self.assertEqual(pkgdblib.get_vcs_snapshot(self.session), None)
+            self.assertEqual(schedule_func.call_count, 1)
+
+        snapshot = pkgdblib.refresh_vcs_snapshot(self.session)
+        self.assertEqual(snapshot.generation, 1)
+        self.assertEqual(snapshot.change_count, 0)
+        self.assertTrue(
+            'avail | @provenpackager,pingou | rpms/guake/master'
+            in snapshot.text)
+
+        # Unchanged ACLs, the snapshot is kept
+        self.assertEqual(
+            pkgdblib.refresh_vcs_snapshot(self.session).generation, 1)
+        self.assertEqual(
+            pkgdblib.get_vcs_snapshot(self.session).generation, 1)
+
+        pkgdblib.set_acl_package(
+            self.session,
+            namespace='rpms',
+            pkg_name='guake',
+            pkg_branch='master',
+            pkg_user='spot',
+            acl='commit',
+            status='Approved',
+            user=FakeFasUserAdmin(),
+        )
+        # Reading the snapshot does not regenerate it
+        self.assertEqual(
+            pkgdblib.get_vcs_snapshot(self.session).generation, 1)
+
+        # Regenerated with the changes committed
+        pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_KEEP'] = 1
+        try:
+            self.session.commit()
+        finally:
+            pkgdb2.APP.config['PKGDB2_VCS_SNAPSHOT_KEEP'] = 3
+        snapshot = pkgdblib.get_vcs_snapshot(self.session)
+        self.assertEqual(snapshot.generation, 2)
+        self.assertEqual(snapshot.change_count, 1)
+        self.assertTrue(
+            'avail | @provenpackager,pingou,spot | rpms/guake/master'
+            in snapshot.text)
+
+        # Only the latest generation is kept
+        self.assertEqual(
+            self.session.query(pkgdblib.model.VcsSnapshot).count(), 1)
+
+        # The changes which cannot change the VCS ACLs do not regenerate it
+        with patch('pkgdb2.lib.refresh_vcs_snapshot') as refresh_func:
+            pkgdblib.set_monitor_package(
+                self.session, 'rpms', 'guake', True, FakeFasUserAdmin())
+            self.session.commit()
+            self.assertFalse(refresh_func.called)
+        self.assertEqual(
+            pkgdblib.model.ChangeCounter.current(self.session)[0], 2)
+
+        # Changes committed with a log entry older than the one of a change
+        # committed before are not missed
+        pkgdblib.set_acl_package(
+            self.session,
+            namespace='rpms',
+            pkg_name='guake',
+            pkg_branch='master',
+            pkg_user='spot',
+            acl='commit',
+            status='Obsolete',
+            user=FakeFasUserAdmin(),
+        )
+        pkgdblib.model.Log.write_pending(self.session)
+        self.session.query(pkgdblib.model.Log).filter(
+            pkgdblib.model.Log.id == pkgdblib.model.Log.latest(self.session).id
+        ).update({'id': 0})
+        self.session.commit()
+        snapshot = pkgdblib.get_vcs_snapshot(self.session)
+        self.assertEqual(snapshot.generation, 3)
+        self.assertEqual(snapshot.change_count, 3)
+        self.assertFalse(
+            'avail | @provenpackager,pingou,spot | rpms/guake/master'
+            in snapshot.text)
+
+    def test_change_counter(self):
+        """ Test that the change counter counts the sessions committed with
+        changes logged. """
+        self.assertEqual(
+            pkgdblib.model.ChangeCounter.current(self.session), (0, None))
+
+        create_package_acl(self.session)
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', True, FakeFasUserAdmin())
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'geany', True, FakeFasUserAdmin())
+        self.session.commit()
+        value, date_updated = pkgdblib.model.ChangeCounter.current(
+            self.session)
+        self.assertEqual(value, 1)
+        self.assertNotEqual(date_updated, None)
+
+        # Rolled back or without changes logged, nothing is counted
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', False, FakeFasUserAdmin())
+        self.session.rollback()
+        self.session.commit()
+        self.assertEqual(
+            pkgdblib.model.ChangeCounter.current(self.session),
+            (1, date_updated))
+
+        # The date of the last change never goes backward
+        counter = self.session.query(pkgdblib.model.ChangeCounter).one()
+        counter.date_updated = datetime(2100, 1, 1)
+        self.session.commit()
+        pkgdblib.set_monitor_package(
+            self.session, 'rpms', 'guake', False, FakeFasUserAdmin())
+        self.session.commit()
+        self.assertEqual(
+            pkgdblib.model.ChangeCounter.current(self.session),
+            (2, datetime(2100, 1, 1)))
+
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(PkgdbLibtests)
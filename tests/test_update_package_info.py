@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+pkgdb tests for the update_package_info script.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import bz2
+import gzip
+import imp
+import os
+import shutil
+import SimpleHTTPServer
+import SocketServer
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pkgdb2
+import pkgdb2.lib
+from tests import Modeltests, create_package_acl
+
+UPDATE_PACKAGE_INFO = imp.load_source(
+    'update_package_info', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'utility',
+        'update_package_info.py'))
+
+
+REPOMD = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <revision>%(revision)s</revision>
+  <data type="primary">
+    <location href="repodata/primary.xml.gz"/>
+  </data>
+  <data type="primary_db">
+    <checksum type="sha256">%(checksum)s</checksum>
+    <location href="repodata/%(checksum)s-primary.sqlite.%(ext)s"/>
+  </data>
+</repomd>
+'''
+
+
+def create_primary_db(path, packages):
+    """ Create a primary_db with the provided (name, summary, description,
+    url) packages. """
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, name TEXT, '
+        'summary TEXT, description TEXT, url TEXT)')
+    conn.executemany(
+        'INSERT INTO packages (name, summary, description, url) '
+        'VALUES (?, ?, ?, ?)', packages)
+    conn.commit()
+    conn.close()
+
+
+def create_repo(root, version, packages, ext, revision='1'):
+    """ Create the repodata of a repo serving a primary_db compressed
+    with the specified extension. """
+    repodata = os.path.join(root, version, 'repodata')
+    if not os.path.exists(repodata):
+        os.makedirs(repodata)
+    checksum = '%s%s' % (version, revision)
+
+    dbfile = os.path.join(repodata, 'primary.sqlite')
+    create_primary_db(dbfile, packages)
+    with open(dbfile, 'rb') as stream:
+        data = stream.read()
+    os.unlink(dbfile)
+
+    target = os.path.join(
+        repodata, '%s-primary.sqlite.%s' % (checksum, ext))
+    if ext == 'gz':
+        with gzip.open(target, 'wb') as stream:
+            stream.write(data)
+    elif ext == 'bz2':
+        with open(target, 'wb') as stream:
+            stream.write(bz2.compress(data))
+
+    with open(os.path.join(repodata, 'repomd.xml'), 'w') as stream:
+        stream.write(REPOMD % {
+            'revision': revision, 'checksum': checksum, 'ext': ext})
+
+
+class RepoServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """ HTTP server serving the repos of a directory, recording how many
+    requests it handles at the same time. """
+
+    daemon_threads = True
+
+    def __init__(self, root):
+        """ Listen on a free port of the loopback interface. """
+        self.root = root
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.requests = []
+        SocketServer.TCPServer.__init__(
+            self, ('127.0.0.1', 0), RepoRequestHandler)
+        self.url = 'http://%s:%s/%%s/' % self.server_address
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+
+class RepoRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """ Serve the files of the directory of the server. """
+
+    def translate_path(self, path):
+        """ Return the path of the file requested. """
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    def do_GET(self):
+        """ Serve the file, slowly enough for the requests to overlap. """
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            self.server.running += 1
+            self.server.max_running = max(
+                self.server.max_running, self.server.running)
+        try:
+            time.sleep(0.1)
+            SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+        finally:
+            with self.server.lock:
+                self.server.running -= 1
+
+    def log_message(self, *args):
+        """ Keep the output of the tests clean. """
+        pass
+
+
+class UpdatePackageInfotests(Modeltests):
+    """ update_package_info tests. """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(UpdatePackageInfotests, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.working_dir = tempfile.mkdtemp()
+        self.server = RepoServer(self.root)
+        self.server.thread.start()
+
+    def tearDown(self):
+        """ Remove the repos, ran after every tests. """
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.working_dir)
+        super(UpdatePackageInfotests, self).tearDown()
+
+    def test_fetch_repos(self):
+        """ Test the fetch_repos function. """
+        create_repo(self.root, 'rawhide', [
+            ('guake', 'Top down terminal', 'Guake is...', 'http://guake.org'),
+            ('geany', 'A fast IDE', 'Geany is...', 'http://geany.org'),
+        ], 'gz')
+        create_repo(self.root, 'epel7', [
+            ('fedocal', 'A calendar', 'Fedocal is...', 'http://fedocal'),
+        ], 'bz2')
+
+        repos = UPDATE_PACKAGE_INFO.fetch_repos(
+            self.server.url,
+            [('rawhide', 'rawhide'), ('el7', 'epel7'), ('el6', 'epel6')],
+            self.working_dir)
+
+        self.assertEqual(sorted(repos), ['el6', 'el7', 'rawhide'])
+        self.assertEqual(repos['el6'], None)
+        self.assertEqual(repos['rawhide']['revision'], '1')
+        self.assertEqual(repos['rawhide']['checksum'], 'rawhide1')
+        # The repos were retrieved concurrently
+        self.assertTrue(self.server.max_running > 1)
+
+        conn = sqlite3.connect(repos['rawhide']['dbfile'])
+        self.assertEqual(
+            conn.execute(
+                'SELECT name, url FROM packages ORDER BY name').fetchall(),
+            [(u'geany', u'http://geany.org'), (u'guake', u'http://guake.org')])
+        conn.close()
+
+        conn = sqlite3.connect(repos['el7']['dbfile'])
+        self.assertEqual(
+            conn.execute('SELECT name FROM packages').fetchall(),
+            [(u'fedocal',)])
+        conn.close()
+
+        # The primary_db of the repos unchanged are not downloaded again
+        self.server.requests = []
+        repos = UPDATE_PACKAGE_INFO.fetch_repos(
+            self.server.url,
+            [('rawhide', 'rawhide'), ('el7', 'epel7')],
+            self.working_dir,
+            checksums={'rawhide': 'rawhide1', 'el7': 'epel70'})
+        self.assertEqual(repos['rawhide']['dbfile'], None)
+        self.assertNotEqual(repos['el7']['dbfile'], None)
+        self.assertEqual(
+            sorted(self.server.requests),
+            [
+                '/epel7/repodata/epel71-primary.sqlite.bz2',
+                '/epel7/repodata/repomd.xml',
+                '/rawhide/repodata/repomd.xml',
+            ])
+
+    def test_sync_repo(self):
+        """ Test the sync_repo function. """
+        create_package_acl(self.session)
+        packages = [
+            ('guake', 'Top down terminal', 'Guake is...', 'http://guake.org'),
+            ('geany', 'A fast IDE', 'Geany is...', 'http://geany.org'),
+        ]
+        create_repo(self.root, 'rawhide', packages, 'gz')
+
+        def sync(full=False):
+            """ Retrieve the rawhide repo and sync pkgdb with it. """
+            checksum = pkgdb2.lib.get_repo_sync(self.session, 'rawhide')[0]
+            repo = UPDATE_PACKAGE_INFO.fetch_repo(
+                self.server.url, 'rawhide', 'rawhide', self.working_dir,
+                checksum=None if full else checksum)[1]
+            output = UPDATE_PACKAGE_INFO.sync_repo(
+                self.session, 'rawhide', repo, full=full)
+            self.session.commit()
+            return output
+
+        output = sync()
+        self.assertEqual(
+            output,
+            {
+                'found': ['geany', 'guake'],
+                'updated': ['geany', 'guake'],
+                'missing': ['fedocal'],
+            }
+        )
+        self.assertEqual(
+            pkgdb2.lib.get_repo_sync(self.session, 'rawhide')[0], 'rawhide1')
+
+        # Unchanged repo, the packages edited in pkgdb are left alone
+        package = pkgdb2.lib.search_package(self.session, 'rpms', 'guake')[0]
+        package.summary = 'Edited'
+        self.session.commit()
+        output = sync()
+        self.assertEqual(
+            output,
+            {'found': ['geany', 'guake'], 'updated': [], 'missing': ['fedocal']})
+
+        # Changed repo, only the packages changed are compared
+        packages[1] = ('geany', 'A faster IDE', 'Geany is...', None)
+        create_repo(self.root, 'rawhide', packages, 'gz', revision='2')
+        output = sync()
+        self.assertEqual(output['updated'], ['geany'])
+        self.assertEqual(
+            pkgdb2.lib.get_repo_sync(self.session, 'rawhide')[0], 'rawhide2')
+
+        # A full sync compares every package
+        output = sync(full=True)
+        self.assertEqual(output['updated'], ['guake'])
+        package = pkgdb2.lib.search_package(self.session, 'rpms', 'guake')[0]
+        self.assertEqual(package.summary, 'Top down terminal')
+
+    def test_sync_repo_dropped_from_rawhide(self):
+        """ Test that sync_repo updates the packages dropped from rawhide
+        with the metadata of the other repos, even if unchanged since. """
+        create_package_acl(self.session)
+        rawhide = [
+            ('guake', 'Top down terminal', 'Guake is...', 'http://guake.org'),
+            ('geany', 'A fast IDE', 'Geany is...', 'http://geany.org'),
+        ]
+        f25 = [
+            ('guake', 'Terminal', 'Guake is...', 'http://guake.org'),
+            ('fedocal', 'A calendar', 'Fedocal is...', 'http://fedocal'),
+        ]
+        create_repo(self.root, 'rawhide', rawhide, 'gz')
+        create_repo(self.root, 'f25', f25, 'gz')
+
+        def sync(name, names=None, download=False):
+            """ Retrieve the repo and sync pkgdb with it. """
+            checksum = pkgdb2.lib.get_repo_sync(self.session, name)[0]
+            repo = UPDATE_PACKAGE_INFO.fetch_repo(
+                self.server.url, name, name, self.working_dir,
+                checksum=None if download else checksum)[1]
+            output = UPDATE_PACKAGE_INFO.sync_repo(
+                self.session, name, repo, names=names)
+            self.session.commit()
+            return output
+
+        output = sync('rawhide')
+        self.assertEqual(output['missing'], ['fedocal'])
+        output = sync('f25', names=set(output['missing']))
+        self.assertEqual(output['updated'], ['fedocal'])
+        # guake was not synced with f25
+        self.assertEqual(
+            pkgdb2.lib.get_repo_sync(self.session, 'f25')[1]['guake'],
+            UPDATE_PACKAGE_INFO.UNSYNCED)
+
+        # The metadata of guake change in f25 while it is still in rawhide
+        f25[0] = ('guake', 'A terminal', 'Guake is...', 'http://guake.org')
+        create_repo(self.root, 'f25', f25, 'gz', revision='2')
+        output = sync('f25', names=set(['fedocal']))
+        self.assertEqual(output['updated'], [])
+
+        # guake is dropped from rawhide, f25 is unchanged but has to be
+        # downloaded again to sync guake with it
+        create_repo(self.root, 'rawhide', rawhide[1:], 'gz', revision='2')
+        output = sync('rawhide')
+        self.assertEqual(output['missing'], ['fedocal', 'guake'])
+        names = set(output['missing'])
+        self.assertEqual(sync('f25', names=names), None)
+        output = sync('f25', names=names, download=True)
+        self.assertEqual(output['updated'], ['guake'])
+        package = pkgdb2.lib.search_package(self.session, 'rpms', 'guake')[0]
+        self.assertEqual(package.summary, 'A terminal')
+
+        # Once synced, guake is left alone while f25 is unchanged
+        self.assertEqual(
+            sync('f25', names=names),
+            {'found': ['fedocal', 'guake'], 'updated': [], 'missing': []})
+
+    def test_get_repo_info(self):
+        """ Test the get_repo_info function. """
+        dbfile = os.path.join(self.working_dir, 'primary.sqlite')
+        create_primary_db(dbfile, [
+            ('guake', 'Top down terminal', 'Guake is...', 'http://guake.org'),
+            ('geany', 'A fast IDE', 'Geany is...', None),
+        ])
+
+        self.assertEqual(
+            UPDATE_PACKAGE_INFO.get_repo_info(dbfile),
+            {
+                'guake': (
+                    'Top down terminal', 'Guake is...', 'http://guake.org'),
+                'geany': ('A fast IDE', 'Geany is...', None),
+            }
+        )
+
+    def test_get_decompressor(self):
+        """ Test the get_decompressor function. """
+        self.assertEqual(
+            UPDATE_PACKAGE_INFO.get_decompressor('primary.sqlite'), None)
+        self.assertRaises(
+            ValueError,
+            UPDATE_PACKAGE_INFO.get_decompressor,
+            'primary.sqlite.zip')
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(
+        UpdatePackageInfotests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
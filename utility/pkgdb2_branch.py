@@ -99,10 +99,61 @@ def get_arguments():
     parser.add_argument(
         '--nocreate', dest='nocreate', action='store_true', default=False,
         help='Do not update rawhide nor create the new collection in the db')
+    parser.add_argument(
+        '--chunk-size', dest='chunk_size', type=int, default=None,
+        help='Number of packages branched per transaction (default: the '
+        'PKGDB2_BRANCH_CHUNK_SIZE configuration key)')
+    parser.add_argument(
+        '--dry-run', dest='dry_run', action='store_true', default=False,
+        help='Print what the branching would do without changing anything')
 
     return parser.parse_args()
 
 
+def print_progress(state):
+    ''' Print how far the branching went, how fast it goes and how long
+    it should still take.
+
+    :arg state: the dict describing the progress of the branching, as
+        given by `pkgdb2.lib.add_branch`.
+
+    '''
+    eta = 'unknown'
+    if state['eta'] is not None:
+        eta = datetime.timedelta(seconds=int(state['eta']))
+    print '  %s/%s packages, %s listings, %s ACLs - %.0f rows/s - ' \
+        'ETA: %s' % (
+            state['packages'], state['total'], state['listings'],
+            state['acls'], state['rate'], eta)
+
+
+def print_plan(new_branch, plan):
+    ''' Print what branching `master` into the new branch would do.
+
+    :arg new_branch: the name of the collection to branch into.
+    :arg plan: the dict describing the branching, as given by
+        `pkgdb2.lib.plan_branch`.
+
+    '''
+    print 'Branching master into %s would create:' % new_branch
+    for namespace in sorted(plan['namespaces']):
+        counts = plan['namespaces'][namespace]
+        print '  %-10s %8s listings %8s ACLs' % (
+            namespace, counts['listings'], counts['acls'])
+    if plan['exempted_namespaces']:
+        print 'Namespaces not branched: %s' % ', '.join(
+            plan['exempted_namespaces'])
+    if plan['collisions']:
+        print '%s packages already branched:' % len(plan['collisions'])
+        for namespace, name in plan['collisions']:
+            print '  %s/%s' % (namespace, name)
+    print '%s packages in %s chunks' % (plan['packages'], plan['chunks'])
+    estimate = 'unknown, no branching completed yet'
+    if plan['estimate'] is not None:
+        estimate = datetime.timedelta(seconds=int(plan['estimate']))
+    print 'Estimated duration: %s' % estimate
+
+
 def main():
     ''' Retrieve all the package associated to the collection `devel` and
     branch them into the specified collection.
@@ -114,6 +165,20 @@ def main():
     # Retrieve arguments
     args = get_arguments()
 
+    if args.dry_run:
+        try:
+            plan = pkgdb2.lib.plan_branch(
+                pkgdb2.SESSION,
+                clt_from='master',
+                clt_to=args.new_branch,
+                chunk_size=args.chunk_size,
+            )
+        except pkgdb2.lib.PkgdbException, err:
+            print err
+            return 1
+        print_plan(args.new_branch, plan)
+        return 0
+
     user = FakeFasUser(username=args.user, groups=args.groups)
     collection = pkgdb2.lib.search_collection(
             pkgdb2.SESSION,
@@ -184,6 +249,8 @@ def main():
             clt_from='master',
             clt_to=args.new_branch,
             user=user,
+            chunk_size=args.chunk_size,
+            progress=print_progress,
         )
     except pkgdb2.lib.PkgdbException, err:
         print err
@@ -194,7 +261,7 @@ def main():
 
     try:
         pkgdb2.SESSION.commit()
-    except SQLAlchemyError. err:
+    except SQLAlchemyError, err:
         print err
         return 1
 
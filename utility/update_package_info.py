@@ -4,6 +4,12 @@
 This script queries the summary and description information from
 yum's metadata and update the pgkdb2 database with them.
 
+The checksum of the primary_db of each repo and a hash of the metadata of
+each of its packages are kept in the database, the repos unchanged since
+the last run are not downloaded again and only the packages whose metadata
+changed are compared with the ones in pkgdb2. Use `--full` to compare
+every package.
+
 Background and history:
 https://fedorahosted.org/fedora-infrastructure/ticket/3792
 """
@@ -13,14 +19,19 @@ __requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
 import pkg_resources
 
 
-import contextlib
-import lzma
+import argparse
+import bz2
+import hashlib
+import json
 import os
 import requests
 import shutil
 import sys
-import tarfile
 import tempfile
+import zlib
+import xml.etree.ElementTree as ET
+
+from multiprocessing.pool import ThreadPool
 
 
 if 'PKGDB2_CONFIG' not in os.environ \
@@ -56,6 +67,13 @@ import pkgdb2.lib
 
 BASE_URL = pkgdb2.APP.config.get('BASE_REPO_URL')
 VERSIONS = pkgdb2.APP.config.get('REPO_MAP', [])
+WORKERS = pkgdb2.APP.config.get('REPO_FETCH_WORKERS', 4)
+# Size of the chunks downloaded and decompressed at once
+CHUNK_SIZE = 1024 * 1024
+# Namespace of the elements of repomd.xml
+REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+# Hash recorded for the packages of a repo pkgdb was not synced with
+UNSYNCED = ''
 
 
 class User(object):
@@ -64,156 +82,246 @@ class User(object):
     groups = ['sysadmin-main']
 
 
-def get_primary_db_location(base_url):
-    ''' Retrieve the latest primary_db from the rawhide repo metadata.
+def get_repomd(base_url):
+    ''' Retrieve the revision of the metadata of the repo and the location
+    and checksum of its latest primary_db, None if it has no primary_db.
     '''
     data = requests.get(base_url + 'repodata/repomd.xml')
-    primary_db = False
-    location = None
-    for row in data.text.split('\n'):
-        if 'type="primary_db"' in row.strip():
-            primary_db = True
-        if primary_db and row.strip().startswith('<location'):
-            location = row.split('"')[1]
-            break
-    return location
+    data.raise_for_status()
+    root = ET.fromstring(data.content)
+    for node in root.findall(REPO_NS + 'data'):
+        if node.get('type') != 'primary_db':
+            continue
+        return {
+            'revision': root.findtext(REPO_NS + 'revision'),
+            'location': node.find(REPO_NS + 'location').get('href'),
+            'checksum': node.findtext(REPO_NS + 'checksum'),
+        }
+    return None
+
+
+def get_decompressor(location):
+    ''' Return an object decompressing chunk by chunk the primary_db at
+    the provided location, None if it is not compressed.
+    '''
+    if location.endswith('.xz'):
+        # Only needed for the XZ archives, which most repos use
+        import lzma
+        return lzma.LZMADecompressor()
+    elif location.endswith('.gz'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif location.endswith('.bz2'):
+        return bz2.BZ2Decompressor()
+    elif location.endswith('.sqlite'):
+        return None
+    raise ValueError('Unsupported primary_db format: %s' % location)
 
 
 def download_primary_db(base_url, location, target):
-    ''' Download the provided location at the specified target. '''
+    ''' Download the provided location, decompressing it on the fly at the
+    specified target.
+    '''
+    decompressor = get_decompressor(location)
     data = requests.get(base_url + location, stream=True)
+    data.raise_for_status()
     with open(target, 'wb') as stream:
-        for chunk in data.iter_content(chunk_size=1024):
-            if chunk:
-                stream.write(chunk)
-                stream.flush()
-        stream.flush()
+        for chunk in data.iter_content(chunk_size=CHUNK_SIZE):
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            stream.write(chunk)
+        # Not all the decompressors keep data back
+        if hasattr(decompressor, 'flush'):
+            stream.write(decompressor.flush())
 
 
-def decompress_primary_db(archive, location):
-    ''' Decompress the given XZ archive at the specified location. '''
-    if archive.endswith('.xz'):
-        import lzma
-        with contextlib.closing(lzma.LZMAFile(archive)) as stream_xz:
-            data = stream_xz.read()
-        with open(location, 'wb') as stream:
-            stream.write(data)
-    elif archive.endswith('.gz'):
-        import tarfile
-        with tarfile.open(archive) as tar:
-            tar.extractall(path=location)
-    elif archive.endswith('.bz2'):
-        import bz2
-        with open(location, 'w') as out:
-            bzar = bz2.BZ2File(archive)
-            out.write(bzar.read())
-            bzar.close()
-    elif archive.endswith('.sqlite'):
-        with open(location, 'w') as out:
-            with open(archive) as inp:
-                out.write(inp.read())
-
-
-def get_pkg_info(session, pkg_name):
-    ''' Query the sqlite database for the package specified. '''
-    pkg = session.query(
-        Package
-    ).filter(
-        Package.name == pkg_name
-    ).one()
-    return pkg
+def fetch_repo(base_url, name, version, working_dir, checksum=None):
+    ''' Download and decompress the primary_db of the specified repo in the
+    working directory, unless its checksum is the one provided.
+
+    :returns: the name of the repo and the repomd information of its
+        primary_db with the path to the file downloaded as `dbfile`, None
+        if the primary_db is unchanged, or None if it could not be
+        retrieved.
+
+    '''
+    base_url = base_url % version
+    try:
+        repomd = get_repomd(base_url)
+        if not repomd:
+            print 'No primary db found at %s' % base_url
+            return name, None
+
+        repomd['dbfile'] = None
+        if checksum and repomd['checksum'] == checksum:
+            print '%s: %s unchanged' % (name, version)
+            return name, repomd
+
+        dbfile = os.path.join(working_dir, 'primary_db_%s.sqlite' % name)
+        download_primary_db(base_url, repomd['location'], dbfile)
+        repomd['dbfile'] = dbfile
+    except (requests.RequestException, IOError, ValueError,
+            ET.ParseError) as err:
+        print 'Could not retrieve the primary db of %s: %s' % (name, err)
+        return name, None
+
+    print '%s: %s retrieved' % (name, version)
+    return name, repomd
+
+
+def fetch_repos(base_url, versions, working_dir, workers=WORKERS,
+                checksums=None):
+    ''' Download and decompress concurrently the primary_db of the
+    specified repos in the working directory.
+
+    :arg base_url: the template of the URL of the repos.
+    :arg versions: the list of the (name, version) of the repos.
+    :arg working_dir: the directory in which to store the primary_db.
+    :kwarg workers: the number of repos retrieved at the same time.
+    :kwarg checksums: a dict of the checksum of the primary_db of the
+        repos last retrieved, the primary_db unchanged are not downloaded.
+    :returns: a dict of the repomd information of each repo as returned
+        by `fetch_repo`, None if it could not be retrieved.
+
+    '''
+    checksums = checksums or {}
+    pool = ThreadPool(max(min(workers, len(versions)), 1))
+    try:
+        results = pool.map(
+            lambda repo: fetch_repo(
+                base_url, repo[0], repo[1], working_dir,
+                checksum=checksums.get(repo[0])),
+            versions)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(results)
+
+
+def get_repo_info(dbfile):
+    ''' Return a dict associating the name of the packages of the
+    specified primary_db to their summary, description and URL.
+    '''
+    db_session = sessionmaker(bind=create_engine('sqlite:///%s' % dbfile))
+    session = db_session()
+    try:
+        return dict(
+            (row.name, (row.summary, row.description, row.url))
+            for row in session.query(
+                Package.name, Package.summary, Package.description,
+                Package.url)
+        )
+    finally:
+        session.close()
+
+
+def hash_info(info):
+    ''' Return the hash of the summary, description and URL of a package.
+    '''
+    return hashlib.sha1(json.dumps(list(info))).hexdigest()
+
+
+def sync_repo(session, name, repo, names=None, full=False):
+    ''' Update the packages in pkgdb with the metadata of the repo,
+    comparing only the packages whose metadata changed since the last sync
+    unless a full sync is asked for.
+
+    The hash of the metadata of a package is only recorded once pkgdb was
+    synced with it, the other packages of the repo being recorded as not
+    synced so that they are compared as soon as they are asked for, for
+    example once they are dropped from rawhide.
+
+    :arg session: the session with which to connect to the database.
+    :arg name: the name of the repo.
+    :arg repo: the repomd information of the repo returned by `fetch_repo`.
+    :kwarg names: restrict the update to the packages of these names.
+    :kwarg full: compare every package of the repo with the ones in pkgdb.
+    :returns: the output of `pkgdb2.lib.update_packages_info`, or None if
+        the repo was not downloaded while some of the packages asked for
+        were never synced with it, the repo having then to be downloaded.
+
+    '''
+    old_hashes = pkgdb2.lib.get_repo_sync(session, name)[1]
+    if repo['dbfile'] is None:
+        # Unchanged repo, its packages are known from the last sync
+        packages_info = dict.fromkeys(old_hashes)
+        hashes = None
+        changed = set()
+    else:
+        packages_info = get_repo_info(repo['dbfile'])
+        hashes = dict(
+            (pkg, hash_info(info)) for pkg, info in packages_info.items())
+        changed = set(
+            pkg for pkg in hashes if old_hashes.get(pkg) != hashes[pkg])
+
+    output = pkgdb2.lib.update_packages_info(
+        session,
+        packages_info,
+        user=User(),
+        names=names,
+        changed=None if full else changed,
+    )
+    if hashes is None:
+        if any(old_hashes[pkg] == UNSYNCED for pkg in output['found']):
+            return None
+    else:
+        found = set(output['found'])
+        for pkg in hashes:
+            if pkg not in found:
+                hashes[pkg] = UNSYNCED
+        pkgdb2.lib.save_repo_sync(
+            session, name, repo['checksum'], repo['revision'], hashes)
+    return output
+
+
+def parse_arguments():
+    ''' Set-up the argument parsing. '''
+    parser = argparse.ArgumentParser(
+        description='Update the information of the packages in pkgdb2 '
+        'from the metadata of the repos.')
+    parser.add_argument(
+        '--full', default=False, action='store_true',
+        help='Download every repo and compare every package, even if '
+        'unchanged since the last run.')
+    return parser.parse_args()
 
 
 def main():
+    args = parse_arguments()
     working_dir = tempfile.mkdtemp()
     print working_dir
 
+    checksums = {}
+    if not args.full:
+        for name, _ in VERSIONS:
+            checksums[name] = pkgdb2.lib.get_repo_sync(
+                pkgdb2.SESSION, name)[0]
+
     UNKNOWN = set()
     KNOWN = set()
     UPDATED = 0
+    repos = fetch_repos(BASE_URL, VERSIONS, working_dir, checksums=checksums)
     for name, version in VERSIONS:
         print '%s: %s' % (name, version)
-        base_url = BASE_URL % version
-
-        primary_db_location = get_primary_db_location(base_url)
-        if not primary_db_location:
-            print 'No primary db found at %s' % base_url
+        repo = repos[name]
+        if not repo:
             continue
 
-        db_ext = primary_db_location.split('primary.')[1]
-        dbfile_xz = os.path.join(working_dir, 'primary_db.%s' % db_ext)
-        download_primary_db(base_url, primary_db_location, dbfile_xz)
-
-        dbfile = os.path.join(working_dir, 'primary_db_%s.sqlite' % name)
-        decompress_primary_db(dbfile_xz, dbfile)
-
-        db_url = 'sqlite:///%s' % dbfile
-        db_session = sessionmaker(bind=create_engine(db_url))
-        session = db_session()
-
-        # Update the package in pkgdb
-        count = 0
-        if name == 'rawhide':
-            for pkg in pkgdb2.lib.search_package(
-                    pkgdb2.SESSION, 'rpms', '*', status='Approved'):
-
-                try:
-                    pkgobj = get_pkg_info(session, pkg.name)
-                except Exception, err:
-                    UNKNOWN.add(pkg.name)
-                    continue
-
-                if not pkgobj:
-                    UNKNOWN.add(pkg.name)
-                    continue
-
-                KNOWN.add(pkg.name)
-                msg = pkgdb2.lib.edit_package(
-                    session=pkgdb2.SESSION,
-                    package=pkg,
-                    pkg_summary=pkgobj.summary,
-                    pkg_description=pkgobj.description,
-                    pkg_upstream_url=pkgobj.url,
-                    user=User()
-                )
-                if msg:
-                    UPDATED += 1
-        else:
-            tmp = set()
-            for pkgname in UNKNOWN:
-                pkg = pkgdb2.lib.search_package(
-                    pkgdb2.SESSION, 'rpms', pkgname, status='Approved')
-
-                if len(pkg) == 1:
-                    pkg = pkg[0]
-                else:
-                    print pkgname, pkg
-
-                try:
-                    pkgobj = get_pkg_info(session, pkg.name)
-                except Exception, err:
-                    tmp.add(pkg.name)
-                    continue
-
-                if not pkgobj:
-                    tmp.add(pkg.name)
-                    continue
-
-                KNOWN.add(pkg.name)
-                msg = pkgdb2.lib.edit_package(
-                    session=pkgdb2.SESSION,
-                    package=pkg,
-                    pkg_summary=pkgobj.summary,
-                    pkg_description=pkgobj.description,
-                    pkg_upstream_url=pkgobj.url,
-                    user=User()
-                )
-                if msg:
-                    UPDATED += 1
-            # Add the package we didn't find here (in case)
-            UNKNOWN.update(tmp)
-            # Remove the ones we found
-            UNKNOWN.difference_update(KNOWN)
+        # Update the package in pkgdb: every approved package with the
+        # rawhide metadata, then the ones not found in rawhide with the
+        # metadata of the other repos
+        names = None if name == 'rawhide' else UNKNOWN
+        output = sync_repo(
+            pkgdb2.SESSION, name, repo, names=names, full=args.full)
+        if output is None:
+            # Some of the packages were never synced with this repo
+            repo = fetch_repo(BASE_URL, name, version, working_dir)[1]
+            if not repo:
+                continue
+            output = sync_repo(
+                pkgdb2.SESSION, name, repo, names=names, full=args.full)
+        KNOWN.update(output['found'])
+        UNKNOWN = set(output['missing'])
+        UPDATED += len(output['updated'])
 
         pkgdb2.SESSION.commit()
 
@@ -223,7 +331,6 @@ def main():
     for pkg in sorted(UNKNOWN):
         print "No such package %s found in yum's metadata." % pkg
 
-
     # Drop the temp directory
     shutil.rmtree(working_dir)
 